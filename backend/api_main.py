@@ -1,162 +1,108 @@
-import ee
-import geemap
-import requests
 import numpy as np
-import joblib
+import json
 import os
+import time
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify, stream_with_context
 import logging
 from flask_cors import CORS 
 # Load environment variables from .env file
 load_dotenv()
 
+# Local modules read their settings from the environment at import time
+import batch
+import feature_cache
+import feature_engine
+import feature_schema
+import feature_tiles
+import metrics
+import microbatch
+import model_registry
+import ndvi
+import ndvi_store
+import quota
+import recommendation
+import recommendation_tiles
+import similar_samples
+import soil_client
+import state_boundaries
+import upstream
+import weather_history
+from feature_cache import cached
+from state_defaults import regional_defaults, soil_default_values
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app, resources={r"/*": {"origins": "*"}}) 
-# Soil default values (unchanged)
-soil_default_values = {
-    "Andhra Pradesh": {"pH": 7.62, "Nitrogen": 20.0},
-    "Arunachal Pradesh": {"pH": 4.53, "Nitrogen": 29.8},
-    "Assam": {"pH": 4.81, "Nitrogen": 28.0},
-    "Bihar": {"pH": 8.25, "Nitrogen": 21.4},
-    "Chhattisgarh": {"pH": 6.30, "Nitrogen": 21.5},
-    "Goa": {"pH": 6.00, "Nitrogen": 10.5},
-    "Gujarat": {"pH": 7.67, "Nitrogen": 22.5},
-    "Haryana": {"pH": 7.75, "Nitrogen": 12.5},
-    "Himachal Pradesh": {"pH": 6.23, "Nitrogen": 23.0},
-    "Jharkhand": {"pH": 5.90, "Nitrogen": 49.0},
-    "Karnataka": {"pH": 5.49, "Nitrogen": 51.8},
-    "Kerala": {"pH": 7.00, "Nitrogen": 23.0},
-    "Maharashtra": {"pH": 5.96, "Nitrogen": 15.4},
-    "Madhya Pradesh": {"pH": 7.45, "Nitrogen": 19.5},
-    "Manipur": {"pH": 5.31, "Nitrogen": 26.7},
-    "Meghalaya": {"pH": 5.16, "Nitrogen": 25.6},
-    "Mizoram": {"pH": 5.10, "Nitrogen": 67.0},
-    "Nagaland": {"pH": 5.17, "Nitrogen": 41.0},
-    "Odisha": {"pH": 6.01, "Nitrogen": 23.0},
-    "Punjab": {"pH": 8.25, "Nitrogen": 14.5},
-    "Rajasthan": {"pH": 7.75, "Nitrogen": 23.0},
-    "Sikkim": {"pH": 4.87, "Nitrogen": 30.0},
-    "Tamil Nadu": {"pH": 7.12, "Nitrogen": 16.0},
-    "Tripura": {"pH": 5.05, "Nitrogen": 40.0},
-    "Telangana": {"pH": 6.12, "Nitrogen": 25.0},
-    "Uttar Pradesh": {"pH": 8.14, "Nitrogen": 24.4},
-    "Uttarakhand": {"pH": 5.70, "Nitrogen": 35.0},
-    "West Bengal": {"pH": 5.55, "Nitrogen": 22.0},
-    "Andaman and Nicobar Islands": {"pH": 4.05, "Nitrogen": 10.0},
-    "Chandigarh": {"pH": 7.75, "Nitrogen": 17.0},
-    "Dadra and Nagar Haveli and Daman and Diu": {"pH": 7.05, "Nitrogen": 40.0},
-    "Delhi": {"pH": 7.58, "Nitrogen": 10.0},
-    "Jammu & Kashmir": {"pH": 8.00, "Nitrogen": 19.0},
-    "Ladakh": {"pH": 8.45, "Nitrogen": 35.0},
-    "Lakshadweep": {"pH": 8.20, "Nitrogen": 18.0},
-    "Puducherry": {"pH": 7.30, "Nitrogen": 19.0}
-}
-
-# Authenticate and initialize GEE using Service Account
-try:
-    credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-
-    if credentials_path and os.path.exists(credentials_path):
-        print(f"✅ Found GEE credentials at {credentials_path}")
-
-        # Authenticate using Service Account JSON (No `gcloud` required)
-        credentials = ee.ServiceAccountCredentials(None, credentials_path)
-        ee.Initialize(credentials)
-        print("✅ Google Earth Engine Initialized Successfully!")
-    else:
-        raise Exception("❌ Earth Engine credentials file not found! Check GOOGLE_APPLICATION_CREDENTIALS.")
-except Exception as e:
-    print(f"❌ Failed to Initialize Earth Engine: {e}")
+# Routes are registered on the app built by create_app()
+api = Blueprint("api", __name__)
+# Fill model columns still missing after the state defaults from training-set medians
+IMPUTE_MEDIANS = os.getenv("FEATURE_IMPUTE_MEDIANS", "0") == "1"
 
+@cached("ndvi", key_args=("date",))
 def get_ndvi(lat, lon, date='2024-03-01'):
-    point = ee.Geometry.Point(lon, lat)
-
-    dataset = ee.ImageCollection('MODIS/061/MOD13A1') \
-        .filterBounds(point) \
-        .filterDate(ee.Date(date), ee.Date(date).advance(16, 'day')) \
-        .select('NDVI')
-
-    image_list = dataset.toList(dataset.size())
-    image_count = image_list.size().getInfo()
-
-    if image_count == 0:
-        logging.warning("No MODIS NDVI images found for this location and date range.")
-        return None
+    return ndvi.get_backend().point(lat, lon, date)
+
+# NDVI_DATE pins lookups to one composite; otherwise they read the NDVI store
+PINNED_NDVI_DATE = os.getenv("NDVI_DATE")
+
+def current_ndvi(lat, lon, date=None):
+    """NDVI of the composite starting at ``date``, or with no date the newest stored one."""
+    date = date or PINNED_NDVI_DATE
+    if date is None and ndvi_store.ENABLED:
+        return ndvi_store.current(lat, lon)
+    return get_ndvi(lat, lon, date or '2024-03-01')
+
+def prefetch_ndvi(coords, date=None):
+    """Warm NDVI for many points with one batched backend call."""
+    date = date or PINNED_NDVI_DATE
+    if date is None and ndvi_store.ENABLED:
+        ndvi_store.prefetch(coords)
+        return
+    date = date or '2024-03-01'
+    centres = list({get_ndvi.centre(lat, lon) for lat, lon in coords})
+    missing = [(lat, lon) for lat, lon in centres if get_ndvi.lookup(lat, lon, date) is None]
+    if not missing:
+        return
+    try:
+        values = ndvi.get_backend().points(missing, date)
+    except Exception as e:
+        logging.error(f"Batched NDVI prefetch failed: {e}")
+        return
+    for (lat, lon), value in zip(missing, values):
+        get_ndvi.prime(value, lat, lon, date)
 
-    image = dataset.sort('system:time_start', False).first()
-    ndvi = image.reduceRegion(
-        reducer=ee.Reducer.mean(),
-        geometry=point,
-        scale=500
-    ).get('NDVI').getInfo()
+def opencage_url(lat, lon, api_key):
+    return f"{upstream.opencage.url('/geocode/v1/json')}?q={lat}+{lon}&key={api_key}"
 
-    return ndvi / 10000 if ndvi else None
+def parse_opencage_state(data):
+    if data["status"]["code"] == 200 and "state" in data["results"][0]["components"]:
+        return data["results"][0]["components"]["state"]
+    return "State not found"
 
+@cached("state", cacheable=lambda state: state != "State not found")
 def get_state_opencage(lat, lon, api_key):
-    url = f"https://api.opencagedata.com/geocode/v1/json?q={lat}+{lon}&key={api_key}"
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if data["status"]["code"] == 200 and "state" in data["results"][0]["components"]:
-            return data["results"][0]["components"]["state"]
+        return parse_opencage_state(upstream.opencage.get_json(opencage_url(lat, lon, api_key)))
     except Exception as e:
         logging.error(f"Error fetching state from OpenCage API: {e}")
     return "State not found"
 
-def get_soil_ph(lat, lon):
-    url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}&property=phh2o&depth=0-5cm&value=mean"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if 'properties' in data and 'layers' in data['properties']:
-            layer = data['properties']['layers'][0]
-            depth = layer['depths'][0]
-            if 'values' in depth and 'mean' in depth['values'] and depth['values']['mean'] is not None:
-                return depth['values']['mean'] / 10
-    except Exception as e:
-        logging.error(f"Error fetching soil pH: {e}")
-    return None
-
-def get_soil_nitrogen(lat, lon):
-    url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}&property=nitrogen&depth=0-5cm&value=mean"
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if 'properties' in data and 'layers' in data['properties']:
-            layer = data['properties']['layers'][0]
-            depth = layer['depths'][0]
-            if 'values' in depth and 'mean' in depth['values'] and depth['values']['mean'] is not None:
-                return depth['values']['mean'] / 10
-    except Exception as e:
-        logging.error(f"Error fetching soil nitrogen: {e}")
-    return None
-
-def get_soil_features_with_fallback(lat, lon, api_key):
-    ph_value = get_soil_ph(lat, lon)
-    nitrogen_value = get_soil_nitrogen(lat, lon)
+# OpenCage is only asked about points outside the bundled state boundaries,
+# or where those may hide another state (Ladakh in Jammu & Kashmir, Daman in Gujarat)
+STATE_OPENCAGE_FALLBACK = os.getenv("STATE_OPENCAGE_FALLBACK", "1") == "1"
 
-    if ph_value is not None and nitrogen_value is not None:
-        return {"pH": ph_value, "Nitrogen": nitrogen_value}
+def wants_opencage(state_name, api_key, lat, lon):
+    if not (STATE_OPENCAGE_FALLBACK and api_key):
+        return False
+    return state_name is None or state_boundaries.ambiguous(state_name, lat, lon)
 
-    logging.info("Falling back to default state-wise soil values...")
-    state_name = get_state_opencage(lat, lon, api_key)
-
-    if state_name and state_name in soil_default_values:
-        return {
-            "pH": ph_value if ph_value is not None else soil_default_values[state_name]["pH"],
-            "Nitrogen": nitrogen_value if nitrogen_value is not None else soil_default_values[state_name]["Nitrogen"]
-        }
-
-    logging.warning("State not found in default values. Returning None.")
-    return {"pH": None, "Nitrogen": None}
+@cached("soil")
+def get_soil(lat, lon):
+    soil = soil_client.fetch_soil_properties(lat, lon)
+    if soil is None:
+        return None
+    return {"pH": soil.ph, "Nitrogen": soil.nitrogen}
 
 
 # def get_weather(lat, lon, start_date='2024-03-01', end_date='2024-03-01'):
@@ -178,157 +124,375 @@ def get_soil_features_with_fallback(lat, lon, api_key):
 #         logging.error(f"Error fetching weather data: {e}")
 #     return None
 
-def get_weather(lat, lon):
-    url = f"https://power.larc.nasa.gov/api/temporal/climatology/point?parameters=T2M,RH2M,PRECTOTCORR&community=AG&longitude={lon}&latitude={lat}&format=JSON"
+def weather_url(lat, lon):
+    return f"{upstream.nasa_power.url('/api/temporal/climatology/point')}?parameters=T2M,RH2M,PRECTOTCORR&community=AG&longitude={lon}&latitude={lat}&format=JSON"
 
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-    
-        if 'properties' in data:
+def parse_weather(data):
+    if 'properties' in data:
+        
+        return {
             
-            return {
-                
-                "temperature": data['properties']['parameter']['T2M']['ANN'],  # °C (Annual average)
-                "humidity": data['properties']['parameter']['RH2M']['ANN'],  # % (Annual average)
-                "rainfall": (data['properties']['parameter']['PRECTOTCORR']['ANN'] * 30)  # mm/day (Annual average)
-            }
+            "temperature": data['properties']['parameter']['T2M']['ANN'],  # °C (Annual average)
+            "humidity": data['properties']['parameter']['RH2M']['ANN'],  # % (Annual average)
+            "rainfall": (data['properties']['parameter']['PRECTOTCORR']['ANN'] * 30)  # mm/day (Annual average)
+        }
+    return None
+
+@cached("weather")
+def get_weather(lat, lon):
+    try:
+        return parse_weather(upstream.nasa_power.get_json(weather_url(lat, lon)))
     except Exception as e:
         logging.error(f"Error fetching weather data: {e}")
     return None
 
-def get_crop_features(lat, lon, api_key, date='2024-03-01'):
-    ndvi = get_ndvi(lat, lon, date)
-    weather = get_weather(lat, lon)
-    soil_features = get_soil_features_with_fallback(lat, lon, api_key)
-
-    return {
-        "NDVI": ndvi,
-        "Soil pH": soil_features["pH"],
-        "Soil Nitrogen": soil_features["Nitrogen"],
-        "Temperature (°C)": weather['temperature'] if weather else None,
-        "Humidity (%)": weather['humidity'] if weather else None,
-        "Rainfall (mm)": weather['rainfall'] if weather else None
+def get_tiled_features(lat, lon):
+    """Soil and weather from the offline tile set, each None unless complete."""
+    tiles = feature_tiles.get_tiles()
+    values = tiles.lookup(lat, lon) if tiles else None
+    if not values:
+        return None, None
+    soil = {"pH": values["Soil pH"], "Nitrogen": values["Soil Nitrogen"]}
+    weather = {
+        "temperature": values["Temperature (°C)"],
+        "humidity": values["Humidity (%)"],
+        "rainfall": values["Rainfall (mm)"]
     }
+    return (
+        soil if None not in soil.values() else None,
+        weather if None not in weather.values() else None
+    )
+
+def soil_is_complete(soil):
+    return soil.get("pH") is not None and soil.get("Nitrogen") is not None
+
+def build_features(ndvi_value, soil, weather, state_name=None):
+    """Assemble the FeatureRecord, filling missing soil values from state defaults."""
+    record = feature_schema.FeatureRecord.from_sources(ndvi_value, soil, weather)
+    if not soil_is_complete(soil):
+        if state_name not in soil_default_values:
+            logging.warning(f"No soil defaults for state {state_name!r}; filling what the regional defaults cover")
+        regional_defaults.fill(record.matrix(), regional_defaults.codes([state_name]))
+    return record
+
+def default_state(lat, lon, api_key, degraded):
+    """``(state, ask OpenCage)`` for a point whose soil is filled from state defaults.
+
+    The bundled boundaries answer first; OpenCage is only worth asking where
+    wants_opencage says so. Records the fallback in ``degraded`` and metrics.
+    """
+    logging.info("Falling back to default state-wise soil values...")
+    degraded.setdefault("soil", "partial")
+    metrics.FALLBACKS.inc(kind="soil_state_defaults")
+    with metrics.timed("state_lookup"):
+        state_name = state_boundaries.lookup_state(lat, lon)
+    ask = wants_opencage(state_name, api_key, lat, lon)
+    if ask:
+        metrics.FALLBACKS.inc(kind="state_opencage")
+    return state_name, ask
+
+def settle_state(state_name, gathered, degraded, lat, lon):
+    """The state to take defaults from once OpenCage's ``gathered`` answer is in."""
+    degraded.update(gathered.degraded)
+    return state_boundaries.settle(state_name, gathered.get("state"), lat, lon)
+
+def get_window_weather(lat, lon, window):
+    """Weather for a ``(start, end)`` window from the local daily history, or None."""
+    with metrics.timed("weather_history"):
+        return weather_history.get_history().window(lat, lon, *window)
+
+def gather_crop_features(lat, lon, api_key, date=None, window=None):
+    """Fetch every feature concurrently; returns (features, degraded_sources).
+
+    With a weather ``window`` the weather is that window's, from the daily
+    history, instead of the annual climatology.
+    """
+    deadline = feature_engine.deadline_from_now()
+
+    # Precomputed tiles answer without a round trip; live APIs only fill the gaps
+    with metrics.timed("tiles"):
+        tiled_soil, tiled_weather = get_tiled_features(lat, lon)
+    if window is not None:
+        tiled_weather = get_window_weather(lat, lon, window)
+    sources = {"ndvi": lambda: current_ndvi(lat, lon, date)}
+    if tiled_weather is None and window is None:
+        sources["weather"] = lambda: get_weather(lat, lon)
+    if tiled_soil is None:
+        sources["soil"] = lambda: get_soil(lat, lon)
+    gathered = feature_engine.gather(sources, deadline=deadline)
+    degraded = dict(gathered.degraded)
+    if window is not None and tiled_weather is None:
+        degraded["weather"] = "unavailable"
+
+    soil = tiled_soil or gathered.get("soil") or {}
+    state_name = None
+    if not soil_is_complete(soil):
+        state_name, ask = default_state(lat, lon, api_key, degraded)
+        if ask:
+            state = feature_engine.gather({
+                "state": lambda: get_state_opencage(lat, lon, api_key),
+            }, deadline=deadline)
+            state_name = settle_state(state_name, state, degraded, lat, lon)
+
+    features = build_features(gathered.get("ndvi"), soil, tiled_weather or gathered.get("weather"), state_name)
+    return features, sorted(degraded)
+
+def model_input(record, model):
+    """The model's input row, a view of the record, or None if a model column is missing."""
+    if IMPUTE_MEDIANS:
+        feature_schema.fill_medians(record.matrix(), model.schema)
+    return model.schema.row(record)
+
+def similar_for(record, model, k):
+    """The ``k`` labelled training samples nearest the record's model row, or None without an index."""
+    index = similar_samples.get_index(model.schema.columns)
+    if index is None:
+        return None
+    with metrics.timed("similar_samples"):
+        return index.neighbours(model.schema.select(record.matrix()), k)[0]
+
+def predict_point(lat, lon, model, date=None, window=None):
+    """Features and the full probability vector for one point, from the response cache when possible.
+
+    Raises FeaturesUnavailable when the features cannot fill a model row.
+    """
+    prediction = recommendation.lookup(lat, lon, model, date, window)
+    if prediction is not None:
+        return prediction
+
+    features, degraded = gather_crop_features(lat, lon, os.getenv("OPENCAGE_API_KEY"), date, window)
+    row = model_input(features, model)
+    if row is None:
+        raise recommendation.FeaturesUnavailable(features, degraded)
+    prediction = recommendation.Prediction(features, degraded, microbatch.predict_proba_row(model, row), model)
+    recommendation.store(lat, lon, date, prediction, window)
+    return prediction
+
+# Models load lazily from the registry, on first use or at startup when preloading
+_missing_models_logged = set()
+
+def get_model(spec=None):
+    """The requested model (default MODEL_NAME), or None if the default is not on the server.
+
+    Raises UnknownModelError for an explicitly requested model that does not exist.
+    """
+    try:
+        return model_registry.registry.get(spec)
+    except model_registry.UnknownModelError:
+        if spec:
+            raise
+        if model_registry.DEFAULT_MODEL not in _missing_models_logged:
+            print(f"❌ Warning: Model file not found. Please upload `{model_registry.DEFAULT_MODEL}.pkl` to the server.")
+            _missing_models_logged.add(model_registry.DEFAULT_MODEL)
+        return None
+
+@api.before_request
+def start_timing():
+    metrics.start_request()
 
+@api.after_request
+def add_server_timing(response):
+    timer = metrics.current_timer()
+    if timer is not None:
+        response.headers["Server-Timing"] = timer.server_timing()
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - timer.started, route=route, status=response.status_code)
+    return response
 
-# Load the LightGBM model
-model_path = "LightGBM.pkl"
-if not os.path.exists(model_path):
-    print("❌ Warning: Model file not found. Please upload `LightGBM.pkl` to the server.")
-    LightGBM = None  # Set to None to prevent errors
-else:
-    LightGBM = joblib.load(model_path)
-@app.route('/')
+@api.route('/')
 def home():
     return jsonify({"message": "API is live!"})
 
-@app.route('/get-crop-recommendation', methods=['GET'])
-def get_crop_recommendation():
+@api.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    return jsonify(feature_cache.stats())
+
+@api.route('/models', methods=['GET'])
+def list_models():
+    return jsonify({
+        "default": model_registry.DEFAULT_MODEL,
+        "available": model_registry.registry.available(),
+        "loaded": model_registry.registry.loaded(),
+        "reloads": model_registry.registry.reloads
+    })
+
+@api.route('/microbatch-stats', methods=['GET'])
+def microbatch_stats():
+    return jsonify(microbatch.stats())
+
+@api.route('/upstream-status', methods=['GET'])
+def upstream_status():
+    return jsonify(upstream.status())
+
+@api.route('/ndvi-status', methods=['GET'])
+def ndvi_status():
+    return jsonify(ndvi_store.stats())
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def recommend(shape):
+    """Shared body of the single-point routes; ``shape(prediction, k)`` builds the response."""
+    spec = request.args.get('model')
     try:
-        # Parse query parameters
-        lat = float(request.args.get('lat'))
-        lon = float(request.args.get('lon'))
-
-        # Log the request
+        lat, lon, k = recommendation.parse_query(request.args)
+        window = weather_history.parse_window(request.args)
+        similar = similar_samples.parse_similar(request.args)
         logging.info(f"Received request: lat={lat}, lon={lon}")
 
-        # Fetch crop features
-        api_key = os.getenv("OPENCAGE_API_KEY")
-        features = get_crop_features(lat, lon, api_key)
-
-        if not features:
-            return jsonify({"error": "Failed to fetch crop features"}), 500
-
-        # Prepare input for the model
-        received_values = [value for key, value in features.items() if key != 'NDVI']
-        received_array = np.array(received_values).reshape(1, -1)
-
-        # Predict the crop
-        
-        if LightGBM is None:
+        model = get_model(spec)
+        if model is None:
             return jsonify({"error": "Model file not found. Cannot make predictions."}), 500
 
-        
-        prediction = LightGBM.predict(received_array)[0]
-
-        # Add prediction to the response
-        features["Recommended Crop"] = prediction
-
-        # Log the response
-        logging.info(f"Returning response: {features}")
-
-        return jsonify(features)
-
-    except ValueError:
-        logging.error("Invalid latitude or longitude provided.")
-        return jsonify({"error": "Invalid latitude or longitude"}), 400
+        prediction = predict_point(lat, lon, model, window=window)
+        body = shape(prediction, k)
+        if window is not None:
+            body["Weather Window"] = {"start": str(window[0]), "end": str(window[1])}
+        if similar:
+            body["Similar Samples"] = similar_for(prediction.features, model, similar)
+
+    except recommendation.FeaturesUnavailable as e:
+        return jsonify({**e.features.as_dict(), "Degraded Sources": e.degraded, "error": "Failed to fetch crop features"}), 503
+    except model_registry.UnknownModelError:
+        logging.error(f"Unknown model requested: {spec}")
+        return jsonify({"error": f"Unknown model: {spec}"}), 404
+    except ValueError as e:
+        logging.error(f"Invalid request: {e}")
+        return jsonify({"error": str(e)}), 400
     except FileNotFoundError:
         logging.error("Model file not found.")
         return jsonify({"error": "Model file not found"}), 500
-    except Exception as e:
-        logging.error(f"Error processing request: {e}")
+    except Exception:
+        logging.exception("Unexpected error while predicting crops")
         return jsonify({"error": "Internal Server Error"}), 500
-@app.route('/get-top-3-crops', methods=['GET'])
-def get_top_3_crops():
-    try:
-        lat = float(request.args.get('lat'))
-        lon = float(request.args.get('lon'))
-
-        logging.info(f"Received request for top 3 crops: lat={lat}, lon={lon}")
-
-        # Get features
-        api_key = os.getenv("OPENCAGE_API_KEY")
-        features = get_crop_features(lat, lon, api_key)
 
-        if not features:
-            return jsonify({"error": "Failed to fetch crop features"}), 500
+    logging.info(f"Returning response: {body}")
+    response = jsonify(body)
+    if prediction.complete:
+        response.set_etag(recommendation.etag(body))
+        # Clients may keep the body but revalidate each time, so a new model shows up at once
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
 
-        # Prepare model input (excluding NDVI)
-        input_values = [value for key, value in features.items() if key != 'NDVI']
-        input_array = np.array(input_values).reshape(1, -1)
-
-        # Load model
-        if LightGBM is None:
-            return jsonify({"error": "Model file not found. Cannot make predictions."}), 500
+@api.route('/get-crop-recommendation', methods=['GET'])
+def get_crop_recommendation():
+    return recommend(recommendation.recommendation_result)
 
-        # Predict probabilities
-        probabilities = LightGBM.predict_proba(input_array)[0]
-        classes = LightGBM.classes_
-
-        # Sort and extract top 3
-        sorted_indices = np.argsort(probabilities)[::-1]
-        top_3_indices = sorted_indices[:3]
-        top_3_crops = [classes[i] for i in top_3_indices]
-        top_3_probs = [float(probabilities[i]) for i in top_3_indices]
-
-        # Return response
-        result = {
-            "NDVI": features.get("NDVI"),
-            "Soil pH": features.get("Soil pH"),
-            "Soil Nitrogen": features.get("Soil Nitrogen"),
-            "Temperature (°C)": features.get("Temperature (°C)"),
-            "Humidity (%)": features.get("Humidity (%)"),
-            "Rainfall (mm)": features.get("Rainfall (mm)"),
-            "Top 3 Crops": [
-                {"crop": top_3_crops[i], "probability": round(top_3_probs[i], 4)}
-                for i in range(3)
-            ]
-        }
+@api.route('/get-top-3-crops', methods=['GET'])
+def get_top_3_crops():
+    return recommend(recommendation.top_k_result)
 
-        logging.info(f"Returning Top 3 Crop Recommendations: {result['Top 3 Crops']}")
-        return jsonify(result)
+@api.route('/batch/top-crops', methods=['POST'])
+def batch_top_crops():
+    try:
+        points = batch.parse_points(request.get_data(), request.content_type)
+        k = int(request.args.get('k', 3))
+        if k < 1:
+            raise ValueError("k must be positive")
+        window = weather_history.parse_window(request.args)
+        similar = similar_samples.parse_similar(request.args)
+    except (batch.BatchError, ValueError) as e:
+        logging.error(f"Invalid batch request: {e}")
+        return jsonify({"error": str(e)}), 400
 
-    except ValueError:
-        logging.error("Invalid latitude or longitude provided.")
-        return jsonify({"error": "Invalid latitude or longitude"}), 400
-    except FileNotFoundError:
-        logging.error("Model file not found.")
-        return jsonify({"error": "Model file not found"}), 500
-    except Exception as e:
-        logging.exception("Unexpected error while predicting top 3 crops")
-        return jsonify({"error": "Internal Server Error"}), 500
+    try:
+        model = get_model(request.args.get('model'))
+    except model_registry.UnknownModelError:
+        return jsonify({"error": f"Unknown model: {request.args.get('model')}"}), 404
+    if model is None:
+        return jsonify({"error": "Model file not found. Cannot make predictions."}), 500
+
+    logging.info(f"Received batch request for {len(points)} points")
+    metrics.BATCH_POINTS.observe(len(points))
+    api_key = os.getenv("OPENCAGE_API_KEY")
+    index = similar_samples.get_index(model.schema.columns) if similar else None
+
+    def gather_bulk(lat, lon):
+        # Batch lookups yield upstream quota to interactive requests
+        with quota.lane(quota.BULK):
+            return gather_crop_features(lat, lon, api_key, window=window)
+
+    def generate():
+        prefetch_ndvi(batch.valid_coords(points))
+        results = batch.score_points(
+            points,
+            gather_bulk,
+            lambda record: model_input(record, model),
+            model,
+            k=k,
+            neighbours=(lambda inputs: index.neighbours(inputs, similar)) if index is not None else None,
+        )
+        for result in results:
+            result["Model"] = model.id
+            yield json.dumps(result, default=str) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+@api.route('/weather-history', methods=['GET'])
+def weather_history_meta():
+    history = weather_history.get_history()
+    if history is None:
+        return jsonify({"error": "Weather history is not configured"}), 404
+    return jsonify(history.describe())
+
+@api.route('/tiles/meta', methods=['GET'])
+def recommendation_tiles_meta():
+    grid = recommendation_tiles.get_grid()
+    if grid is None:
+        return jsonify({"error": "Recommendation tiles are not configured"}), 404
+    return jsonify(grid.describe())
+
+@api.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'])
+@api.route('/tiles/<int:z>/<int:x>/<int:y>.<fmt>', methods=['GET'])
+def recommendation_tile(z, x, y, fmt="json"):
+    grid = recommendation_tiles.get_grid()
+    if grid is None:
+        return jsonify({"error": "Recommendation tiles are not configured"}), 404
+    if fmt not in ("json", "png"):
+        return jsonify({"error": f"Unsupported tile format: {fmt}"}), 400
+    if not recommendation_tiles.valid_tile(z, x, y):
+        return jsonify({"error": f"Invalid tile {z}/{x}/{y}"}), 400
+
+    with metrics.timed("tile_render"):
+        body = grid.render(z, x, y, fmt)
+    response = Response(body, mimetype="image/png" if fmt == "png" else "application/json")
+    # Tiles only change when the grid is rebuilt, and the ETag changes with it
+    response.cache_control.public = True
+    response.cache_control.max_age = recommendation_tiles.MAX_AGE
+    response.set_etag(f"{grid.version}-{z}-{x}-{y}-{fmt}")
+    response.last_modified = grid.meta.get("built_at")
+    return response.make_conditional(request)
+
+
+def create_app(preload=None):
+    """Build the Flask app.
+
+    Heavy dependencies (model, Earth Engine, feature tiles, state boundaries,
+    recommendation tiles, weather history, similar-samples index) load on
+    first use. With ``preload`` (default:
+    PRELOAD_MODEL=1) the model, tiles and state index load now,
+    which under gunicorn's preload_app happens once in the master so forked
+    workers share the pages copy-on-write.
+    """
+    app = Flask(__name__)
+    CORS(app, resources={r"/*": {"origins": "*"}}) 
+    app.register_blueprint(api)
+
+    if preload is None:
+        preload = os.getenv("PRELOAD_MODEL", "0") == "1"
+    if preload:
+        model = get_model()
+        if model is not None:
+            similar_samples.get_index(model.schema.columns)
+        feature_tiles.get_tiles()
+        state_boundaries.check_coverage(soil_default_values)
+        recommendation_tiles.get_grid()
+        weather_history.get_history()
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":  
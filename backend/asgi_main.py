@@ -0,0 +1,220 @@
+"""ASGI entry point serving the recommendation routes on an event loop.
+
+    gunicorn asgi_main:app -k uvicorn.workers.UvicornWorker -w 2
+
+The sync deployment (``gunicorn api_main:app``) blocks a whole worker process
+for every in-flight request while it waits on SoilGrids, NASA POWER, OpenCage
+and Earth Engine. Here those waits are awaited instead, so one process holds
+hundreds of requests in flight and shares a single copy of the model. The
+HTTP upstreams use the async twins of the shared upstream clients (same
+breakers, retries and feature cache). Earth Engine only has a blocking client,
+so NDVI lookups run on the default thread pool.
+
+Every other route (stats, /models, /batch/top-crops) is served by the Flask
+app mounted underneath.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route
+
+import api_main
+import feature_engine
+import metrics
+import microbatch
+import model_registry
+import recommendation
+import similar_samples
+import soil_client
+import upstream
+import weather_history
+from api_main import build_features, default_state, get_model, model_input, settle_state, similar_for, soil_is_complete
+from feature_cache import cached
+
+CORS_HEADERS = {"Access-Control-Allow-Origin": "*"}
+# Threads for the blocking calls left on this path (Earth Engine NDVI)
+BLOCKING_THREADS = int(os.getenv("ASGI_BLOCKING_THREADS", "64"))
+
+
+@cached("weather")
+async def get_weather_async(lat, lon):
+    try:
+        return api_main.parse_weather(await upstream.nasa_power.aget_json(api_main.weather_url(lat, lon)))
+    except Exception as e:
+        logging.error(f"Error fetching weather data: {e}")
+    return None
+
+
+@cached("soil")
+async def get_soil_async(lat, lon):
+    soil = await soil_client.fetch_soil_properties_async(lat, lon)
+    if soil is None:
+        return None
+    return {"pH": soil.ph, "Nitrogen": soil.nitrogen}
+
+
+@cached("state", cacheable=lambda state: state != "State not found")
+async def get_state_opencage_async(lat, lon, api_key):
+    try:
+        data = await upstream.opencage.aget_json(api_main.opencage_url(lat, lon, api_key))
+        return api_main.parse_opencage_state(data)
+    except Exception as e:
+        logging.error(f"Error fetching state from OpenCage API: {e}")
+    return "State not found"
+
+
+async def gather_crop_features_async(lat, lon, api_key, date=None, window=None):
+    """Async twin of api_main.gather_crop_features; returns (features, degraded_sources)."""
+    deadline = feature_engine.deadline_from_now()
+
+    with metrics.timed("tiles"):
+        tiled_soil, tiled_weather = api_main.get_tiled_features(lat, lon)
+    if window is not None:
+        # A local memory-mapped read, cheap enough to stay on the loop
+        tiled_weather = api_main.get_window_weather(lat, lon, window)
+    sources = {"ndvi": lambda: asyncio.to_thread(api_main.current_ndvi, lat, lon, date)}
+    if tiled_weather is None and window is None:
+        sources["weather"] = lambda: get_weather_async(lat, lon)
+    if tiled_soil is None:
+        sources["soil"] = lambda: get_soil_async(lat, lon)
+    gathered = await feature_engine.gather_async(sources, deadline=deadline)
+    degraded = dict(gathered.degraded)
+    if window is not None and tiled_weather is None:
+        degraded["weather"] = "unavailable"
+
+    soil = tiled_soil or gathered.get("soil") or {}
+    state_name = None
+    if not soil_is_complete(soil):
+        state_name, ask = default_state(lat, lon, api_key, degraded)
+        if ask:
+            state = await feature_engine.gather_async({
+                "state": lambda: get_state_opencage_async(lat, lon, api_key),
+            }, deadline=deadline)
+            state_name = settle_state(state_name, state, degraded, lat, lon)
+
+    features = build_features(gathered.get("ndvi"), soil, tiled_weather or gathered.get("weather"), state_name)
+    return features, sorted(degraded)
+
+
+def json_response(body, status_code=200):
+    return JSONResponse(body, status_code=status_code, headers=CORS_HEADERS)
+
+
+async def predict_point_async(lat, lon, model, date=None, window=None):
+    """Async twin of api_main.predict_point."""
+    prediction = await recommendation.lookup_async(lat, lon, model, date, window)
+    if prediction is not None:
+        return prediction
+
+    features, degraded = await gather_crop_features_async(lat, lon, os.getenv("OPENCAGE_API_KEY"), date, window)
+    row = model_input(features, model)
+    if row is None:
+        raise recommendation.FeaturesUnavailable(features, degraded)
+    probabilities = await microbatch.predict_proba_row_async(model, row)
+    prediction = recommendation.Prediction(features, degraded, probabilities, model)
+    await recommendation.store_async(lat, lon, date, prediction, window)
+    return prediction
+
+
+def tagged_response(request, body, prediction):
+    """JSON response with an ETag for complete predictions, or a 304 when the client's copy matches."""
+    headers = dict(CORS_HEADERS)
+    if prediction.complete:
+        tag = recommendation.etag(body)
+        headers["ETag"] = f'"{tag}"'
+        headers["Cache-Control"] = "no-cache"
+        if recommendation.etag_matches(request.headers.get("if-none-match"), tag):
+            return Response(status_code=304, headers=headers)
+    return JSONResponse(body, headers=headers)
+
+
+async def predict(request, shape):
+    """Shared body of the two recommendation routes, timed like the Flask ones."""
+    timer = metrics.start_request()
+    response = await _predict(request, shape)
+    response.headers["Server-Timing"] = timer.server_timing()
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - timer.started,
+                                    route=request.url.path, status=response.status_code)
+    return response
+
+
+async def _predict(request, shape):
+    spec = request.query_params.get('model')
+    try:
+        lat, lon, k = recommendation.parse_query(request.query_params)
+        window = weather_history.parse_window(request.query_params)
+        similar = similar_samples.parse_similar(request.query_params)
+        logging.info(f"Received request: lat={lat}, lon={lon}")
+
+        model = get_model(spec)
+        if model is None:
+            return json_response({"error": "Model file not found. Cannot make predictions."}, 500)
+
+        prediction = await predict_point_async(lat, lon, model, window=window)
+        body = shape(prediction, k)
+        if window is not None:
+            body["Weather Window"] = {"start": str(window[0]), "end": str(window[1])}
+        if similar:
+            body["Similar Samples"] = similar_for(prediction.features, model, similar)
+        return tagged_response(request, body, prediction)
+
+    except recommendation.FeaturesUnavailable as e:
+        return json_response({**e.features.as_dict(), "Degraded Sources": e.degraded, "error": "Failed to fetch crop features"}, 503)
+    except model_registry.UnknownModelError:
+        logging.error(f"Unknown model requested: {spec}")
+        return json_response({"error": f"Unknown model: {spec}"}, 404)
+    except ValueError as e:
+        logging.error(f"Invalid request: {e}")
+        return json_response({"error": str(e)}, 400)
+    except Exception:
+        logging.exception("Unexpected error while predicting crops")
+        return json_response({"error": "Internal Server Error"}, 500)
+
+
+async def home(request):
+    return json_response({"message": "API is live!"})
+
+
+async def get_crop_recommendation(request):
+    return await predict(request, recommendation.recommendation_result)
+
+
+async def get_top_3_crops(request):
+    return await predict(request, recommendation.top_k_result)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # asyncio's default pool is sized for CPU work, not for many slow Earth Engine calls
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=BLOCKING_THREADS, thread_name_prefix="blocking")
+    )
+    yield
+
+
+def create_app():
+    flask_app = api_main.app
+    return Starlette(lifespan=lifespan, routes=[
+        Route('/', home),
+        Route('/get-crop-recommendation', get_crop_recommendation),
+        Route('/get-top-3-crops', get_top_3_crops),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ])
+
+
+app = create_app()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    port = int(os.getenv("PORT", "10000"))
+    print(f"✅ Starting ASGI server on port {port}...")
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,195 @@
+"""Batch scoring of many coordinates for the /batch/top-crops endpoint.
+
+Points are de-duplicated by feature grid cell, features for each distinct cell
+are gathered with bounded concurrency, and completed cells are scored in
+chunks with a single vectorized ``predict_proba`` per chunk so results can be
+streamed back while slower cells are still being fetched. A chunk is scored
+once it is full or its first cell has waited FLUSH_SECONDS, so a small batch
+still streams instead of arriving all at the end.
+"""
+import json
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+import feature_cache
+import metrics
+
+MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", "10000"))
+# Cells fetched at once; each one fans out to the feature engine pool, so keep
+# this times the number of sources within FEATURE_BULK_POOL_WORKERS.
+CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Completed cells scored per predict_proba call
+PREDICT_CHUNK = int(os.getenv("BATCH_PREDICT_CHUNK", "256"))
+# Longest a completed cell waits for its chunk to fill before it is scored anyway
+FLUSH_SECONDS = float(os.getenv("BATCH_FLUSH_MS", "200")) / 1000
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_points(body, content_type):
+    """Read points from a JSON list, ``{"points": [...]}`` or NDJSON lines."""
+    text = body.decode("utf-8") if isinstance(body, bytes) else body
+    try:
+        if "ndjson" in (content_type or "") or "jsonlines" in (content_type or ""):
+            points = [json.loads(line) for line in text.splitlines() if line.strip()]
+        else:
+            data = json.loads(text)
+            points = data.get("points") if isinstance(data, dict) else data
+    except json.JSONDecodeError as e:
+        raise BatchError(f"Invalid JSON: {e}")
+
+    if not isinstance(points, list) or not points:
+        raise BatchError("Expected a non-empty list of points")
+    if len(points) > MAX_POINTS:
+        raise BatchError(f"Too many points: {len(points)} > {MAX_POINTS}")
+    return points
+
+
+def parse_coords(lat, lon):
+    """``(lat, lon)`` as floats on the globe; ValueError for anything else (NaN, inf, out of range)."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Invalid latitude or longitude")
+    if not (math.isfinite(lat) and math.isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180):
+        raise ValueError("Invalid latitude or longitude")
+    return lat, lon
+
+
+def point_coords(point):
+    """``parse_coords`` for a batch point; ValueError when it is not an object with lat and lon."""
+    try:
+        return parse_coords(point["lat"], point["lon"])
+    except (TypeError, KeyError):
+        raise ValueError("Invalid latitude or longitude")
+
+
+def valid_coords(points):
+    coords = []
+    for point in points:
+        try:
+            coords.append(point_coords(point))
+        except ValueError:
+            continue
+    return coords
+
+
+def group_by_cell(points):
+    """Map each distinct feature cell to the indices of the points inside it.
+
+    Returns ``(cells, errors)`` where ``cells`` is ``{key: (lat, lon, [index, ...])}``
+    and ``errors`` is ``{index: message}`` for unusable points.
+    """
+    cells = {}
+    errors = {}
+    for index, point in enumerate(points):
+        try:
+            lat, lon = point_coords(point)
+            key = feature_cache.finest_cell(lat, lon)
+        except ValueError as e:
+            errors[index] = str(e)
+            continue
+        if key not in cells:
+            cells[key] = (lat, lon, [])
+        cells[key][2].append(index)
+    return cells, errors
+
+
+def top_k_indices(probabilities, k):
+    """``(indices, probabilities)`` of the ``k`` most likely classes per row, best first."""
+    k = min(k, probabilities.shape[1])
+    # argpartition is O(n) per row; only the k survivors get sorted
+    top = np.argpartition(-probabilities, k - 1, axis=1)[:, :k]
+    top_probs = np.take_along_axis(probabilities, top, axis=1)
+    order = np.argsort(-top_probs, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_probs, order, axis=1)
+
+
+def top_k(probabilities, classes, k):
+    """Top ``k`` (class, probability) pairs for every row of a probability matrix."""
+    top, top_probs = top_k_indices(probabilities, k)
+    return [
+        [{"crop": str(classes[i]), "probability": round(float(p), 4)} for i, p in zip(row, row_probs)]
+        for row, row_probs in zip(top, top_probs)
+    ]
+
+
+def score_points(points, gather, to_input, model, k=3, concurrency=CONCURRENCY, chunk=PREDICT_CHUNK,
+                 neighbours=None, flush_seconds=FLUSH_SECONDS):
+    """Yield one result dict per input point, in completion order.
+
+    ``gather(lat, lon)`` returns ``(FeatureRecord, degraded)`` and
+    ``to_input(record)`` returns a 1-row model input or ``None`` when a model
+    column is missing. Complete records are stacked and go to the model
+    through its schema, the same path as a single request. With
+    ``neighbours(inputs)``, each result also gets its row of that call's
+    output as "Similar Samples", one call per chunk.
+    """
+    cells, errors = group_by_cell(points)
+    for index, message in errors.items():
+        yield {"index": index, "id": _point_id(points[index]), "error": message}
+
+    def emit(cell, body):
+        for index in cell[2]:
+            point = points[index]
+            yield {"index": index, "id": _point_id(point), "lat": point["lat"], "lon": point["lon"], **body}
+
+    def flush(ready):
+        matrix = np.vstack([record.values for _, record, _ in ready])
+        inputs = model.schema.select(matrix)
+        with metrics.timed("batch_inference"):
+            probabilities = model.predict_proba(inputs)
+        rankings = top_k(probabilities, model.classes_, k)
+        similar = [None] * len(ready)
+        if neighbours is not None:
+            with metrics.timed("similar_samples"):
+                similar = neighbours(inputs)
+        for (cell, record, degraded), ranking, samples in zip(ready, rankings, similar):
+            body = {**record.as_dict(), "Top Crops": ranking, "Degraded Sources": degraded}
+            if samples is not None:
+                body["Similar Samples"] = samples
+            yield from emit(cell, body)
+
+    ready = []
+    oldest = None
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="batch") as pool:
+        futures = {pool.submit(gather, lat, lon): (lat, lon, indices) for lat, lon, indices in cells.values()}
+        pending = set(futures)
+        while pending:
+            timeout = None if not ready else max(0.0, oldest + flush_seconds - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                cell = futures[future]
+                try:
+                    record, degraded = future.result()
+                except Exception:
+                    yield from emit(cell, {"error": "Failed to fetch crop features"})
+                    continue
+
+                if to_input(record) is None:
+                    yield from emit(cell, {**record.as_dict(), "Degraded Sources": degraded, "error": "Failed to fetch crop features"})
+                    continue
+
+                if not ready:
+                    oldest = time.monotonic()
+                ready.append((cell, record, degraded))
+                if len(ready) >= chunk:
+                    yield from flush(ready)
+                    ready = []
+
+            if ready and time.monotonic() - oldest >= flush_seconds:
+                yield from flush(ready)
+                ready = []
+
+    if ready:
+        yield from flush(ready)
+
+
+def _point_id(point):
+    return point.get("id") if isinstance(point, dict) else None
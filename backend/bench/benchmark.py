@@ -0,0 +1,191 @@
+"""Offline benchmark of the single, top-3 and batch endpoints.
+
+    python bench/benchmark.py --concurrency 1 8 32 --duration 10 --out bench.json
+    python bench/benchmark.py --baseline bench.json          # exit 1 on regression
+
+Starts bench/fake_upstreams.py in-process and a gunicorn deployment (sync
+workers, or ``--server asgi`` for the uvicorn workers) pointed at it. The
+deployment uses the stub NDVI backend and the caches are off, so every
+request exercises the full upstream path without network access or
+credentials. Each endpoint is driven closed-loop at each concurrency level.
+Throughput and p50/p95/p99 latency go to stdout and ``--out`` as JSON.
+
+With ``--baseline`` the run is compared against an earlier report. A cell
+whose p95 rises, or whose throughput falls, by more than ``--tolerance`` is
+listed as a regression, and the process exits non-zero.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+
+import fake_upstreams
+import loadtest
+
+ENDPOINTS = {
+    "single": ("GET", "/get-crop-recommendation"),
+    "top3": ("GET", "/get-top-3-crops"),
+    "batch": ("POST", "/batch/top-crops"),
+}
+
+
+def batch_body(size):
+    points = loadtest.SAMPLE_POINTS
+
+    def body(i):
+        start = (i * size) % len(points)
+        chosen = [points[(start + j) % len(points)] for j in range(size)]
+        return json.dumps([{"id": j, "lat": lat, "lon": lon} for j, (lat, lon) in enumerate(chosen)])
+
+    return body
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=loadtest.BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def server_env(args, upstream_env, workdir):
+    env = dict(os.environ)
+    env.update(upstream_env)
+    env.update({
+        "NDVI_BACKEND": "stub",
+        "NDVI_STUB_LATENCY": str(args.ndvi_latency),
+        "NDVI_STUB_ERROR_RATE": str(args.ndvi_error_rate),
+        "OPENCAGE_API_KEY": env.get("OPENCAGE_API_KEY", "benchmark"),
+    })
+    if args.cache:
+        env["FEATURE_CACHE_PATH"] = os.path.join(workdir, "feature_cache.sqlite3")
+        env["NDVI_STORE_PATH"] = os.path.join(workdir, "ndvi_store.sqlite3")
+    else:
+        env["FEATURE_CACHE"] = "0"
+        env["NDVI_STORE"] = "0"
+    # The fake upstreams have no rate limit to protect
+    env["UPSTREAM_QUOTA"] = "0"
+    if not args.tiles:
+        env.pop("FEATURE_TILES", None)
+    env.setdefault("MODEL_NAME", "NaiveBayes")
+    return env
+
+
+def compare(report, baseline, tolerance):
+    """Regressions of ``report`` against ``baseline``, as readable strings."""
+    previous = {(r["endpoint"], r["concurrency"]): r for r in baseline["results"]}
+    regressions = []
+    for result in report["results"]:
+        before = previous.get((result["endpoint"], result["concurrency"]))
+        if before is None or not before["requests"] or not result["requests"]:
+            continue
+        label = f"{result['endpoint']} @ {result['concurrency']}"
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95_before and p95 > p95_before * (1 + tolerance):
+            regressions.append(f"{label}: p95 {p95_before:.1f} ms -> {p95:.1f} ms")
+        rps, rps_before = result["throughput_rps"], before["throughput_rps"]
+        if rps_before and rps < rps_before * (1 - tolerance):
+            regressions.append(f"{label}: throughput {rps_before:.1f} -> {rps:.1f} rps")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the API against local fake upstreams.")
+    parser.add_argument("--server", choices=("sync", "asgi"), default="sync")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--endpoints", nargs="+", choices=sorted(ENDPOINTS), default=["single", "top3", "batch"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=float, default=3.0,
+                        help="Unmeasured seconds per endpoint, so every worker has loaded the model")
+    parser.add_argument("--batch-size", type=int, default=50, help="Points per batch request")
+    parser.add_argument("--upstream-latency", type=float, default=0.15)
+    parser.add_argument("--upstream-jitter", type=float, default=0.05)
+    parser.add_argument("--upstream-error-rate", type=float, default=0.0)
+    parser.add_argument("--set", action="append", default=[], metavar="SERVICE.OPTION=VALUE",
+                        help="Per-service fake upstream setting, as in fake_upstreams.py")
+    parser.add_argument("--recordings", help="Replay recorded upstream responses from this directory")
+    parser.add_argument("--ndvi-latency", type=float, default=0.2)
+    parser.add_argument("--ndvi-error-rate", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="Keep the feature cache on")
+    parser.add_argument("--tiles", action="store_true", help="Keep FEATURE_TILES from the environment")
+    parser.add_argument("--out", help="Write the JSON report here as well as stdout")
+    parser.add_argument("--baseline", help="Earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    try:
+        overrides = fake_upstreams.parse_overrides(args.set)
+    except ValueError as e:
+        parser.error(str(e))
+    upstream_server, fakes, upstream_env = fake_upstreams.start(
+        latency=args.upstream_latency, jitter=args.upstream_jitter, error_rate=args.upstream_error_rate,
+        recordings=args.recordings, overrides=overrides,
+    )
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "server": args.server,
+            "workers": args.workers,
+            "duration_s": args.duration,
+            "warmup_s": args.warmup,
+            "batch_size": args.batch_size,
+            "ndvi_latency_s": args.ndvi_latency,
+            "cache": args.cache,
+            "upstreams": fakes.config,
+        },
+        "results": [],
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        process, base_url = loadtest.start_server(args.server, args.workers, server_env(args, upstream_env, workdir))
+        try:
+            for endpoint in args.endpoints:
+                method, path = ENDPOINTS[endpoint]
+                body_fn = batch_body(args.batch_size) if endpoint == "batch" else None
+                headers = {"Content-Type": "application/json"} if endpoint == "batch" else None
+                if args.warmup:
+                    loadtest.run_level(base_url, path, 2 * args.workers, args.warmup,
+                                       method=method, body_fn=body_fn, headers=headers)
+                for concurrency in args.concurrency:
+                    result = loadtest.run_level(base_url, path, concurrency, args.duration,
+                                                method=method, body_fn=body_fn, headers=headers)
+                    report["results"].append({"endpoint": endpoint, **result})
+                    print(f"{endpoint:>6} c={concurrency:<4} {result['throughput_rps']:8.1f} rps  "
+                          f"p50 {result['latency_ms']['p50'] or 0:8.1f}  p95 {result['latency_ms']['p95'] or 0:8.1f}  "
+                          f"p99 {result['latency_ms']['p99'] or 0:8.1f} ms  errors {result['errors']}",
+                          file=sys.stderr)
+        finally:
+            process.terminate()
+            process.wait()
+            upstream_server.shutdown()
+    report["meta"]["upstream_calls"] = fakes.stats()["calls"]
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"❌ Regression: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print("✅ No regressions against the baseline", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
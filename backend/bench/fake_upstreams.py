@@ -0,0 +1,315 @@
+"""Local stand-ins for SoilGrids, NASA POWER and OpenCage.
+
+One HTTP server answers all three under their own path prefix. Point the
+service at it with:
+
+    SOILGRIDS_BASE_URL=http://127.0.0.1:8900/soilgrids
+    NASA_POWER_BASE_URL=http://127.0.0.1:8900/nasa_power
+    OPENCAGE_BASE_URL=http://127.0.0.1:8900/opencage
+
+and run ``python bench/fake_upstreams.py --port 8900``.
+
+Responses come from recordings when there are any: ``--recordings DIR``
+replays ``DIR/<service>.jsonl``, answering each query with the recording
+nearest to its coordinates. ``--record DIR`` instead proxies every request to
+the real provider and appends what it returns, so a session against the live
+APIs can be replayed offline later. A service with no recordings gets a
+deterministic synthetic response in the provider's schema. OpenCage states
+come from the bundled state boundaries.
+
+Each service has a latency (plus uniform jitter) and an error rate, set with
+``--latency``/``--jitter``/``--error-rate`` or per service, e.g.
+``--set soilgrids.latency=0.8 --set opencage.error_rate=0.2``. Failed calls
+return HTTP 503, which the upstream clients retry like a real outage.
+"""
+import argparse
+import datetime
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+SERVICES = ("soilgrids", "nasa_power", "opencage")
+REAL_BASE_URLS = {
+    "soilgrids": "https://rest.isric.org/soilgrids/v2.0",
+    "nasa_power": "https://power.larc.nasa.gov",
+    "opencage": "https://api.opencagedata.com",
+}
+DEPTH_RANGES = {"0-5cm": (0, 5), "5-15cm": (5, 15), "15-30cm": (15, 30), "30-60cm": (30, 60)}
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+
+def wave(lat, lon, a, b):
+    """Smooth deterministic field in [-1, 1], so nearby points get similar values."""
+    return math.sin(math.radians(lat * a)) * math.cos(math.radians(lon * b))
+
+
+def query_coords(service, query):
+    if service == "opencage":
+        lat, lon = query["q"][0].replace("+", " ").split()
+        return float(lat), float(lon)
+    if service == "nasa_power":
+        return float(query["latitude"][0]), float(query["longitude"][0])
+    return float(query["lat"][0]), float(query["lon"][0])
+
+
+def synthetic_soilgrids(lat, lon, query):
+    raw = {
+        "phh2o": 65 + 15 * wave(lat, lon, 13, 9),
+        "nitrogen": 150 + 100 * wave(lat, lon, 7, 17),
+        "soc": 120 + 80 * wave(lat, lon, 5, 11),
+        "clay": 300 + 100 * wave(lat, lon, 9, 5),
+        "sand": 400 + 150 * wave(lat, lon, 3, 13),
+        "silt": 300 + 80 * wave(lat, lon, 11, 3),
+        "cec": 200 + 60 * wave(lat, lon, 17, 7),
+        "bdod": 140 + 10 * wave(lat, lon, 19, 23),
+    }
+    layers = []
+    for prop in query.get("property", ["phh2o", "nitrogen"]):
+        depths = [
+            {
+                "range": {"top_depth": DEPTH_RANGES.get(label, (0, 5))[0],
+                          "bottom_depth": DEPTH_RANGES.get(label, (0, 5))[1], "unit_depth": "cm"},
+                "label": label,
+                "values": {"mean": round(raw.get(prop, 100))},
+            }
+            for label in query.get("depth", ["0-5cm"])
+        ]
+        layers.append({"name": prop, "depths": depths})
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat]},
+        "properties": {"layers": layers},
+        "query_time_s": 0.0,
+    }
+
+
+def synthetic_nasa_power(lat, lon, query):
+    annual = {
+        "T2M": 25 + 6 * wave(lat, lon, 5, 3),
+        "RH2M": 60 + 20 * wave(lat, lon, 7, 11),
+        "PRECTOTCORR": 3 + 2.5 * wave(lat, lon, 11, 5),
+    }
+    parameter = {}
+    if "start" in query:
+        # Daily point API: one value per day, keyed YYYYMMDD
+        day = datetime.datetime.strptime(query["start"][0], "%Y%m%d").date()
+        end = datetime.datetime.strptime(query["end"][0], "%Y%m%d").date()
+        days = []
+        while day <= end:
+            days.append(day)
+            day += datetime.timedelta(days=1)
+        for name, value in annual.items():
+            parameter[name] = {
+                f"{day:%Y%m%d}": round(value * (1 + 0.2 * math.sin(day.timetuple().tm_yday / 365 * 2 * math.pi)), 2)
+                for day in days
+            }
+    else:
+        for name, value in annual.items():
+            monthly = {month: round(value * (1 + 0.2 * math.sin(i / 12 * 2 * math.pi)), 2) for i, month in enumerate(MONTHS)}
+            parameter[name] = {**monthly, "ANN": round(value, 2)}
+    return {
+        "type": "Feature",
+        "geometry": {"type": "Point", "coordinates": [lon, lat, 0]},
+        "properties": {"parameter": parameter},
+    }
+
+
+def synthetic_opencage(lat, lon, query):
+    import state_boundaries
+
+    state = state_boundaries.lookup_state(lat, lon)
+    components = {"country": "India", "state": state} if state else {"body_of_water": "Indian Ocean"}
+    return {
+        "status": {"code": 200, "message": "OK"},
+        "results": [{"components": components, "geometry": {"lat": lat, "lng": lon}}],
+        "total_results": 1,
+    }
+
+
+SYNTHETIC = {
+    "soilgrids": synthetic_soilgrids,
+    "nasa_power": synthetic_nasa_power,
+    "opencage": synthetic_opencage,
+}
+
+
+class Recordings:
+    """Recorded responses per service, matched to queries by nearest coordinates."""
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.entries = {service: [] for service in SERVICES}
+        self._lock = threading.Lock()
+        if directory:
+            for service in SERVICES:
+                path = os.path.join(directory, f"{service}.jsonl")
+                if os.path.exists(path):
+                    with open(path) as f:
+                        self.entries[service] = [json.loads(line) for line in f if line.strip()]
+
+    def nearest(self, service, lat, lon):
+        entries = self.entries[service]
+        if not entries:
+            return None
+        return min(entries, key=lambda e: (e["lat"] - lat) ** 2 + (e["lon"] - lon) ** 2)
+
+    def append(self, service, lat, lon, status, body):
+        entry = {"lat": lat, "lon": lon, "status": status, "body": body}
+        with self._lock:
+            self.entries[service].append(entry)
+            os.makedirs(self.directory, exist_ok=True)
+            with open(os.path.join(self.directory, f"{service}.jsonl"), "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+
+class FakeUpstreams:
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, recordings=None, record=None, overrides=None):
+        self.config = {service: {"latency": latency, "jitter": jitter, "error_rate": error_rate} for service in SERVICES}
+        for service, values in (overrides or {}).items():
+            self.config[service].update(values)
+        self.record = record is not None
+        self.recordings = Recordings(record if self.record else recordings)
+        self.calls = {service: 0 for service in SERVICES}
+        self.errors = {service: 0 for service in SERVICES}
+        self._lock = threading.Lock()
+
+    def respond(self, service, path, query, raw_query):
+        """``(status, body)`` for one request to ``service``."""
+        config = self.config[service]
+        with self._lock:
+            self.calls[service] += 1
+        delay = config["latency"] + random.uniform(0, config["jitter"])
+        if delay:
+            time.sleep(delay)
+        if config["error_rate"] and random.random() < config["error_rate"]:
+            with self._lock:
+                self.errors[service] += 1
+            return 503, {"error": f"fake {service} outage"}
+
+        lat, lon = query_coords(service, query)
+        if self.record:
+            return self._proxy(service, path, raw_query, lat, lon)
+        recorded = self.recordings.nearest(service, lat, lon)
+        if recorded is not None:
+            return recorded["status"], recorded["body"]
+        return 200, SYNTHETIC[service](lat, lon, query)
+
+    def _proxy(self, service, path, raw_query, lat, lon):
+        url = f"{REAL_BASE_URLS[service]}{path}?{raw_query}"
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                status, body = response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, {"error": str(e)}
+        if status == 200:
+            self.recordings.append(service, lat, lon, status, body)
+        return status, body
+
+    def stats(self):
+        with self._lock:
+            return {"calls": dict(self.calls), "errors": dict(self.errors), "config": self.config}
+
+
+def make_handler(fakes):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            parsed = urllib.parse.urlsplit(self.path)
+            service, _, rest = parsed.path.lstrip("/").partition("/")
+            if parsed.path == "/_stats":
+                return self._send(200, fakes.stats())
+            if service not in SERVICES:
+                return self._send(404, {"error": f"unknown service {service!r}"})
+            try:
+                status, body = fakes.respond(service, "/" + rest, urllib.parse.parse_qs(parsed.query), parsed.query)
+            except (KeyError, ValueError, IndexError) as e:
+                status, body = 400, {"error": f"bad query: {e}"}
+            self._send(status, body)
+
+        def _send(self, status, body):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start(port=0, host="127.0.0.1", **kwargs):
+    """Serve FakeUpstreams on a daemon thread; returns ``(server, fakes, env)``.
+
+    ``env`` holds the ``*_BASE_URL`` variables that point the service at it.
+    """
+    fakes = FakeUpstreams(**kwargs)
+    server = ThreadingHTTPServer((host, port), make_handler(fakes))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-upstreams", daemon=True).start()
+    base = f"http://{host}:{server.server_address[1]}"
+    env = {
+        "SOILGRIDS_BASE_URL": f"{base}/soilgrids",
+        "NASA_POWER_BASE_URL": f"{base}/nasa_power",
+        "OPENCAGE_BASE_URL": f"{base}/opencage",
+    }
+    return server, fakes, env
+
+
+def parse_overrides(settings):
+    """``["soilgrids.latency=0.5", ...]`` to ``{"soilgrids": {"latency": 0.5}}``."""
+    overrides = {}
+    for setting in settings:
+        key, _, value = setting.partition("=")
+        service, _, option = key.partition(".")
+        if service not in SERVICES or option not in ("latency", "jitter", "error_rate"):
+            raise ValueError(f"Bad --set {setting!r}; expected <service>.<latency|jitter|error_rate>=<value>")
+        overrides.setdefault(service, {})[option] = float(value)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve fake SoilGrids, NASA POWER and OpenCage APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 503")
+    parser.add_argument("--set", action="append", default=[], metavar="SERVICE.OPTION=VALUE",
+                        help="Per-service latency, jitter or error_rate")
+    parser.add_argument("--recordings", help="Replay <service>.jsonl recordings from this directory")
+    parser.add_argument("--record", help="Proxy to the real APIs and record responses into this directory")
+    args = parser.parse_args()
+
+    try:
+        overrides = parse_overrides(args.set)
+    except ValueError as e:
+        parser.error(str(e))
+    server, _, env = start(args.port, args.host, latency=args.latency, jitter=args.jitter,
+                           error_rate=args.error_rate, recordings=args.recordings, record=args.record,
+                           overrides=overrides)
+    print(f"✅ Fake upstreams listening on {args.host}:{server.server_address[1]}")
+    for key, value in env.items():
+        print(f"{key}={value}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+"""Closed-loop load test, and a sync-vs-ASGI deployment comparison.
+
+Drive an already running server:
+
+    python bench/loadtest.py --url http://127.0.0.1:10000 --concurrency 8 32 128
+
+Or start both deployments with identical settings and compare them:
+
+    python bench/loadtest.py --compare --workers 2 --concurrency 8 32 128
+
+``--compare`` runs ``gunicorn api_main:app`` (sync workers) and
+``gunicorn asgi_main:app -k uvicorn.workers.UvicornWorker`` with the same
+worker count. Unless overridden in the environment it serves soil and climate
+from a synthetic tile set and uses the stub NDVI backend with
+NDVI_STUB_LATENCY seconds of simulated Earth Engine wait, so the run is
+offline and the difference comes from how each server waits on I/O.
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+DEFAULT_PATH = "/get-top-3-crops"
+# Field centroids spread over India so requests do not all hit one cache cell
+SAMPLE_POINTS = [(8.0 + (i * 0.37) % 28.0, 69.0 + (i * 0.53) % 27.0) for i in range(997)]
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_level(base_url, path, concurrency, duration, method="GET", body_fn=None, headers=None):
+    """Keep ``concurrency`` clients busy for ``duration`` seconds; returns a summary dict."""
+    parsed = urllib.parse.urlparse(base_url)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.monotonic() + duration
+    counter = iter(range(10 ** 9))
+
+    def client():
+        conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < stop_at:
+            i = next(counter)
+            lat, lon = SAMPLE_POINTS[i % len(SAMPLE_POINTS)]
+            target = path if "?" in path or method != "GET" else f"{path}?lat={lat:.4f}&lon={lon:.4f}"
+            payload = body_fn(i) if body_fn else None
+            started = time.perf_counter()
+            try:
+                conn.request(method, target, body=payload, headers=headers or {})
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    local_errors += 1
+            except (OSError, http.client.HTTPException):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(parsed.hostname, parsed.port, timeout=60)
+                continue
+            local_latencies.append(time.perf_counter() - started)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "mean": 1000 * statistics.fmean(latencies) if latencies else None,
+            "p50": 1000 * percentile(latencies, 50) if latencies else None,
+            "p95": 1000 * percentile(latencies, 95) if latencies else None,
+            "p99": 1000 * percentile(latencies, 99) if latencies else None,
+        },
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(base_url, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"{base_url} did not come up within {timeout}s")
+
+
+def offline_env(workdir):
+    """Environment for an offline comparison run, respecting anything already set."""
+    env = dict(os.environ)
+    if "FEATURE_TILES" not in env:
+        import feature_tiles
+        stem = os.path.join(workdir, "synthetic")
+        feature_tiles.write_tiles(stem, feature_tiles.synthetic_grid(), feature_tiles.INDIA_BBOX, 0.25,
+                                  source="synthetic(seed=0)")
+        env["FEATURE_TILES"] = stem
+    env.setdefault("NDVI_BACKEND", "stub")
+    env.setdefault("NDVI_STUB_LATENCY", "0.2")
+    env.setdefault("FEATURE_CACHE", "0")
+    env.setdefault("NDVI_STORE", "0")
+    env.setdefault("UPSTREAM_QUOTA", "0")
+    env.setdefault("MODEL_NAME", "NaiveBayes")
+    return env
+
+
+def start_server(kind, workers, env):
+    port = free_port()
+    command = [sys.executable, "-m", "gunicorn", "-b", f"127.0.0.1:{port}", "-w", str(workers),
+               "--timeout", "120"]
+    if kind == "asgi":
+        command += ["-k", "uvicorn.workers.UvicornWorker", "asgi_main:app"]
+    else:
+        command += ["api_main:app"]
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url)
+    except RuntimeError:
+        process.terminate()
+        raise
+    return process, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the recommendation API.")
+    parser.add_argument("--url", help="Base URL of a running server")
+    parser.add_argument("--compare", action="store_true", help="Start sync and ASGI deployments and compare them")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--out", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    report = {"path": args.path, "duration_s": args.duration, "runs": {}}
+    if args.compare:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = offline_env(workdir)
+            report["env"] = {k: env[k] for k in ("NDVI_BACKEND", "NDVI_STUB_LATENCY", "FEATURE_CACHE", "MODEL_NAME")}
+            report["workers"] = args.workers
+            for kind in ("sync", "asgi"):
+                process, base_url = start_server(kind, args.workers, env)
+                try:
+                    report["runs"][kind] = [run_level(base_url, args.path, c, args.duration) for c in args.concurrency]
+                finally:
+                    process.terminate()
+                    process.wait()
+    elif args.url:
+        report["runs"][args.url] = [run_level(args.url, args.path, c, args.duration) for c in args.concurrency]
+    else:
+        parser.error("pass --url or --compare")
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
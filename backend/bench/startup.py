@@ -0,0 +1,116 @@
+"""Measure service cold start: import time and time-to-first-response.
+
+    python bench/startup.py --runs 5 --out startup.json
+
+Run from the backend directory. Each run starts a fresh interpreter, so the
+numbers include everything a new gunicorn worker or Render deploy pays. Set
+NDVI_BACKEND=stub and FEATURE_TILES to measure the first prediction offline.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_SNIPPET = (
+    "import time; t = time.perf_counter(); import api_main; "
+    "print(time.perf_counter() - t)"
+)
+
+
+def measure_import():
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                response.read()
+                return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+
+def measure_first_response(path, timeout):
+    port = free_port()
+    env = {**os.environ, "PORT": str(port)}
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "api_main.py"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        if not wait_for(f"{base}/", timeout):
+            raise RuntimeError(f"Server did not answer within {timeout}s")
+        ready = time.perf_counter() - started
+
+        first = None
+        if path:
+            t = time.perf_counter()
+            try:
+                with urllib.request.urlopen(f"{base}{path}", timeout=timeout) as response:
+                    response.read()
+            except OSError:
+                pass
+            first = time.perf_counter() - t
+        return ready, first
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    return {"median": statistics.median(values), "min": min(values), "max": max(values), "runs": len(values)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--path", default="/get-top-3-crops?lat=12.6168&lon=77.4427",
+                        help="Request timed after the server is up (empty to skip)")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--out", help="Write the JSON report here as well as stdout")
+    args = parser.parse_args()
+
+    imports = [measure_import() for _ in range(args.runs)]
+    responses = [measure_first_response(args.path, args.timeout) for _ in range(args.runs)]
+
+    report = {
+        "python": sys.version.split()[0],
+        "import_seconds": summarize(imports),
+        "time_to_ready_seconds": summarize([ready for ready, _ in responses]),
+        "first_request_seconds": summarize([first for _, first in responses]),
+        "first_request_path": args.path,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
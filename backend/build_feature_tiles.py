@@ -0,0 +1,143 @@
+"""Build the offline feature tile set used by feature_tiles.
+
+    python build_feature_tiles.py --out tiles/india --resolution 0.25
+    python build_feature_tiles.py --out tiles/synthetic --synthetic
+
+The live build queries SoilGrids and NASA POWER once per cell centre. It
+reads and fills the same feature cache as the API, so it can be re-run to
+refresh a tile set and will reuse whatever the cache already holds. Its
+calls run in the bulk quota lane, behind the API's interactive ones. A call
+refused for quota is retried until a token comes free, for up to
+``--quota-wait`` seconds per lookup.
+
+A cell whose lookups still fail counts as failed, unlike a cell the
+providers have no data for. Failed cells are left NaN, and their number is
+recorded in the tile metadata. Above ``--max-failed`` of the grid, the
+build exits without replacing the published tiles.
+"""
+import argparse
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import feature_tiles
+import quota
+import upstream
+
+
+def until_granted(fetch, max_wait):
+    """``fetch()``, retried while the upstream quota refuses it, for up to ``max_wait`` seconds."""
+    give_up = time.monotonic() + max_wait
+    while True:
+        try:
+            return fetch()
+        except upstream.QuotaExceededError:
+            if time.monotonic() >= give_up:
+                raise
+            # acquire() already waited out the bulk lane's limit; just try again
+            time.sleep(1.0)
+
+
+def build_live(bbox, resolution, workers, quota_wait):
+    """``(grid, failed cells)``."""
+    # Imported here so a synthetic build needs neither Flask nor Earth Engine
+    import soil_client
+    from api_main import get_soil, get_weather, parse_weather, weather_url
+
+    rows, cols = feature_tiles.grid_shape(bbox, resolution)
+    grid = np.full((len(feature_tiles.BANDS), rows, cols), np.nan, dtype=np.float32)
+    lat_min, _, lon_min, _ = bbox
+
+    def soil_at(lat, lon):
+        soil = get_soil.lookup(lat, lon)
+        if soil is None:
+            # Through the client directly, so a refusal raises instead of reading as "no data"
+            centre = get_soil.centre(lat, lon)
+            data = upstream.soilgrids.get_json(soil_client.build_query_url(*centre))
+            properties = soil_client.parse_response(data, *centre)
+            soil = {"pH": properties.ph, "Nitrogen": properties.nitrogen}
+            get_soil.prime(soil, lat, lon)
+        return soil
+
+    def weather_at(lat, lon):
+        weather = get_weather.lookup(lat, lon)
+        if weather is None:
+            weather = parse_weather(upstream.nasa_power.get_json(weather_url(*get_weather.centre(lat, lon))))
+            get_weather.prime(weather, lat, lon)
+        return weather
+
+    def fetch(cell):
+        row, col = cell
+        lat = lat_min + (row + 0.5) * resolution
+        lon = lon_min + (col + 0.5) * resolution
+        # A rebuild must not starve live requests of upstream quota
+        with quota.lane(quota.BULK):
+            try:
+                soil = until_granted(lambda: soil_at(lat, lon), quota_wait) or {}
+                weather = until_granted(lambda: weather_at(lat, lon), quota_wait) or {}
+            except Exception as e:
+                logging.error(f"Cell {row},{col} ({lat:.3f}, {lon:.3f}) failed: {e}")
+                return cell, None
+        return cell, [
+            soil.get("pH"),
+            soil.get("Nitrogen"),
+            weather.get("temperature"),
+            weather.get("humidity"),
+            weather.get("rainfall"),
+        ]
+
+    cells = [(row, col) for row in range(rows) for col in range(cols)]
+    failed = 0
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, ((row, col), values) in enumerate(pool.map(fetch, cells), start=1):
+            if values is None:
+                failed += 1
+            else:
+                grid[:, row, col] = [np.nan if v is None else v for v in values]
+            if done % 500 == 0 or done == len(cells):
+                rate = done / (time.monotonic() - started)
+                logging.info(f"{done}/{len(cells)} cells ({rate:.1f} cells/s, {failed} failed)")
+    return grid, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rasterize soil and climate features over India.")
+    parser.add_argument("--out", required=True, help="Output stem; writes <out>.npy and <out>.json")
+    parser.add_argument("--resolution", type=float, default=0.25, help="Cell size in degrees")
+    parser.add_argument("--bbox", type=float, nargs=4, default=feature_tiles.INDIA_BBOX,
+                        metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"))
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent upstream lookups (live build)")
+    parser.add_argument("--quota-wait", type=float, default=3600,
+                        help="Seconds one lookup keeps retrying while the upstream quota refuses it (live build)")
+    parser.add_argument("--max-failed", type=float, default=0.01,
+                        help="Largest share of failed cells that still publishes (live build)")
+    parser.add_argument("--synthetic", action="store_true", help="Generate a deterministic synthetic grid")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for --synthetic")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    bbox = tuple(args.bbox)
+    if args.synthetic:
+        grid = feature_tiles.synthetic_grid(bbox, args.resolution, args.seed)
+        source = f"synthetic(seed={args.seed})"
+        failed = 0
+    else:
+        grid, failed = build_live(bbox, args.resolution, args.workers, args.quota_wait)
+        source = "soilgrids+nasa_power"
+        cells = grid.shape[1] * grid.shape[2]
+        if failed > args.max_failed * cells:
+            logging.error(f"{failed} of {cells} cells failed, over --max-failed {args.max_failed:.1%}; "
+                          f"{args.out} was not replaced")
+            sys.exit(1)
+
+    feature_tiles.write_tiles(args.out, grid, bbox, args.resolution, source=source, failed_cells=failed)
+    missing = np.isnan(grid).any(axis=0).mean()
+    logging.info(f"Wrote {args.out}.npy {grid.shape} ({grid.nbytes / 1e6:.1f} MB, {missing:.1%} cells incomplete)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Score every cell of a feature tile set and write recommendation tiles.
+
+    python build_recommendation_tiles.py --features tiles/india --out tiles/recommendations
+    python build_recommendation_tiles.py --features tiles/india --out tiles/rf --model RandomForest --k 5
+
+Cells get the same model inputs as a live request would: soil and climate
+from the feature tiles, missing soil values filled from the state-wise
+defaults at the cell centre, and columns picked by the model's schema. Only
+cells with a complete feature row are scored, in chunks of ``--chunk`` rows
+per ``predict_proba`` call. Point the
+API at the result with RECOMMENDATION_TILES=<out>.
+"""
+import argparse
+import logging
+import time
+
+import numpy as np
+
+import batch
+import feature_schema
+import feature_tiles
+import model_registry
+import recommendation_tiles
+import state_boundaries
+from state_defaults import regional_defaults
+
+
+def record_matrix(tiles):
+    """Every grid cell as a row in the FeatureRecord layout; fields without a band stay NaN."""
+    matrix = np.full((tiles.rows * tiles.cols, len(feature_schema.FIELDS)), np.nan)
+    for band, name in enumerate(tiles.bands):
+        if name in feature_schema.INDEX:
+            matrix[:, feature_schema.INDEX[name]] = np.asarray(tiles.grid[band], dtype=np.float64).ravel()
+    return matrix
+
+
+def fill_soil_defaults(tiles, matrix):
+    """Fill missing soil values from state defaults at the cell centre, as a live request would."""
+    columns = regional_defaults.columns
+    climate = [i for i in range(1, len(feature_schema.FIELDS)) if i not in columns]
+    gaps = np.flatnonzero(np.isnan(matrix[:, columns]).any(axis=1) & ~np.isnan(matrix[:, climate]).any(axis=1))
+    lats, lons = tiles.cell_centres()
+    rows, cols = np.divmod(gaps, tiles.cols)
+    states = [state_boundaries.lookup_state(float(lat), float(lon)) for lat, lon in zip(lats[rows], lons[cols])]
+    codes = np.full(len(matrix), -1, dtype=np.int64)
+    codes[gaps] = regional_defaults.codes(states)
+    return int(regional_defaults.fill(matrix, codes).sum())
+
+
+def score(tiles, model, k, chunk, impute_medians=False):
+    if len(model.classes_) >= recommendation_tiles.NO_DATA:
+        raise ValueError(f"{len(model.classes_)} classes do not fit the uint8 tile format")
+    matrix = record_matrix(tiles)
+    filled = fill_soil_defaults(tiles, matrix)
+    if impute_medians:
+        filled += int(feature_schema.fill_medians(matrix, model.schema).sum())
+    X = model.schema.select(matrix)
+
+    complete = np.flatnonzero(model.schema.complete(matrix))
+    k = min(k, len(model.classes_))
+    crops = np.full((k, len(matrix)), recommendation_tiles.NO_DATA, dtype=np.uint8)
+    proba = np.zeros((k, len(matrix)), dtype=np.uint8)
+
+    started = time.monotonic()
+    for start in range(0, len(complete), chunk):
+        rows = complete[start:start + chunk]
+        top, top_probs = batch.top_k_indices(model.predict_proba(X[rows]), k)
+        crops[:, rows] = top.T
+        proba[:, rows] = np.round(top_probs.T * 255)
+    elapsed = time.monotonic() - started
+    logging.info(f"Scored {len(complete)} of {len(matrix)} cells in {elapsed:.2f}s "
+                 f"({len(complete) / max(elapsed, 1e-9):,.0f} cells/s, {filled} cells imputed)")
+    shape = (k, tiles.rows, tiles.cols)
+    return crops.reshape(shape), proba.reshape(shape)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute top-k crop recommendations over a feature grid.")
+    parser.add_argument("--features", required=True, help="Feature tile stem (see build_feature_tiles.py)")
+    parser.add_argument("--out", required=True, help="Output stem; writes <out>.crops.npy, <out>.proba.npy, <out>.json")
+    parser.add_argument("--model", help="Model name or name:version (default MODEL_NAME)")
+    parser.add_argument("--k", type=int, default=3, help="Classes kept per cell")
+    parser.add_argument("--chunk", type=int, default=65536, help="Cells per predict_proba call")
+    parser.add_argument("--impute-medians", action="store_true",
+                        help="Fill model columns still missing after the state defaults from training medians")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    tiles = feature_tiles.FeatureTiles.open(args.features)
+    model = model_registry.registry.get(args.model)
+    crops, proba = score(tiles, model, args.k, args.chunk, args.impute_medians)
+    recommendation_tiles.write_grid(
+        args.out, crops, proba, tiles.meta["bbox"], tiles.resolution, model.classes_, model.id,
+        source=f"{args.features} ({tiles.meta.get('source', 'unknown')})",
+    )
+    logging.info(f"Wrote {args.out}.crops.npy and {args.out}.proba.npy {crops.shape} for {model.id}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Prebuild the similar-samples index so the service loads it instead of building it.
+
+    python build_similarity_index.py
+    python build_similarity_index.py --model RandomForest
+
+The index covers the columns of ``--model``'s schema. Without a model file
+on hand it uses the default columns. It is written under SIMILAR_INDEX_DIR
+from the SIMILAR_DATA files, as similar_samples.get_index expects.
+"""
+import argparse
+import logging
+import time
+
+import feature_schema
+import model_registry
+import similar_samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the KD-tree of labelled training samples.")
+    parser.add_argument("--model", help="Model name or name:version whose columns to index (default MODEL_NAME)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        columns = model_registry.registry.get(args.model).schema.columns
+    except model_registry.UnknownModelError:
+        if args.model:
+            raise
+        columns = feature_schema.DEFAULT_COLUMNS
+        logging.warning(f"No {model_registry.DEFAULT_MODEL} model found; indexing the default columns")
+
+    started = time.monotonic()
+    index, path = similar_samples.build(columns)
+    logging.info(f"Wrote {path}: {len(index.samples)} samples over {list(columns)} "
+                 f"in {time.monotonic() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Convert a current ADM1 boundary set into the state boundaries used by state_boundaries.
+
+    python build_state_boundaries.py geoBoundaries-IND-ADM1_simplified.geojson --out data/india_states.geojson
+    python build_state_boundaries.py gadm41_IND_1.json --name-field NAME_1 --out data/india_states.geojson
+
+Each feature's name is read from ``--name-field`` (by default the first of
+shapeName, NAME_1, ST_NM, st_nm and name that it has) and mapped to a key of
+``soil_default_values``. Spelling variants and old names are matched through
+ALIASES. The halves of a merged union territory, such as Daman and Diu and
+Dadra and Nagar Haveli in a set that still draws them apart, are joined into
+one MultiPolygon. Coordinates are rounded to ``--precision`` degrees and
+repeated vertices dropped, which keeps the file small enough to bundle.
+
+The build refuses to write the file if a feature name maps to no key or a key
+is left without a polygon; pass ``--allow-missing`` to write it anyway.
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+
+import state_boundaries
+from state_defaults import soil_default_values
+
+NAME_FIELDS = ("shapeName", "NAME_1", "ST_NM", "st_nm", "name")
+
+# Normalized source names -> soil_default_values keys
+ALIASES = {
+    "andaman and nicobar": "Andaman and Nicobar Islands",
+    "dadra and nagar haveli": "Dadra and Nagar Haveli and Daman and Diu",
+    "daman and diu": "Dadra and Nagar Haveli and Daman and Diu",
+    "dnh and dd": "Dadra and Nagar Haveli and Daman and Diu",
+    "nct of delhi": "Delhi",
+    "national capital territory of delhi": "Delhi",
+    "orissa": "Odisha",
+    "pondicherry": "Puducherry",
+    "uttaranchal": "Uttarakhand",
+}
+
+
+def normalize(name):
+    name = name.lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^a-z ]", " ", name).split())
+
+
+def key_for(name, keys):
+    """The ``soil_default_values`` key a source name stands for, or ``None``."""
+    by_normal = {normalize(key): key for key in keys}
+    normal = normalize(name)
+    return by_normal.get(normal) or ALIASES.get(normal)
+
+
+def name_field(feature, field=None):
+    if field:
+        return field
+    for candidate in NAME_FIELDS:
+        if candidate in feature["properties"]:
+            return candidate
+    raise KeyError(f"no name field among {NAME_FIELDS} in {sorted(feature['properties'])}")
+
+
+def polygons(geometry):
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    if geometry["type"] == "GeometryCollection":
+        return [polygon for part in geometry["geometries"] for polygon in polygons(part)]
+    return []
+
+
+def quantize(ring, precision):
+    """The ring rounded to multiples of ``precision`` without repeated vertices, or ``None`` if it collapses."""
+    points = []
+    for lon, lat, *_ in ring:
+        point = [round(round(lon / precision) * precision, 6), round(round(lat / precision) * precision, 6)]
+        if not points or point != points[-1]:
+            points.append(point)
+    if points[0] != points[-1]:
+        points.append(points[0])
+    return points if len(points) >= 4 else None
+
+
+def convert(collection, keys, field=None, precision=1 / 1024):
+    """``(FeatureCollection, unmatched source names)`` keyed by ``keys``."""
+    merged, source_names, unmatched = {}, {}, []
+    for feature in collection["features"]:
+        source_name = feature["properties"][name_field(feature, field)]
+        key = key_for(source_name, keys)
+        if key is None:
+            unmatched.append(source_name)
+            continue
+        source_names.setdefault(key, []).append(source_name)
+        for polygon in polygons(feature["geometry"]):
+            rings = [quantize(ring, precision) for ring in polygon]
+            # A collapsed outer ring drops the polygon, a collapsed hole just the hole
+            if rings and rings[0] is not None:
+                merged.setdefault(key, []).append([ring for ring in rings if ring is not None])
+
+    features = [
+        {
+            "type": "Feature",
+            "properties": {"name": key, "source_name": " + ".join(source_names[key])},
+            "geometry": {"type": "MultiPolygon", "coordinates": merged[key]},
+        }
+        for key in sorted(merged)
+    ]
+    return {"type": "FeatureCollection", "features": features}, unmatched
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert ADM1 boundaries into the bundled state boundaries.")
+    parser.add_argument("source", help="ADM1 GeoJSON (geoBoundaries, GADM 4.1, DataMeet)")
+    parser.add_argument("--out", default=state_boundaries.BOUNDARIES_PATH, help="Output GeoJSON")
+    parser.add_argument("--name-field", help=f"Feature property holding the state name (default: first of {NAME_FIELDS})")
+    parser.add_argument("--label", help="Source description stored in the output (default: the source file name)")
+    parser.add_argument("--precision", type=float, default=1 / 1024, help="Coordinate grid in degrees")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="Write the file even if some soil_default_values keys have no polygon")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    with open(args.source, encoding="utf-8") as f:
+        collection, unmatched = convert(json.load(f), soil_default_values, args.name_field, args.precision)
+    collection = {"type": "FeatureCollection", "source": args.label or args.source, **collection}
+
+    missing = sorted(set(soil_default_values) - {f["properties"]["name"] for f in collection["features"]})
+    if unmatched:
+        logging.error(f"Source names matching no soil_default_values key: {', '.join(unmatched)}; add them to ALIASES")
+    if missing:
+        logging.error(f"No polygon for: {', '.join(missing)}")
+    if (unmatched or missing) and not args.allow_missing:
+        logging.error(f"{args.out} was not replaced")
+        sys.exit(1)
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(collection, f, separators=(",", ":"), ensure_ascii=False)
+    index = state_boundaries.StateIndex.load(args.out)
+    logging.info(f"Wrote {len(collection['features'])} states to {args.out} ({index.stats()})")
+
+
+if __name__ == "__main__":
+    main()
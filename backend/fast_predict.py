@@ -0,0 +1,84 @@
+"""NumPy evaluators for fitted scikit-learn models.
+
+For a single row, scikit-learn's ``predict_proba`` spends far longer on input
+validation and dispatch than on the arithmetic. These evaluators copy the
+fitted parameters into plain arrays once and evaluate them directly, for one
+row or a whole batch. ``compile_estimator`` returns ``None`` for model types
+it does not know, and callers then keep using the estimator itself.
+"""
+import numpy as np
+
+
+class CompiledGaussianNB:
+    def __init__(self, estimator):
+        self.classes_ = estimator.classes_
+        var = estimator.var_
+        self._theta = estimator.theta_
+        self._inv_var = 1.0 / var
+        # Per-class constant: log prior - 0.5 * sum(log(2 * pi * var))
+        self._const = np.log(estimator.class_prior_) - 0.5 * np.log(2.0 * np.pi * var).sum(axis=1)
+
+    def joint_log_likelihood(self, X):
+        X = np.asarray(X, dtype=float)
+        diff = X[:, None, :] - self._theta[None, :, :]
+        return self._const - 0.5 * (diff * diff * self._inv_var).sum(axis=2)
+
+    def predict_proba(self, X):
+        jll = self.joint_log_likelihood(X)
+        jll -= jll.max(axis=1, keepdims=True)
+        proba = np.exp(jll)
+        proba /= proba.sum(axis=1, keepdims=True)
+        return proba
+
+
+class _CompiledTree:
+    def __init__(self, tree):
+        self.left = tree.children_left
+        self.right = tree.children_right
+        self.feature = tree.feature
+        self.threshold = tree.threshold
+        value = tree.value[:, 0, :]
+        self.proba = value / value.sum(axis=1, keepdims=True)
+
+    def leaves(self, X):
+        nodes = np.zeros(len(X), dtype=np.intp)
+        active = np.flatnonzero(self.left[nodes] != -1)
+        while active.size:
+            current = nodes[active]
+            go_left = X[active, self.feature[current]] <= self.threshold[current]
+            nodes[active] = np.where(go_left, self.left[current], self.right[current])
+            active = active[self.left[nodes[active]] != -1]
+        return nodes
+
+    def predict_proba(self, X):
+        return self.proba[self.leaves(X)]
+
+
+class CompiledTreeEnsemble:
+    """A single decision tree or a forest averaging its trees' probabilities."""
+
+    def __init__(self, estimator):
+        self.classes_ = estimator.classes_
+        trees = getattr(estimator, "estimators_", [estimator])
+        self._trees = [_CompiledTree(tree.tree_) for tree in trees]
+
+    def predict_proba(self, X):
+        # scikit-learn compares against float32 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        proba = self._trees[0].predict_proba(X)
+        for tree in self._trees[1:]:
+            proba = proba + tree.predict_proba(X)
+        return proba / len(self._trees)
+
+
+def compile_estimator(estimator):
+    kind = type(estimator).__name__
+    if kind == "GaussianNB":
+        return CompiledGaussianNB(estimator)
+    if kind in ("DecisionTreeClassifier", "ExtraTreeClassifier"):
+        return CompiledTreeEnsemble(estimator)
+    if kind in ("RandomForestClassifier", "ExtraTreesClassifier"):
+        # Multi-output forests keep per-output class arrays; leave those alone
+        if getattr(estimator, "n_outputs_", 1) == 1:
+            return CompiledTreeEnsemble(estimator)
+    return None
@@ -0,0 +1,541 @@
+"""Spatially bucketed TTL/LRU cache for upstream feature lookups.
+
+Coordinates are snapped to each source's native grid so every point inside a
+SoilGrids pixel or NASA POWER cell shares one entry, and the upstream is
+queried at the cell centre so the cached value is the same for all of them.
+Entries live in a size-bounded in-memory LRU per source, backed by an optional
+SQLite file so they survive gunicorn worker restarts. The file is bounded
+too: every FEATURE_CACHE_MAINTENANCE_SECONDS a worker drops expired rows and
+then the least recently read ones beyond FEATURE_CACHE_MAX_ROWS, so a batch
+or tile build sweeping many cells cannot grow it without limit.
+
+Misses are single-flight per source and cell: concurrent lookups of one cell
+share a single upstream call and its result or error. With
+SINGLE_FLIGHT_CROSS_WORKER=1 the SQLite file also holds a short lease per
+cell, so other workers wait for the leaseholder's result to land in the
+shared store instead of making the same call.
+
+Coroutine fetchers (the ASGI entry point) answer memory hits inline and
+run every SQLite read, write and lease on a worker thread, so a store busy
+with other workers' writes never stalls the event loop.
+"""
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+import singleflight
+
+DAY = 24 * 60 * 60
+
+# source: (lat resolution, lon resolution, ttl seconds, max in-memory entries)
+SOURCE_CONFIG = {
+    # SoilGrids 250 m rasters, static
+    "soil": (0.0025, 0.0025, 90 * DAY, 50000),
+    # NASA POWER climatology grid (0.5° x 0.625°), static
+    "weather": (0.5, 0.625, 90 * DAY, 10000),
+    # MODIS MOD13A1 500 m, 16-day composites
+    "ndvi": (0.005, 0.005, 16 * DAY, 50000),
+    # Administrative boundaries barely move
+    "state": (0.01, 0.01, 365 * DAY, 50000),
+}
+
+CACHE_PATH = os.getenv("FEATURE_CACHE_PATH", "feature_cache.sqlite3")
+CACHE_ENABLED = os.getenv("FEATURE_CACHE", "1") != "0"
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "1") != "0"
+SINGLE_FLIGHT_CROSS_WORKER = SINGLE_FLIGHT and os.getenv("SINGLE_FLIGHT_CROSS_WORKER", "0") == "1"
+# Longest a worker waits on another worker's lease; covers the upstream deadline
+LEASE_SECONDS = float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "10"))
+LEASE_POLL_SECONDS = 0.05
+# Rows the SQLite store keeps across every source; 0 leaves it unbounded
+DISK_MAX_ROWS = int(os.getenv("FEATURE_CACHE_MAX_ROWS", "500000"))
+MAINTENANCE_SECONDS = float(os.getenv("FEATURE_CACHE_MAINTENANCE_SECONDS", "300"))
+
+
+def snap(lat, lon, lat_res, lon_res):
+    """Return the grid cell index and the coordinates of its centre."""
+    row = math.floor(lat / lat_res)
+    col = math.floor(lon / lon_res)
+    return (row, col), (round((row + 0.5) * lat_res, 6), round((col + 0.5) * lon_res, 6))
+
+
+# Every source grid above nests inside this one, so two points in the same
+# finest cell get identical features from every source.
+FINEST_RESOLUTION = min(min(lat_res, lon_res) for lat_res, lon_res, _, _ in SOURCE_CONFIG.values())
+
+
+def finest_cell(lat, lon):
+    return snap(lat, lon, FINEST_RESOLUTION, FINEST_RESOLUTION)[0]
+
+
+# Whole recommendations (features plus probabilities) per finest cell and model
+# version; a day keeps them well inside the NDVI composite period
+SOURCE_CONFIG["response"] = (FINEST_RESOLUTION, FINEST_RESOLUTION,
+                             float(os.getenv("RESPONSE_CACHE_TTL", str(DAY))),
+                             int(os.getenv("RESPONSE_CACHE_ENTRIES", "20000")))
+
+
+class _DiskStore:
+    """SQLite key/value table shared by every worker on the host."""
+
+    def __init__(self, path, max_rows=DISK_MAX_ROWS, maintenance_interval=MAINTENANCE_SECONDS):
+        self.path = path
+        self.max_rows = max_rows
+        self.maintenance_interval = maintenance_interval
+        self._local = threading.local()
+        self._maintenance_lock = threading.Lock()
+        self._maintained_at = time.monotonic()
+        self.evictions = 0
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS feature_cache ("
+            " source TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " expires REAL NOT NULL, accessed REAL NOT NULL DEFAULT 0, PRIMARY KEY (source, key))"
+        )
+        columns = [row[1] for row in self._conn().execute("PRAGMA table_info(feature_cache)")]
+        if "accessed" not in columns:
+            # Stores written before the row bound; their rows count as least recently read
+            self._conn().execute("ALTER TABLE feature_cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+        self._conn().execute("CREATE INDEX IF NOT EXISTS feature_cache_accessed ON feature_cache (accessed)")
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS feature_leases ("
+            " source TEXT NOT NULL, key TEXT NOT NULL, owner INTEGER NOT NULL,"
+            " expires REAL NOT NULL, PRIMARY KEY (source, key))"
+        )
+
+    def _conn(self):
+        # sqlite3 connections must not cross threads or forked workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, source, key):
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT value, expires FROM feature_cache WHERE source = ? AND key = ?",
+            (source, key),
+        ).fetchone()
+        if row is None or row[1] < now:
+            return None, None
+        # Only memory misses get here, so the LRU clock costs one write per disk hit
+        conn.execute("UPDATE feature_cache SET accessed = ? WHERE source = ? AND key = ?", (now, source, key))
+        return json.loads(row[0]), row[1]
+
+    def put(self, source, key, value, expires):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO feature_cache VALUES (?, ?, ?, ?, ?)",
+            (source, key, json.dumps(value), expires, time.time()),
+        )
+        self.maybe_maintain()
+
+    def purge_expired(self):
+        self._conn().execute("DELETE FROM feature_cache WHERE expires < ?", (time.time(),))
+        self._conn().execute("DELETE FROM feature_leases WHERE expires < ?", (time.time(),))
+
+    def evict(self):
+        """Drop the least recently read rows beyond ``max_rows``; returns how many."""
+        if not self.max_rows:
+            return 0
+        conn = self._conn()
+        excess = conn.execute("SELECT COUNT(*) FROM feature_cache").fetchone()[0] - self.max_rows
+        if excess <= 0:
+            return 0
+        conn.execute(
+            "DELETE FROM feature_cache WHERE rowid IN"
+            " (SELECT rowid FROM feature_cache ORDER BY accessed LIMIT ?)",
+            (excess,),
+        )
+        self.evictions += excess
+        return excess
+
+    def maybe_maintain(self):
+        """Purge and evict if this worker has not done so for ``maintenance_interval``."""
+        if time.monotonic() - self._maintained_at < self.maintenance_interval:
+            return
+        if not self._maintenance_lock.acquire(blocking=False):
+            return
+        try:
+            self._maintained_at = time.monotonic()
+            self.purge_expired()
+            evicted = self.evict()
+            if evicted:
+                logging.info(f"Feature cache store over {self.max_rows} rows, evicted {evicted}")
+        finally:
+            self._maintenance_lock.release()
+
+    def acquire_lease(self, source, key, seconds):
+        """Claim the key for this worker; False while another worker holds it."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM feature_leases WHERE source = ? AND key = ? AND expires < ?", (source, key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO feature_leases VALUES (?, ?, ?, ?)",
+            (source, key, os.getpid(), now + seconds),
+        )
+        return cursor.rowcount == 1
+
+    def release_lease(self, source, key):
+        self._conn().execute(
+            "DELETE FROM feature_leases WHERE source = ? AND key = ? AND owner = ?",
+            (source, key, os.getpid()),
+        )
+
+    def leased(self, source, key):
+        row = self._conn().execute(
+            "SELECT 1 FROM feature_leases WHERE source = ? AND key = ? AND expires >= ?",
+            (source, key, time.time()),
+        ).fetchone()
+        return row is not None
+
+
+class FeatureCache:
+    """LRU of ``key -> (value, expires)`` for a single upstream source."""
+
+    def __init__(self, source, lat_res, lon_res, ttl, max_entries, disk=None):
+        self.source = source
+        self.lat_res = lat_res
+        self.lon_res = lon_res
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk = disk
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.peer_hits = 0
+        self.flights = singleflight.Group()
+        self.async_flights = singleflight.AsyncGroup()
+
+    def get(self, key):
+        value = self._get_memory(key)
+        if value is None and self.disk is not None:
+            value = self._get_disk(key)
+        return self._counted(value)
+
+    async def get_async(self, key):
+        """``get`` for the event loop: memory hits answer inline, the SQLite read runs on a thread."""
+        value = self._get_memory(key)
+        if value is None and self.disk is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        return self._counted(value)
+
+    def _get_memory(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[1] >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.expirations += 1
+        return None
+
+    def _get_disk(self, key):
+        try:
+            value, expires = self.disk.get(self.source, key)
+        except sqlite3.Error as e:
+            logging.error(f"Feature cache read failed for {self.source}: {e}")
+            return None
+        if value is not None:
+            with self._lock:
+                self.disk_hits += 1
+                self._store(key, value, expires)
+        return value
+
+    def _counted(self, value):
+        if value is None:
+            with self._lock:
+                self.misses += 1
+        return value
+
+    def put(self, key, value):
+        expires = self._put_memory(key, value)
+        if self.disk is not None:
+            self._put_disk(key, value, expires)
+
+    async def put_async(self, key, value):
+        """``put`` for the event loop; the SQLite write runs on a thread."""
+        expires = self._put_memory(key, value)
+        if self.disk is not None:
+            await asyncio.to_thread(self._put_disk, key, value, expires)
+
+    def _put_memory(self, key, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires)
+        return expires
+
+    def _put_disk(self, key, value, expires):
+        try:
+            self.disk.put(self.source, key, value, expires)
+        except sqlite3.Error as e:
+            logging.error(f"Feature cache write failed for {self.source}: {e}")
+
+    def lease(self, key):
+        """Try to claim ``key`` across workers; True when this worker should fetch it."""
+        if self.disk is None or not SINGLE_FLIGHT_CROSS_WORKER:
+            return True
+        try:
+            return self.disk.acquire_lease(self.source, key, LEASE_SECONDS)
+        except sqlite3.Error as e:
+            logging.error(f"Feature cache lease failed for {self.source}: {e}")
+            return True
+
+    async def lease_async(self, key):
+        if self.disk is None or not SINGLE_FLIGHT_CROSS_WORKER:
+            return True
+        return await asyncio.to_thread(self.lease, key)
+
+    def release(self, key):
+        if self.disk is None or not SINGLE_FLIGHT_CROSS_WORKER:
+            return
+        try:
+            self.disk.release_lease(self.source, key)
+        except sqlite3.Error as e:
+            logging.error(f"Feature cache lease release failed for {self.source}: {e}")
+
+    async def release_async(self, key):
+        if self.disk is None or not SINGLE_FLIGHT_CROSS_WORKER:
+            return
+        await asyncio.to_thread(self.release, key)
+
+    def peer_result(self, key):
+        """``(value, waiting)``: another worker's stored result, and whether its lease is still held."""
+        try:
+            value, expires = self.disk.get(self.source, key)
+            if value is not None:
+                with self._lock:
+                    self.peer_hits += 1
+                    self._store(key, value, expires)
+                return value, False
+            return None, self.disk.leased(self.source, key)
+        except sqlite3.Error as e:
+            logging.error(f"Feature cache lease check failed for {self.source}: {e}")
+            return None, False
+
+    def wait_for_peer(self, key):
+        """Poll the shared store while another worker fetches ``key``; None if it gives up."""
+        deadline = time.monotonic() + LEASE_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(LEASE_POLL_SECONDS)
+            value, waiting = self.peer_result(key)
+            if value is not None or not waiting:
+                return value
+        return None
+
+    async def wait_for_peer_async(self, key):
+        deadline = time.monotonic() + LEASE_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(LEASE_POLL_SECONDS)
+            value, waiting = await asyncio.to_thread(self.peer_result, key)
+            if value is not None or not waiting:
+                return value
+        return None
+
+    def _store(self, key, value, expires):
+        self._entries[key] = (value, expires)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "resolution": [self.lat_res, self.lon_res],
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "peer_hits": self.peer_hits,
+                "coalesced": self.flights.followers + self.async_flights.followers,
+                "in_flight": self.flights.in_flight() + self.async_flights.in_flight(),
+            }
+
+
+def _open_disk_store():
+    if not CACHE_PATH:
+        return None
+    try:
+        store = _DiskStore(CACHE_PATH)
+        store.purge_expired()
+        store.evict()
+        return store
+    except sqlite3.Error as e:
+        logging.error(f"Persistent feature cache disabled, cannot open {CACHE_PATH}: {e}")
+        return None
+
+
+_disk = _open_disk_store() if CACHE_ENABLED else None
+caches = {
+    source: FeatureCache(source, lat_res, lon_res, ttl, max_entries, _disk)
+    for source, (lat_res, lon_res, ttl, max_entries) in SOURCE_CONFIG.items()
+}
+
+
+def cached(source, key_args=(), cacheable=None):
+    """Cache ``fn(lat, lon, ...)`` in the ``source`` bucket.
+
+    ``key_args`` names further arguments (e.g. the NDVI date) that take part in
+    the key. Arguments not listed, such as API keys, are ignored. ``None``
+    results, and results rejected by ``cacheable``, are never cached so an
+    outage does not poison the cell. Concurrent misses on one key share a
+    single call, even with the cache itself turned off.
+    """
+    cache = caches[source]
+
+    def decorator(fn):
+        signature = inspect.signature(fn)
+        lat_name, lon_name = list(signature.parameters)[:2]
+
+        def locate(lat, lon, args, kwargs):
+            bound = signature.bind(lat, lon, *args, **kwargs)
+            bound.apply_defaults()
+            cell, centre = snap(lat, lon, cache.lat_res, cache.lon_res)
+            key = ":".join(str(part) for part in (*cell, *(bound.arguments[name] for name in key_args)))
+            return key, bound, centre
+
+        def should_cache(value):
+            return value is not None and (cacheable is None or cacheable(value))
+
+        def at_centre(bound, centre):
+            bound.arguments[lat_name], bound.arguments[lon_name] = centre
+            return bound
+
+        if inspect.iscoroutinefunction(fn):
+            # Async fetchers (the ASGI entry point) share the same buckets
+            @functools.wraps(fn)
+            async def wrapper(lat, lon, *args, **kwargs):
+                if not CACHE_ENABLED and not SINGLE_FLIGHT:
+                    return await fn(lat, lon, *args, **kwargs)
+
+                key, bound, centre = locate(lat, lon, args, kwargs)
+                if CACHE_ENABLED:
+                    value = await cache.get_async(key)
+                    if value is not None:
+                        return value
+
+                bound = at_centre(bound, centre)
+
+                async def fetch():
+                    if not await cache.lease_async(key):
+                        value = await cache.wait_for_peer_async(key)
+                        if value is not None:
+                            return value
+                    try:
+                        value = await fn(*bound.args, **bound.kwargs)
+                        if CACHE_ENABLED and should_cache(value):
+                            await cache.put_async(key, value)
+                        return value
+                    finally:
+                        await cache.release_async(key)
+
+                if not SINGLE_FLIGHT:
+                    return await fetch()
+                return await cache.async_flights.do(key, fetch)
+        else:
+            @functools.wraps(fn)
+            def wrapper(lat, lon, *args, **kwargs):
+                if not CACHE_ENABLED and not SINGLE_FLIGHT:
+                    return fn(lat, lon, *args, **kwargs)
+
+                key, bound, centre = locate(lat, lon, args, kwargs)
+                if CACHE_ENABLED:
+                    value = cache.get(key)
+                    if value is not None:
+                        return value
+
+                bound = at_centre(bound, centre)
+
+                def fetch():
+                    if not cache.lease(key):
+                        value = cache.wait_for_peer(key)
+                        if value is not None:
+                            return value
+                    try:
+                        value = fn(*bound.args, **bound.kwargs)
+                        if CACHE_ENABLED and should_cache(value):
+                            cache.put(key, value)
+                        return value
+                    finally:
+                        cache.release(key)
+
+                if not SINGLE_FLIGHT:
+                    return fetch()
+                return cache.flights.do(key, fetch)
+
+        def centre(lat, lon):
+            """Coordinates the upstream is queried at for this point."""
+            return snap(lat, lon, cache.lat_res, cache.lon_res)[1]
+
+        def lookup(lat, lon, *args, **kwargs):
+            """Cached value for the point without calling the upstream."""
+            return cache.get(locate(lat, lon, args, kwargs)[0]) if CACHE_ENABLED else None
+
+        def prime(value, lat, lon, *args, **kwargs):
+            """Store a value fetched elsewhere, e.g. by a batched backend call."""
+            if CACHE_ENABLED and should_cache(value):
+                cache.put(locate(lat, lon, args, kwargs)[0], value)
+
+        wrapper.cache = cache
+        wrapper.centre = centre
+        wrapper.lookup = lookup
+        wrapper.prime = prime
+        return wrapper
+
+    return decorator
+
+
+def stats():
+    return {source: cache.stats() for source, cache in caches.items()}
+
+
+@metrics.register_collector
+def _collect():
+    counters = [
+        ("hits", "Lookups answered from memory."),
+        ("disk_hits", "Lookups answered from the SQLite store."),
+        ("misses", "Lookups that went to the upstream."),
+        ("evictions", "Entries dropped by the LRU bound."),
+        ("expirations", "Entries dropped after their TTL."),
+        ("coalesced", "Lookups that shared another request's in-flight upstream call."),
+        ("peer_hits", "Lookups answered by another worker's call under a cross-worker lease."),
+    ]
+    snapshot = stats()
+    families = [
+        (f"agrovision_cache_{key}", "counter", help,
+         [({"source": source}, values[key]) for source, values in snapshot.items()])
+        for key, help in counters
+    ]
+    families.append(("agrovision_cache_entries", "gauge", "Entries held in memory.",
+                     [({"source": source}, values["entries"]) for source, values in snapshot.items()]))
+    families.append(("agrovision_cache_disk_evictions", "counter",
+                     "Rows this worker dropped from the SQLite store by its row bound.",
+                     [({}, _disk.evictions)] if _disk is not None else []))
+    return families
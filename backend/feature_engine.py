@@ -0,0 +1,160 @@
+"""Concurrent feature gathering for the crop recommendation endpoints.
+
+Every upstream lookup (Earth Engine, SoilGrids, NASA POWER, OpenCage) is a
+blocking WAN round trip, so they are submitted to a shared thread pool and
+awaited against a per-source timeout and an overall deadline. Sources that
+fail, time out or return nothing are reported as degraded instead of failing
+the whole request. Each source's latency and outcome is recorded in metrics.
+
+Bulk-lane gathers (batch scoring, tile builds) run on a pool of their own,
+so a batch whose upstream calls are waiting on quota never holds the
+threads single-point requests need. Each source also waits for quota
+tokens no longer than its own limit, since a thread still blocked after
+``gather`` has given up on it cannot be cancelled.
+"""
+import asyncio
+import contextvars
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+import metrics
+import quota
+
+# Seconds each source may take, measured from submission
+DEFAULT_SOURCE_TIMEOUT = float(os.getenv("FEATURE_SOURCE_TIMEOUT", "6"))
+SOURCE_TIMEOUTS = {
+    "ndvi": float(os.getenv("NDVI_TIMEOUT", DEFAULT_SOURCE_TIMEOUT)),
+    "weather": float(os.getenv("WEATHER_TIMEOUT", DEFAULT_SOURCE_TIMEOUT)),
+    "soil": float(os.getenv("SOIL_TIMEOUT", DEFAULT_SOURCE_TIMEOUT)),
+    "state": float(os.getenv("STATE_TIMEOUT", "3")),
+}
+# Seconds the whole feature gathering step may take
+OVERALL_DEADLINE = float(os.getenv("FEATURE_DEADLINE", "8"))
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FEATURE_POOL_WORKERS", "16")),
+    thread_name_prefix="features",
+)
+_bulk_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FEATURE_BULK_POOL_WORKERS", "16")),
+    thread_name_prefix="features-bulk",
+)
+
+
+class GatherResult:
+    """Values keyed by source name plus the reason each degraded source failed."""
+
+    def __init__(self):
+        self.values = {}
+        self.degraded = {}
+        self.elapsed = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def finish(self, name, elapsed, value=None, outcome="ok"):
+        self.elapsed[name] = elapsed
+        if outcome == "ok":
+            self.values[name] = value
+            if value is None:
+                outcome = "unavailable"
+        if outcome != "ok":
+            self.degraded[name] = outcome
+        metrics.record(name, elapsed, outcome)
+
+
+def _timed(fn, started, finished, name, limit):
+    # Runs on the pool: the source's own completion time, not when gather got to it
+    try:
+        with quota.deadline(limit):
+            return fn()
+    finally:
+        finished[name] = time.monotonic() - started
+
+
+def _limit(name, started, deadline, timeouts):
+    return min(started + timeouts.get(name, DEFAULT_SOURCE_TIMEOUT), deadline)
+
+
+def deadline_from_now(seconds=None):
+    return time.monotonic() + (OVERALL_DEADLINE if seconds is None else seconds)
+
+
+def gather(sources, deadline=None, timeouts=None):
+    """Run ``{name: callable}`` concurrently and collect whatever finishes in time.
+
+    ``deadline`` is an absolute ``time.monotonic()`` value shared by every
+    source; ``timeouts`` overrides the per-source entries of SOURCE_TIMEOUTS.
+    """
+    if deadline is None:
+        deadline = deadline_from_now()
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+
+    started = time.monotonic()
+    finished = {}
+    executor = _bulk_executor if quota.current_lane() == quota.BULK else _executor
+    # Each source runs in a copy of the caller's context, so it keeps the request's quota lane
+    futures = {
+        name: executor.submit(contextvars.copy_context().run, _timed, fn, started, finished, name,
+                              _limit(name, started, deadline, timeouts))
+        for name, fn in sources.items()
+    }
+    result = GatherResult()
+
+    # Every future is already running, so waiting on them in order only costs
+    # as long as the slowest source within its own limit.
+    for name, future in futures.items():
+        limit = _limit(name, started, deadline, timeouts)
+        try:
+            value = future.result(timeout=max(0.0, limit - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            logging.warning(f"Feature source '{name}' timed out")
+            result.finish(name, time.monotonic() - started, outcome="timeout")
+        except Exception as e:
+            logging.error(f"Feature source '{name}' failed: {e}")
+            result.finish(name, finished.get(name, time.monotonic() - started), outcome="error")
+        else:
+            result.finish(name, finished[name], value)
+
+    return result
+
+
+async def gather_async(sources, deadline=None, timeouts=None):
+    """Async twin of ``gather`` for ``{name: coroutine function}``.
+
+    Sources that miss their limit are cancelled rather than left running.
+    """
+    if deadline is None:
+        deadline = deadline_from_now()
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+
+    started = time.monotonic()
+    finished = {}
+
+    async def timed(name, fn):
+        try:
+            with quota.deadline(_limit(name, started, deadline, timeouts)):
+                return await fn()
+        finally:
+            finished[name] = time.monotonic() - started
+
+    tasks = {name: asyncio.ensure_future(timed(name, fn)) for name, fn in sources.items()}
+    result = GatherResult()
+
+    for name, task in tasks.items():
+        limit = _limit(name, started, deadline, timeouts)
+        try:
+            value = await asyncio.wait_for(task, timeout=max(0.0, limit - time.monotonic()))
+        except asyncio.TimeoutError:
+            logging.warning(f"Feature source '{name}' timed out")
+            result.finish(name, time.monotonic() - started, outcome="timeout")
+        except Exception as e:
+            logging.error(f"Feature source '{name}' failed: {e}")
+            result.finish(name, finished.get(name, time.monotonic() - started), outcome="error")
+        else:
+            result.finish(name, finished[name], value)
+
+    return result
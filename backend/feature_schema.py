@@ -0,0 +1,204 @@
+"""Fixed-layout feature records and the model input schema.
+
+A FeatureRecord keeps one point's features in a float64 array laid out in
+FIELDS order, with NaN for a missing value. Many records stack into an
+``(n, len(FIELDS))`` matrix with the same layout. Every path that scores a
+point (a single request, a batch or the recommendation grid) goes from
+such a matrix to the model through ``FeatureSchema.select``. For a model
+trained on the FIELDS columns in order, that is a slice, so the model reads
+the record memory without a copy.
+
+The schema belongs to the model artifact. It comes from a
+``<artifact>.schema.json`` next to the ``.pkl``, or else from the
+estimator's ``feature_names_in_`` (the Crop_recommendation.csv column
+names). Only when neither exists is it assumed to be DEFAULT_COLUMNS.
+
+Missing values are imputed on whole matrices: soil from the state-wise
+defaults, then, optionally, any model column from its training-set median.
+"""
+import csv
+import functools
+import json
+import logging
+import os
+
+import numpy as np
+
+FIELDS = ("NDVI", "Soil pH", "Soil Nitrogen", "Temperature (°C)", "Humidity (%)", "Rainfall (mm)")
+INDEX = {name: i for i, name in enumerate(FIELDS)}
+# The model's columns unless its artifact says otherwise; the order it was trained on
+DEFAULT_COLUMNS = ("Soil pH", "Soil Nitrogen", "Temperature (°C)", "Humidity (%)", "Rainfall (mm)")
+# Crop_recommendation.csv columns used in training, by record field
+TRAINING_COLUMNS = {
+    "ph": "Soil pH",
+    "N": "Soil Nitrogen",
+    "temperature": "Temperature (°C)",
+    "humidity": "Humidity (%)",
+    "rainfall": "Rainfall (mm)",
+}
+TRAINING_DATA = os.getenv("TRAINING_DATA", os.path.join(os.path.dirname(os.path.abspath(__file__)), "Crop_recommendation.csv"))
+SOIL_FIELDS = ("Soil pH", "Soil Nitrogen")
+# The keys used for each soil field in the state-wise defaults
+SOIL_DEFAULT_KEYS = {"Soil pH": "pH", "Soil Nitrogen": "Nitrogen"}
+
+
+class FeatureRecord:
+    """One point's features in FIELDS order; NaN marks a missing value."""
+
+    __slots__ = ("values",)
+
+    def __init__(self, values=None):
+        self.values = np.full(len(FIELDS), np.nan) if values is None else np.asarray(values, dtype=np.float64)
+
+    @classmethod
+    def from_sources(cls, ndvi_value, soil, weather):
+        record = cls()
+        values = record.values
+        values[0] = np.nan if ndvi_value is None else ndvi_value
+        if soil:
+            values[1] = np.nan if soil.get("pH") is None else soil["pH"]
+            values[2] = np.nan if soil.get("Nitrogen") is None else soil["Nitrogen"]
+        if weather:
+            values[3] = np.nan if weather.get("temperature") is None else weather["temperature"]
+            values[4] = np.nan if weather.get("humidity") is None else weather["humidity"]
+            values[5] = np.nan if weather.get("rainfall") is None else weather["rainfall"]
+        return record
+
+    def get(self, name):
+        value = self.values[INDEX[name]]
+        return None if np.isnan(value) else float(value)
+
+    def matrix(self):
+        """The record as a 1-row matrix view."""
+        return self.values.reshape(1, -1)
+
+    def as_dict(self):
+        """The response form: field name to value, ``None`` where missing."""
+        return {name: None if np.isnan(value) else float(value) for name, value in zip(FIELDS, self.values.tolist())}
+
+    def __repr__(self):
+        return f"FeatureRecord({self.as_dict()})"
+
+
+class FeatureSchema:
+    """A model's input columns, as record fields in training order."""
+
+    def __init__(self, columns, source="default"):
+        unknown = [column for column in columns if column not in INDEX]
+        if unknown:
+            raise ValueError(f"Unknown feature columns {unknown}; expected some of {list(FIELDS)}")
+        self.columns = tuple(columns)
+        self.source = source
+        self.indices = np.array([INDEX[column] for column in self.columns])
+        start = int(self.indices[0])
+        contiguous = np.array_equal(self.indices, np.arange(start, start + len(self.indices)))
+        # A slice keeps the selection a view of the record memory
+        self._selector = slice(start, start + len(self.indices)) if contiguous else self.indices
+
+    def select(self, matrix):
+        """Model input for an ``(n, len(FIELDS))`` record matrix; a view when the columns are contiguous."""
+        return matrix[:, self._selector]
+
+    def complete(self, matrix):
+        """Mask of matrix rows with every model column present."""
+        return ~np.isnan(self.select(matrix)).any(axis=1)
+
+    def row(self, record):
+        """The 1-row model input for a record, or ``None`` if a model column is missing."""
+        row = self.select(record.matrix())
+        if np.isnan(row).any():
+            return None
+        return row
+
+    def describe(self):
+        return {"columns": list(self.columns), "source": self.source}
+
+
+def schema_path(artifact_path):
+    return f"{os.path.splitext(artifact_path)[0]}.schema.json"
+
+
+def _field_names(names):
+    return [TRAINING_COLUMNS.get(str(name), str(name)) for name in names]
+
+
+def schema_for(estimator, artifact_path):
+    """The input schema for a loaded artifact; raises ValueError if it cannot fit the model."""
+    path = schema_path(artifact_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            schema = FeatureSchema(_field_names(json.load(f)["columns"]), source=os.path.basename(path))
+    elif hasattr(estimator, "feature_names_in_"):
+        schema = FeatureSchema(_field_names(estimator.feature_names_in_), source="feature_names_in_")
+    else:
+        schema = FeatureSchema(DEFAULT_COLUMNS)
+
+    expected = getattr(estimator, "n_features_in_", None)
+    if expected is not None and expected != len(schema.columns):
+        raise ValueError(f"Schema from {schema.source} has {len(schema.columns)} columns, model expects {expected}")
+    return schema
+
+
+def write_schema(artifact_path, columns, **extra):
+    """Write the schema sidecar for an artifact, in training column names."""
+    training_names = {field: name for name, field in TRAINING_COLUMNS.items()}
+    with open(schema_path(artifact_path), "w") as f:
+        json.dump({"columns": [training_names.get(c, c) for c in columns], **extra}, f, indent=2)
+
+
+class RegionalDefaults:
+    """State-wise soil defaults as an array, for filling whole matrices at once."""
+
+    def __init__(self, defaults):
+        self.states = {state: code for code, state in enumerate(defaults)}
+        self.table = np.array(
+            [[values[SOIL_DEFAULT_KEYS[field]] for field in SOIL_FIELDS] for values in defaults.values()],
+            dtype=np.float64,
+        )
+        self.columns = np.array([INDEX[field] for field in SOIL_FIELDS])
+
+    def codes(self, states):
+        """Row into ``table`` per state name; -1 for unknown or missing states."""
+        return np.array([self.states.get(state, -1) for state in states], dtype=np.int64)
+
+    def fill(self, matrix, codes):
+        """Fill missing soil fields in place for rows with a known state; returns the rows changed."""
+        soil = matrix[:, self.columns]
+        rows, cols = np.nonzero(np.isnan(soil) & (codes >= 0)[:, None])
+        if len(rows):
+            soil[rows, cols] = self.table[codes[rows], cols]
+            matrix[:, self.columns] = soil
+        changed = np.zeros(len(matrix), dtype=bool)
+        changed[rows] = True
+        return changed
+
+
+@functools.lru_cache(maxsize=None)
+def training_medians(path=TRAINING_DATA):
+    """Per-field medians of the training set; fields not in the file are NaN."""
+    medians = np.full(len(FIELDS), np.nan)
+    try:
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    except OSError as e:
+        logging.error(f"Training medians unavailable, cannot read {path}: {e}")
+        return medians
+    for name, field in TRAINING_COLUMNS.items():
+        values = [float(row[name]) for row in rows if row.get(name) not in (None, "")]
+        if values:
+            medians[INDEX[field]] = np.median(values)
+    return medians
+
+
+def fill_medians(matrix, schema, medians=None):
+    """Fill missing model columns in place from the training medians; returns the rows changed."""
+    medians = training_medians() if medians is None else medians
+    columns = schema.indices
+    block = matrix[:, columns]
+    rows, cols = np.nonzero(np.isnan(block))
+    if len(rows):
+        block[rows, cols] = medians[columns][cols]
+        matrix[:, columns] = block
+    changed = np.zeros(len(matrix), dtype=bool)
+    changed[rows] = True
+    return changed
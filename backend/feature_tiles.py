@@ -0,0 +1,181 @@
+"""Precomputed feature grid over India served from a memory-mapped ``.npy`` file.
+
+A tile set is two files sharing a stem: ``<stem>.npy`` holds a float32 array
+of shape ``(bands, rows, cols)`` with NaN for cells that have no data, and
+``<stem>.json`` holds the bounding box, resolution and band names. Lookups are
+plain index arithmetic on the memory map, so they cost well under a
+millisecond and never touch the network.
+
+The service checks ``<stem>.json`` every FEATURE_TILES_CHECK_INTERVAL
+seconds. A rebuild replaces it last, so a changed file means a new tile set,
+which is opened and swapped in. Lookups in flight keep the old mapping.
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+CHECK_INTERVAL = float(os.getenv("FEATURE_TILES_CHECK_INTERVAL", "30"))
+
+# lat_min, lat_max, lon_min, lon_max covering the states in soil_default_values
+INDIA_BBOX = (6.0, 38.0, 68.0, 98.0)
+
+# Features that come from SoilGrids and NASA POWER, in model column order
+BANDS = ["Soil pH", "Soil Nitrogen", "Temperature (°C)", "Humidity (%)", "Rainfall (mm)"]
+
+
+class FeatureTiles:
+    def __init__(self, grid, meta):
+        self.grid = grid
+        self.meta = meta
+        self.bands = meta["bands"]
+        self.lat_min, self.lat_max, self.lon_min, self.lon_max = meta["bbox"]
+        self.resolution = meta["resolution"]
+        _, self.rows, self.cols = grid.shape
+
+    @classmethod
+    def open(cls, stem):
+        with open(f"{stem}.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported feature tile version in {stem}.json: {meta.get('version')}")
+        grid = np.load(f"{stem}.npy", mmap_mode="r")
+        return cls(grid, meta)
+
+    def index(self, lat, lon):
+        """Row/column of the cell containing the point, or ``None`` outside the grid."""
+        row = math.floor((lat - self.lat_min) / self.resolution)
+        col = math.floor((lon - self.lon_min) / self.resolution)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def lookup(self, lat, lon):
+        """Band values for the point; missing bands are ``None``, outside the grid is ``None``."""
+        cell = self.index(lat, lon)
+        if cell is None:
+            return None
+        values = self.grid[:, cell[0], cell[1]]
+        return {band: (None if np.isnan(v) else float(v)) for band, v in zip(self.bands, values)}
+
+    def lookup_many(self, lats, lons):
+        """Vectorized lookup returning ``(values, inside)``.
+
+        ``values`` has shape ``(n, bands)`` with NaN for missing or outside
+        points and ``inside`` flags points that fall on the grid.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        rows = np.floor((lats - self.lat_min) / self.resolution).astype(np.int64)
+        cols = np.floor((lons - self.lon_min) / self.resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        values = np.full((len(lats), len(self.bands)), np.nan, dtype=np.float32)
+        values[inside] = self.grid[:, rows[inside], cols[inside]].T
+        return values, inside
+
+    def cell_centres(self):
+        lats = self.lat_min + (np.arange(self.rows) + 0.5) * self.resolution
+        lons = self.lon_min + (np.arange(self.cols) + 0.5) * self.resolution
+        return lats, lons
+
+
+def grid_shape(bbox, resolution):
+    lat_min, lat_max, lon_min, lon_max = bbox
+    return math.ceil((lat_max - lat_min) / resolution), math.ceil((lon_max - lon_min) / resolution)
+
+
+def write_tiles(stem, grid, bbox, resolution, bands=BANDS, source="unknown", **extra):
+    """Write ``grid`` (bands, rows, cols) and its metadata, plus any ``extra`` fields, next to each other."""
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    grid = np.asarray(grid, dtype=np.float32)
+    if grid.shape != (len(bands), *grid_shape(bbox, resolution)):
+        raise ValueError(f"Grid shape {grid.shape} does not match bbox {bbox} at {resolution}°")
+
+    # Write to temporary names first so a running service never maps a half-written file
+    np.save(f"{stem}.tmp.npy", grid)
+    with open(f"{stem}.json.tmp", "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "bbox": list(bbox),
+            "resolution": resolution,
+            "bands": list(bands),
+            "source": source,
+            **extra,
+        }, f, indent=2, ensure_ascii=False)
+    os.replace(f"{stem}.tmp.npy", f"{stem}.npy")
+    os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+
+def synthetic_grid(bbox=INDIA_BBOX, resolution=0.25, seed=0):
+    """Smooth, plausible-looking feature fields for tests and benchmarks."""
+    rows, cols = grid_shape(bbox, resolution)
+    lat_min, _, lon_min, _ = bbox
+    lats = (lat_min + (np.arange(rows) + 0.5) * resolution)[:, None]
+    lons = (lon_min + (np.arange(cols) + 0.5) * resolution)[None, :]
+    noise = np.random.default_rng(seed).normal(size=(len(BANDS), rows, cols))
+
+    ph = 6.5 + 1.2 * np.sin(np.radians(lats * 7)) * np.cos(np.radians(lons * 5)) + 0.1 * noise[0]
+    nitrogen = 25 + 10 * np.cos(np.radians(lons * 9)) + 2 * noise[1]
+    temperature = 33 - 0.45 * (lats - lat_min) + 0.3 * noise[2]
+    humidity = 45 + 30 * np.exp(-((lons - 92) / 8) ** 2) + 15 * np.exp(-((lats - 10) / 6) ** 2) + noise[3]
+    rainfall = 30 * (1 + 3 * np.exp(-((lons - 92) / 6) ** 2) + 2 * np.exp(-((lats - 10) / 5) ** 2)) + noise[4]
+
+    return np.stack([
+        np.clip(ph, 3.5, 9.5),
+        np.clip(nitrogen, 0, None),
+        temperature,
+        np.clip(humidity, 5, 100),
+        np.clip(rainfall, 0, None),
+    ]).astype(np.float32)
+
+
+_tiles = None
+_signature = None
+_MISSING = "missing"
+_checked_at = -math.inf
+_tiles_lock = threading.Lock()
+
+
+def _file_signature(stem):
+    stat = os.stat(f"{stem}.json")
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_tiles():
+    """The tile set named by FEATURE_TILES, or ``None``; reopened when a rebuild replaces it."""
+    global _tiles, _signature, _checked_at
+    stem = os.getenv("FEATURE_TILES")
+    if not stem:
+        return None
+    if time.monotonic() - _checked_at < CHECK_INTERVAL:
+        return _tiles
+    with _tiles_lock:
+        if time.monotonic() - _checked_at < CHECK_INTERVAL:
+            return _tiles
+        _checked_at = time.monotonic()
+        try:
+            signature = _file_signature(stem)
+        except OSError as e:
+            if _signature != _MISSING:
+                logging.error(f"Feature tiles unavailable, cannot open {stem}: {e}")
+            # Keep serving whatever was mapped before
+            _signature = _MISSING
+            return _tiles
+        if signature == _signature:
+            return _tiles
+        # Recorded even when opening fails, so a bad file is retried once it changes
+        _signature = signature
+        try:
+            tiles = FeatureTiles.open(stem)
+        except (OSError, ValueError) as e:
+            logging.error(f"Feature tiles disabled, cannot open {stem}: {e}")
+            return _tiles
+        logging.info(f"{'Reloaded' if _tiles is not None else 'Loaded'} feature tiles from {stem} "
+                     f"({tiles.rows}x{tiles.cols} at {tiles.resolution}°)")
+        _tiles = tiles
+    return _tiles
@@ -0,0 +1,16 @@
+"""Gunicorn settings, picked up automatically from the working directory.
+
+PRELOAD_MODEL=1 imports the app (and loads the model and feature tiles) once
+in the master before forking, so every worker shares those pages
+copy-on-write instead of loading its own copy.
+"""
+import gc
+import os
+
+preload_app = os.getenv("PRELOAD_MODEL", "0") == "1"
+
+
+def when_ready(server):
+    if preload_app:
+        # Keep the collector from touching (and so copying) the preloaded objects
+        gc.freeze()
@@ -0,0 +1,203 @@
+"""Request timing spans and counters, exposed in the Prometheus text format.
+
+Instrumented code records into module-level Counter and Histogram objects,
+and ``render()`` produces the exposition text served on ``/metrics``.
+Counters that other modules already keep (feature cache, upstream clients,
+micro-batch queues) are read at scrape time by collectors instead of being
+counted twice.
+
+Each HTTP request also gets a RequestTimer in a context variable. ``record``
+adds a span to it, and the route's response carries them as a
+``Server-Timing`` header. Values are per process: under gunicorn with several
+workers, each scrape sees whichever worker answered it.
+"""
+import bisect
+import contextlib
+import contextvars
+import math
+import threading
+import time
+
+# Seconds; upstream calls run from milliseconds (cache, tiles) to the 8 s deadline
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 10000)
+
+
+def _label_key(names, labels):
+    return tuple(str(labels.get(name, "")) for name in names)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(self.labels, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield f"{self.name}_total", dict(zip(self.labels, key)), value
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label key -> [per-bucket counts (last is +Inf), sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_key(self.labels, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labels, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(float(bound))}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, count
+
+
+_metrics = []
+_collectors = []
+
+
+def register_collector(fn):
+    """Add ``fn() -> [(name, kind, help, [(labels, value), ...]), ...]``, called on every scrape.
+
+    Names follow the Counter class: a counter family is named without
+    ``_total`` and its samples get the suffix.
+    """
+    _collectors.append(fn)
+    return fn
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in _metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for collector in _collectors:
+        for name, kind, help, samples in collector():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            sample_name = f"{name}_total" if kind == Counter.kind else name
+            for labels, value in samples:
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_SECONDS = Histogram(
+    "agrovision_request_seconds", "HTTP request latency by route and status.", ("route", "status"))
+STAGE_SECONDS = Histogram(
+    "agrovision_stage_seconds", "Latency of one pipeline stage (feature source, lookup or inference).", ("stage",))
+SOURCE_OUTCOMES = Counter(
+    "agrovision_source_outcomes", "Feature source results: ok, timeout, error or unavailable.", ("source", "outcome"))
+FALLBACKS = Counter(
+    "agrovision_fallbacks", "Fallbacks taken when a primary source could not answer.", ("kind",))
+UPSTREAM_SECONDS = Histogram(
+    "agrovision_upstream_seconds", "HTTP upstream call latency including retries.", ("upstream", "outcome"))
+QUOTA_WAIT_SECONDS = Histogram(
+    "agrovision_quota_wait_seconds", "Time upstream calls waited for a quota token.", ("upstream", "lane", "outcome"))
+MICROBATCH_SIZE = Histogram(
+    "agrovision_microbatch_rows", "Rows per coalesced model prediction.", ("model",), SIZE_BUCKETS)
+BATCH_POINTS = Histogram(
+    "agrovision_batch_points", "Points per bulk scoring request.", (), SIZE_BUCKETS)
+
+
+class RequestTimer:
+    """Named spans of one request, in the order they were recorded."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add(self, name, seconds):
+        self.spans.append((name, seconds))
+
+    def server_timing(self):
+        spans = self.spans + [("total", time.perf_counter() - self.started)]
+        return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in spans)
+
+
+_current_timer = contextvars.ContextVar("request_timer", default=None)
+
+
+def start_request():
+    """Start timing the current request; replaces any timer left by the thread's last request."""
+    timer = RequestTimer()
+    _current_timer.set(timer)
+    return timer
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+def record(stage, seconds, outcome=None):
+    """Observe a stage's latency, plus its outcome for feature sources, and add it as a span."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if outcome is not None:
+        SOURCE_OUTCOMES.inc(source=stage, outcome=outcome)
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.add(stage, seconds)
+
+
+@contextlib.contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - started)
@@ -0,0 +1,209 @@
+"""Micro-batching in front of model inference.
+
+Concurrent request handlers each hold a single feature row, and a one-row
+``predict_proba`` is dominated by per-call overhead. A MicroBatcher collects
+rows from every handler thread for up to ``max_batch`` rows or ``max_wait``
+seconds after the first one arrived, runs one vectorized prediction and hands
+each caller its own row of the result.
+
+Enabled with MICROBATCH=1. It only helps when a worker serves requests
+concurrently (gthread workers or the ASGI entry point); a sync gunicorn
+worker never has two rows to combine.
+
+There is one batcher per model version. Once the registry stops serving a
+version (a hot reload replaced it), its batcher finishes the rows it holds
+and its thread exits.
+"""
+import asyncio
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+import model_registry
+
+ENABLED = os.getenv("MICROBATCH", "0") == "1"
+MAX_BATCH = int(os.getenv("MICROBATCH_MAX_ROWS", "64"))
+MAX_WAIT = float(os.getenv("MICROBATCH_MAX_WAIT_MS", "2")) / 1000
+MAX_QUEUE = int(os.getenv("MICROBATCH_MAX_QUEUE", "1024"))
+RESULT_TIMEOUT = float(os.getenv("MICROBATCH_RESULT_TIMEOUT", "5"))
+
+
+class MicroBatcher:
+    def __init__(self, predict_proba, name="model", max_batch=MAX_BATCH, max_wait=MAX_WAIT, max_queue=MAX_QUEUE):
+        self.predict_proba = predict_proba
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self._queue = queue.Queue()
+        self._thread = None
+        self.stopped = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.rows = 0
+        self.largest_batch = 0
+        self.total_wait = 0.0
+        self.overflows = 0
+        self.errors = 0
+
+    def submit(self, row):
+        """Queue one feature row; returns a Future of its probability vector.
+
+        Returns ``None`` when the queue is full or the batcher has stopped,
+        in which case the caller should predict directly rather than wait
+        behind the backlog.
+        """
+        if self._queue.qsize() >= self.max_queue:
+            with self._stats_lock:
+                self.overflows += 1
+            return None
+        future = Future()
+        with self._start_lock:
+            if self.stopped:
+                return None
+            self._ensure_running()
+            self._queue.put((np.asarray(row, dtype=float).reshape(-1), future, time.monotonic()))
+        return future
+
+    def stop(self):
+        """Predict the rows already queued, then end the worker thread."""
+        with self._start_lock:
+            self.stopped = True
+            if self._thread is not None and self._thread.is_alive():
+                self._queue.put(None)
+
+    def _ensure_running(self):
+        # Started lazily so a preloading gunicorn master never forks a live thread; called under _start_lock
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name=f"microbatch-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _collect(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = first[2] + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stopping: predict this batch, then take the marker again and exit
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                return
+            started = time.monotonic()
+            try:
+                proba = self.predict_proba(np.vstack([row for row, _, _ in batch]))
+            except Exception as e:
+                logging.error(f"Micro-batch prediction failed for {len(batch)} rows: {e}")
+                with self._stats_lock:
+                    self.errors += 1
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for i, (_, future, _) in enumerate(batch):
+                future.set_result(proba[i])
+            metrics.MICROBATCH_SIZE.observe(len(batch), model=self.name)
+            with self._stats_lock:
+                self.batches += 1
+                self.rows += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+                self.total_wait += sum(started - queued for _, _, queued in batch)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+                "max_queue": self.max_queue,
+                "queue_depth": self._queue.qsize(),
+                "batches": self.batches,
+                "rows": self.rows,
+                "mean_batch_size": self.rows / self.batches if self.batches else 0.0,
+                "largest_batch": self.largest_batch,
+                "mean_wait_ms": 1000 * self.total_wait / self.rows if self.rows else 0.0,
+                "overflows": self.overflows,
+                "errors": self.errors,
+            }
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def batcher_for(model):
+    """The batcher for this exact model version; a hot reload gets a fresh one."""
+    batcher = _batchers.get(model.id)
+    if batcher is None:
+        with _batchers_lock:
+            batcher = _batchers.get(model.id)
+            if batcher is None:
+                _retire(keep=model.id)
+                batcher = MicroBatcher(model.predict_proba, name=model.id)
+                _batchers[model.id] = batcher
+    return batcher
+
+
+def _retire(keep):
+    """Stop and drop the batchers of model versions the registry no longer serves."""
+    served = model_registry.registry.served() | {keep}
+    for model_id in [model_id for model_id in _batchers if model_id not in served]:
+        _batchers.pop(model_id).stop()
+        logging.info(f"Stopped micro-batcher for {model_id}, no longer served")
+
+
+def predict_proba_row(model, row):
+    """Probability vector for one feature row, coalesced with concurrent callers when enabled."""
+    with metrics.timed("inference"):
+        if ENABLED:
+            future = batcher_for(model).submit(row)
+            if future is not None:
+                return future.result(timeout=RESULT_TIMEOUT)
+        return model.predict_proba(np.asarray(row, dtype=float).reshape(1, -1))[0]
+
+
+async def predict_proba_row_async(model, row):
+    """``predict_proba_row`` for the event loop: waits on the batch without blocking it."""
+    with metrics.timed("inference"):
+        if ENABLED:
+            future = batcher_for(model).submit(row)
+            if future is not None:
+                return await asyncio.wait_for(asyncio.wrap_future(future), RESULT_TIMEOUT)
+        return model.predict_proba(np.asarray(row, dtype=float).reshape(1, -1))[0]
+
+
+def stats():
+    return {
+        "enabled": ENABLED,
+        "batchers": {model_id: batcher.stats() for model_id, batcher in list(_batchers.items())},
+    }
+
+
+@metrics.register_collector
+def _collect():
+    batchers = list(_batchers.items())
+    return [
+        ("agrovision_microbatch_queue_depth", "gauge", "Rows waiting for the next micro-batch.",
+         [({"model": model_id}, batcher.stats()["queue_depth"]) for model_id, batcher in batchers]),
+        ("agrovision_microbatch_overflows", "counter", "Rows predicted directly because the queue was full.",
+         [({"model": model_id}, batcher.stats()["overflows"]) for model_id, batcher in batchers]),
+    ]
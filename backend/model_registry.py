@@ -0,0 +1,202 @@
+"""Registry of joblib model artifacts with hot reload.
+
+Artifacts are ``<name>.pkl`` or ``<name>@<version>.pkl`` files in any of the
+MODEL_DIRS directories (e.g. ``LightGBM.pkl``, ``NaiveBayes.pkl``,
+``RandomForest@20261018T120000.pkl``). A model is requested as ``name`` (the
+newest version) or ``name:version``. Unversioned files are versioned by a
+hash of their contents.
+
+Each loaded model re-checks its file at most every MODEL_CHECK_INTERVAL
+seconds. A changed file is loaded in full and then swapped in with a single
+reference assignment, so in-flight requests finish on the old model and no
+worker restart is needed.
+"""
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import joblib
+import numpy as np
+
+import feature_schema
+from fast_predict import compile_estimator
+
+MODEL_DIRS = [d for d in os.getenv("MODEL_DIRS", ".,models").split(",") if d]
+DEFAULT_MODEL = os.getenv("MODEL_NAME", "LightGBM")
+CHECK_INTERVAL = float(os.getenv("MODEL_CHECK_INTERVAL", "2"))
+COMPILE = os.getenv("MODEL_COMPILE", "1") != "0"
+UNVERSIONED = ""
+
+
+class UnknownModelError(KeyError):
+    pass
+
+
+def file_digest(path):
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()[:12]
+
+
+class LoadedModel:
+    """An estimator plus its optional compiled evaluator, as of one file version."""
+
+    def __init__(self, name, version, path, estimator, stat, compile=True):
+        self.schema = feature_schema.schema_for(estimator, path)
+        self.name = name
+        self.version = version
+        self.path = path
+        self.estimator = estimator
+        self.stat = stat
+        self.compiled = compile_estimator(estimator) if compile else None
+        self.classes_ = estimator.classes_
+        self.loaded_at = time.time()
+
+    @property
+    def id(self):
+        return f"{self.name}:{self.version}"
+
+    def predict_proba(self, X):
+        if self.compiled is not None:
+            return self.compiled.predict_proba(X)
+        return self.estimator.predict_proba(X)
+
+    def predict(self, X):
+        if self.compiled is not None:
+            return self.classes_[np.argmax(self.compiled.predict_proba(X), axis=1)]
+        return self.estimator.predict(X)
+
+    def describe(self):
+        return {
+            "name": self.name,
+            "version": self.version,
+            "path": self.path,
+            "type": type(self.estimator).__name__,
+            "compiled": self.compiled is not None,
+            "classes": [str(c) for c in self.classes_],
+            "schema": self.schema.describe(),
+            "loaded_at": self.loaded_at,
+        }
+
+
+class _Slot:
+    """Holds the current LoadedModel for one artifact file."""
+
+    def __init__(self, name, version, path):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.model = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    def __init__(self, directories=MODEL_DIRS, default=DEFAULT_MODEL,
+                 check_interval=CHECK_INTERVAL, compile=COMPILE):
+        self.directories = directories
+        self.default = default
+        self.check_interval = check_interval
+        self.compile = compile
+        self._slots = {}
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+        self.reloads = 0
+
+    def _scan(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._scanned_at < self.check_interval:
+            return
+        with self._lock:
+            found = {}
+            for directory in self.directories:
+                for path in sorted(glob.glob(os.path.join(directory, "*.pkl"))):
+                    stem = os.path.basename(path)[:-len(".pkl")]
+                    name, _, version = stem.partition("@")
+                    found.setdefault((name, version), path)
+            # A fresh dict swapped in whole, so readers iterating the old one never see it change
+            self._slots = {key: self._slots.get(key) or _Slot(key[0], key[1], path) for key, path in found.items()}
+            self._scanned_at = now
+
+    def available(self):
+        self._scan()
+        return sorted(f"{name}:{version}" if version else name for name, version in self._slots)
+
+    def _resolve(self, spec):
+        name, _, version = (spec or self.default).partition(":")
+        self._scan()
+        slots = self._slots
+        versions = sorted(v for n, v in slots if n == name)
+        if not versions:
+            self._scan(force=True)
+            slots = self._slots
+            versions = sorted(v for n, v in slots if n == name)
+        if version:
+            if version in versions:
+                return slots[(name, version)]
+            # Unversioned files are addressed by their content hash
+            slot = slots.get((name, UNVERSIONED))
+            if slot is not None and self._current(slot, spec).version == version:
+                return slot
+            raise UnknownModelError(spec)
+        if not versions:
+            raise UnknownModelError(spec or self.default)
+        # Prefer the newest explicit version over a bare <name>.pkl
+        return slots[(name, versions[-1])]
+
+    def get(self, spec=None):
+        """The current model for ``spec`` (``name`` or ``name:version``); default if ``None``."""
+        return self._current(self._resolve(spec), spec)
+
+    def _current(self, slot, spec):
+        now = time.monotonic()
+        if slot.model is not None and now - slot.checked_at < self.check_interval:
+            return slot.model
+
+        with slot.lock:
+            if slot.model is not None and now - slot.checked_at < self.check_interval:
+                return slot.model
+            slot.checked_at = now
+            try:
+                stat = os.stat(slot.path)
+            except FileNotFoundError:
+                if slot.model is None:
+                    raise UnknownModelError(spec or self.default)
+                return slot.model
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if slot.model is None:
+                slot.model = self._load(slot, signature)
+            elif slot.model.stat != signature:
+                try:
+                    slot.model = self._load(slot, signature)
+                except Exception as e:
+                    # Probably caught mid-write; keep serving the old model and retry later
+                    logging.error(f"Failed to reload model {slot.path}, keeping {slot.model.id}: {e}")
+        return slot.model
+
+    def _load(self, slot, signature):
+        reloading = slot.model is not None
+        estimator = joblib.load(slot.path)
+        version = slot.version or file_digest(slot.path)
+        model = LoadedModel(slot.name, version, slot.path, estimator, signature, self.compile)
+        if reloading:
+            self.reloads += 1
+            logging.info(f"Reloaded model {model.id} from {slot.path}")
+        else:
+            logging.info(f"Loaded model {model.id} from {slot.path} (compiled: {model.compiled is not None})")
+        return model
+
+    def served(self):
+        """Ids of the models currently loaded; a replaced version drops out on reload."""
+        return {slot.model.id for slot in self._slots.values() if slot.model is not None}
+
+    def loaded(self):
+        return [slot.model.describe() for slot in list(self._slots.values()) if slot.model is not None]
+
+
+registry = ModelRegistry()
@@ -0,0 +1,362 @@
+"""Time-indexed NDVI store kept current by a background refresher.
+
+MODIS MOD13A1 composites cover 16-day periods starting on day 1, 17, ...,
+353 of each year. They are published some days after a period ends. The
+store is a SQLite file holding one row per (cell, period). Cells are the
+NDVI cache grid, and any cell a request has asked about is tracked.
+
+Requests read the newest stored value at once (stale-while-revalidate). If
+a newer composite should be out by now, the request wakes the refresher
+and is answered from the store anyway. Only a cell that has never been seen
+is fetched on the request path, once, for the newest composite.
+
+The refresher runs in each worker, but a lease in the store lets only one
+of them refresh at a time. Each run looks for tracked cells missing
+periods up to the newest published one. It fetches only those periods,
+each as one batched backend call. A period with no valid pixel is stored as
+NULL so it is not fetched again. The newest period is the exception and is
+retried after NDVI_EMPTY_RETRY_HOURS, since it may simply not be published
+yet.
+"""
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import feature_cache
+import metrics
+import ndvi
+import singleflight
+
+ENABLED = os.getenv("NDVI_STORE", "1") != "0"
+STORE_PATH = os.getenv("NDVI_STORE_PATH", "ndvi_store.sqlite3")
+PERIOD_DAYS = ndvi.COMPOSITE_DAYS
+# Days after a period ends before its composite is normally in Earth Engine
+PUBLISH_LAG_DAYS = int(os.getenv("NDVI_PUBLISH_LAG_DAYS", "10"))
+REFRESH_INTERVAL = float(os.getenv("NDVI_REFRESH_INTERVAL", "3600"))
+# Cells nobody has asked about for this long are no longer refreshed
+TRACK_DAYS = float(os.getenv("NDVI_TRACK_DAYS", "60"))
+# Most periods fetched for one cell in a run; a year of composites
+MAX_CATCHUP_PERIODS = int(os.getenv("NDVI_MAX_CATCHUP_PERIODS", "23"))
+EMPTY_RETRY = float(os.getenv("NDVI_EMPTY_RETRY_HOURS", "24")) * 3600
+# Seconds between last_queried writes for one cell
+TOUCH_INTERVAL = 3600
+LEASE_SECONDS = 600
+
+LAT_RES, LON_RES = feature_cache.SOURCE_CONFIG["ndvi"][:2]
+
+
+def period_start(day):
+    """Start date of the composite period containing ``day``."""
+    index = (day.timetuple().tm_yday - 1) // PERIOD_DAYS
+    return datetime.date(day.year, 1, 1) + datetime.timedelta(days=index * PERIOD_DAYS)
+
+
+def next_period(start):
+    following = start + datetime.timedelta(days=PERIOD_DAYS)
+    # The last period of a year is short; the next one starts on 1 January
+    return following if following.year == start.year else datetime.date(start.year + 1, 1, 1)
+
+
+def latest_available(today=None):
+    """Start of the newest composite expected to be published by ``today``."""
+    today = today or datetime.date.today()
+    return period_start(today - datetime.timedelta(days=PERIOD_DAYS + PUBLISH_LAG_DAYS))
+
+
+def missing_periods(newest, latest):
+    """Periods after ``newest`` (a date or None) up to ``latest``, at most MAX_CATCHUP_PERIODS of the newest."""
+    if newest is None:
+        return [latest]
+    periods = []
+    period = next_period(newest)
+    while period <= latest:
+        periods.append(period)
+        period = next_period(period)
+    return periods[-MAX_CATCHUP_PERIODS:]
+
+
+class NDVIStore:
+    """SQLite tables of tracked cells and their NDVI per composite period."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._touched = {}
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ndvi_cells ("
+            " row INTEGER NOT NULL, col INTEGER NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL,"
+            " last_queried REAL NOT NULL, PRIMARY KEY (row, col))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ndvi_values ("
+            " row INTEGER NOT NULL, col INTEGER NOT NULL, period TEXT NOT NULL, value REAL,"
+            " fetched_at REAL NOT NULL, PRIMARY KEY (row, col, period))"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS ndvi_leases ("
+            " name TEXT PRIMARY KEY, owner INTEGER NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        # sqlite3 connections must not cross threads or forked workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def touch(self, cell, centre):
+        """Mark the cell as queried, writing at most once per TOUCH_INTERVAL."""
+        now = time.time()
+        if now - self._touched.get(cell, 0.0) < TOUCH_INTERVAL:
+            return
+        if len(self._touched) > 100000:
+            self._touched.clear()
+        self._touched[cell] = now
+        self._conn().execute(
+            "INSERT INTO ndvi_cells VALUES (?, ?, ?, ?, ?)"
+            " ON CONFLICT (row, col) DO UPDATE SET last_queried = excluded.last_queried",
+            (*cell, *centre, now),
+        )
+
+    def latest(self, cell):
+        """``(value, newest_period)``: the newest non-NULL value and the newest stored period."""
+        rows = self._conn().execute(
+            "SELECT period, value FROM ndvi_values WHERE row = ? AND col = ? ORDER BY period DESC LIMIT ?",
+            (*cell, MAX_CATCHUP_PERIODS),
+        ).fetchall()
+        if not rows:
+            return None, None
+        value = next((value for _, value in rows if value is not None), None)
+        return value, datetime.date.fromisoformat(rows[0][0])
+
+    def put(self, period, cells, values):
+        now = time.time()
+        self._conn().executemany(
+            "INSERT OR REPLACE INTO ndvi_values VALUES (?, ?, ?, ?, ?)",
+            [(*cell, period.isoformat(), value, now) for cell, value in zip(cells, values)],
+        )
+
+    def due(self, latest):
+        """``{period: [(cell, centre), ...]}`` still to fetch for every tracked cell."""
+        now = time.time()
+        rows = self._conn().execute(
+            "SELECT c.row, c.col, c.lat, c.lon, v.period, v.value, v.fetched_at FROM ndvi_cells c"
+            " LEFT JOIN ndvi_values v ON v.row = c.row AND v.col = c.col AND v.period ="
+            " (SELECT MAX(period) FROM ndvi_values WHERE row = c.row AND col = c.col)"
+            " WHERE c.last_queried >= ?",
+            (now - TRACK_DAYS * 86400,),
+        ).fetchall()
+        due = {}
+        for row, col, lat, lon, period, value, fetched_at in rows:
+            newest = datetime.date.fromisoformat(period) if period else None
+            periods = missing_periods(newest, latest)
+            if newest == latest and value is None and fetched_at < now - EMPTY_RETRY:
+                periods = [latest]
+            for missing in periods:
+                due.setdefault(missing, []).append(((row, col), (lat, lon)))
+        return due
+
+    def acquire_lease(self, name, seconds):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM ndvi_leases WHERE name = ? AND expires < ?", (name, now))
+        cursor = conn.execute("INSERT OR IGNORE INTO ndvi_leases VALUES (?, ?, ?)", (name, os.getpid(), now + seconds))
+        return cursor.rowcount == 1
+
+    def release_lease(self, name):
+        self._conn().execute("DELETE FROM ndvi_leases WHERE name = ? AND owner = ?", (name, os.getpid()))
+
+    def counts(self):
+        conn = self._conn()
+        return {
+            "tracked_cells": conn.execute("SELECT COUNT(*) FROM ndvi_cells").fetchone()[0],
+            "stored_values": conn.execute("SELECT COUNT(*) FROM ndvi_values").fetchone()[0],
+        }
+
+
+class Refresher:
+    """Background thread fetching missing composites for tracked cells."""
+
+    def __init__(self, store, interval=REFRESH_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.runs = 0
+        self.fetched = 0
+        self.errors = 0
+        self.last_run = None
+
+    def schedule(self):
+        """Ask for a refresh soon; returns at once."""
+        self._ensure_running()
+        self._wake.set()
+
+    def _ensure_running(self):
+        # Threads do not survive gunicorn's fork, so check per process
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="ndvi-refresher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.exception(f"NDVI refresh failed: {e}")
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def refresh(self, today=None):
+        """Fetch every due period once; returns the number of cell values written."""
+        try:
+            if not self.store.acquire_lease("refresh", LEASE_SECONDS):
+                return 0
+        except sqlite3.Error as e:
+            logging.error(f"NDVI refresh lease failed: {e}")
+            return 0
+        written = 0
+        try:
+            backend = ndvi.get_backend()
+            for period, cells in sorted(self.store.due(latest_available(today)).items()):
+                try:
+                    values = backend.points([centre for _, centre in cells], period.isoformat())
+                except Exception as e:
+                    self.errors += 1
+                    logging.error(f"NDVI refresh for {period} failed, retrying next run: {e}")
+                    continue
+                self.store.put(period, [cell for cell, _ in cells], values)
+                written += len(cells)
+            if written:
+                logging.info(f"NDVI refresh wrote {written} cell values")
+        finally:
+            self.store.release_lease("refresh")
+            self.runs += 1
+            self.fetched += written
+            self.last_run = time.time()
+        return written
+
+
+_store = None
+_refresher = None
+_failed = False
+_init_lock = threading.Lock()
+_flights = singleflight.Group()
+
+
+def get_refresher():
+    """The process's Refresher over the store at NDVI_STORE_PATH, or ``None`` if it cannot open."""
+    global _store, _refresher, _failed
+    if _refresher is None and not _failed:
+        with _init_lock:
+            if _refresher is None and not _failed:
+                try:
+                    _store = NDVIStore(STORE_PATH)
+                    _refresher = Refresher(_store)
+                except sqlite3.Error as e:
+                    logging.error(f"NDVI store disabled, cannot open {STORE_PATH}: {e}")
+                    _failed = True
+    return _refresher
+
+
+def cell_of(lat, lon):
+    return feature_cache.snap(lat, lon, LAT_RES, LON_RES)
+
+
+def _fetch_now(cell, centre, period):
+    value = ndvi.get_backend().point(*centre, period.isoformat())
+    _store.put(period, [cell], [value])
+    return value
+
+
+def current(lat, lon):
+    """The newest stored NDVI for the point, refreshing in the background when stale.
+
+    Only a cell with nothing stored is fetched on the caller's thread.
+    """
+    refresher = get_refresher()
+    if refresher is None:
+        return None
+    cell, centre = cell_of(lat, lon)
+    latest = latest_available()
+    try:
+        _store.touch(cell, centre)
+        value, newest = _store.latest(cell)
+    except sqlite3.Error as e:
+        logging.error(f"NDVI store read failed: {e}")
+        return None
+    if newest is None:
+        return _flights.do(cell, lambda: _fetch_now(cell, centre, latest))
+    if newest < latest:
+        refresher.schedule()
+    return value
+
+
+def prefetch(coords):
+    """Track many points and fetch cells never seen before with one batched call."""
+    refresher = get_refresher()
+    if refresher is None:
+        return
+    latest = latest_available()
+    cold = {}
+    stale = False
+    try:
+        for lat, lon in coords:
+            cell, centre = cell_of(lat, lon)
+            _store.touch(cell, centre)
+            _, newest = _store.latest(cell)
+            if newest is None:
+                cold[cell] = centre
+            elif newest < latest:
+                stale = True
+    except sqlite3.Error as e:
+        logging.error(f"NDVI store read failed: {e}")
+        return
+    if cold:
+        try:
+            values = ndvi.get_backend().points(list(cold.values()), latest.isoformat())
+            _store.put(latest, list(cold), values)
+        except Exception as e:
+            logging.error(f"Batched NDVI prefetch failed: {e}")
+    if stale:
+        refresher.schedule()
+
+
+def stats():
+    if _refresher is None:
+        return {"enabled": ENABLED, "open": False}
+    return {
+        "enabled": ENABLED,
+        "open": True,
+        "latest_available": latest_available().isoformat(),
+        "refresh_runs": _refresher.runs,
+        "refresh_values": _refresher.fetched,
+        "refresh_errors": _refresher.errors,
+        "last_refresh": _refresher.last_run,
+        **_store.counts(),
+    }
+
+
+@metrics.register_collector
+def _collect():
+    if _refresher is None:
+        return []
+    return [
+        ("agrovision_ndvi_refresh_runs", "counter", "Background NDVI refresh runs in this worker.",
+         [({}, _refresher.runs)]),
+        ("agrovision_ndvi_refresh_values", "counter", "Cell values written by the NDVI refresher.",
+         [({}, _refresher.fetched)]),
+        ("agrovision_ndvi_refresh_errors", "counter", "Composite periods whose refresh call failed.",
+         [({}, _refresher.errors)]),
+    ]
@@ -0,0 +1,317 @@
+"""Upstream request quotas shared by every worker on the host.
+
+Each upstream with a configured rate has a token bucket: ``rate`` tokens a
+second, up to ``burst`` held at once, and one token per HTTP attempt. The
+bucket lives in a SQLite file (UPSTREAM_QUOTA_PATH), so all gunicorn
+workers, the ASGI server and offline builds draw on the same quota instead
+of each assuming it has the provider to itself.
+
+Calls are made in a lane. ``interactive`` is the default, used by the
+single-point recommendation routes. ``bulk`` is for batch scoring and tile
+builds, and is set with ``with quota.lane(quota.BULK):``. A bulk call only
+takes a token when no interactive call is waiting and the bucket would
+still hold its reserve (QUOTA_BULK_RESERVE of the burst) afterwards. While
+a farmer's request waits, the next token goes to it. A call that cannot get
+a token within its lane's wait limit is refused, and so is one whose caller
+set an earlier deadline with ``quota.deadline(...)``: the feature engine
+gives each source its own, so a call never waits on a token after its
+request has stopped waiting on it. upstream then raises QuotaExceededError,
+an UpstreamError, so callers take their usual fallback path. The time spent
+waiting and the calls refused are counted per upstream and lane.
+"""
+import asyncio
+import contextlib
+import contextvars
+import itertools
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+ENABLED = os.getenv("UPSTREAM_QUOTA", "1") != "0"
+STORE_PATH = os.getenv("UPSTREAM_QUOTA_PATH", "upstream_quota.sqlite3")
+# Share of the burst that bulk calls leave for interactive ones
+BULK_RESERVE = float(os.getenv("QUOTA_BULK_RESERVE", "0.5"))
+POLL_SECONDS = 0.02
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Seconds a call in each lane may wait for a token before it is rejected
+MAX_WAIT = {
+    INTERACTIVE: float(os.getenv("QUOTA_INTERACTIVE_WAIT", "1")),
+    BULK: float(os.getenv("QUOTA_BULK_WAIT", "60")),
+}
+
+_lane = contextvars.ContextVar("upstream_lane", default=INTERACTIVE)
+_deadline = contextvars.ContextVar("quota_deadline", default=None)
+_waiter_ids = itertools.count()
+
+
+@contextlib.contextmanager
+def lane(name):
+    """Run the upstream calls made inside the block in lane ``name``."""
+    if name not in MAX_WAIT:
+        raise ValueError(f"Unknown quota lane {name!r}; expected one of {list(MAX_WAIT)}")
+    token = _lane.set(name)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def current_lane():
+    return _lane.get()
+
+
+@contextlib.contextmanager
+def deadline(when):
+    """Stop waiting for tokens at ``when``, a ``time.monotonic()`` value, inside the block."""
+    token = _deadline.set(when)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def _give_up_at(lane_name, started):
+    limit = started + MAX_WAIT[lane_name]
+    caller = _deadline.get()
+    return limit if caller is None else min(limit, caller)
+
+
+class _Store:
+    """Token buckets and waiting interactive callers, in SQLite."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS quota_buckets ("
+            " upstream TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS quota_waiters ("
+            " upstream TEXT NOT NULL, waiter TEXT NOT NULL, expires REAL NOT NULL,"
+            " PRIMARY KEY (upstream, waiter))"
+        )
+
+    def _conn(self):
+        # sqlite3 connections must not cross threads or forked workers
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, upstream, rate, burst, reserve=0.0, yield_to_waiters=False):
+        """Take one token if it leaves ``reserve`` behind; ``(taken, tokens left)``."""
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT tokens, updated FROM quota_buckets WHERE upstream = ?", (upstream,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            taken = tokens >= 1 + reserve
+            if taken and yield_to_waiters:
+                taken = conn.execute(
+                    "SELECT 1 FROM quota_waiters WHERE upstream = ? AND expires >= ? LIMIT 1", (upstream, now)
+                ).fetchone() is None
+            if taken:
+                tokens -= 1
+            conn.execute("INSERT OR REPLACE INTO quota_buckets VALUES (?, ?, ?)", (upstream, tokens, now))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return taken, tokens
+
+    def drain(self, upstream, seconds=0.0, rate=0.0):
+        """Empty the bucket, owing ``seconds`` of refill, after the provider itself said 429."""
+        self._conn().execute(
+            "INSERT OR REPLACE INTO quota_buckets VALUES (?, ?, ?)", (upstream, -seconds * rate, time.time())
+        )
+
+    def tokens(self, upstream, rate, burst):
+        row = self._conn().execute(
+            "SELECT tokens, updated FROM quota_buckets WHERE upstream = ?", (upstream,)
+        ).fetchone()
+        if row is None:
+            return burst
+        return min(burst, row[0] + max(0.0, time.time() - row[1]) * rate)
+
+    def wait(self, upstream, waiter, seconds):
+        self._conn().execute("INSERT OR REPLACE INTO quota_waiters VALUES (?, ?, ?)",
+                             (upstream, waiter, time.time() + seconds))
+
+    def done_waiting(self, upstream, waiter):
+        self._conn().execute("DELETE FROM quota_waiters WHERE upstream = ? AND waiter = ?", (upstream, waiter))
+
+    def waiting(self, upstream):
+        row = self._conn().execute(
+            "SELECT COUNT(*) FROM quota_waiters WHERE upstream = ? AND expires >= ?", (upstream, time.time())
+        ).fetchone()
+        return row[0]
+
+    def purge_expired(self):
+        self._conn().execute("DELETE FROM quota_waiters WHERE expires < ?", (time.time(),))
+
+
+_store = None
+_store_failed = False
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The shared quota store, or ``None`` if quotas are off or it cannot open."""
+    global _store, _store_failed
+    if _store is not None or _store_failed or not ENABLED:
+        return _store
+    with _store_lock:
+        if _store is None and not _store_failed:
+            try:
+                _store = _Store(STORE_PATH)
+                _store.purge_expired()
+            except sqlite3.Error as e:
+                logging.error(f"Upstream quotas disabled, cannot open {STORE_PATH}: {e}")
+                _store_failed = True
+    return _store
+
+
+class Quota:
+    """One upstream's token bucket, as seen from this process."""
+
+    def __init__(self, name, rate=0.0, burst=1):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        # Tokens bulk calls leave in the bucket; at most burst - 1 so bulk can still run
+        self.reserve = min(math.floor(self.burst * BULK_RESERVE), self.burst - 1)
+        self.granted = {lane_name: 0 for lane_name in MAX_WAIT}
+        self.rejected = {lane_name: 0 for lane_name in MAX_WAIT}
+        self.waited = {lane_name: 0.0 for lane_name in MAX_WAIT}
+
+    @property
+    def limited(self):
+        return self.rate > 0 and get_store() is not None
+
+    def _try(self, lane_name):
+        """``(taken, seconds until worth retrying)``; fails open if the store errors."""
+        bulk = lane_name == BULK
+        reserve = self.reserve if bulk else 0.0
+        try:
+            taken, tokens = get_store().take(self.name, self.rate, self.burst, reserve, yield_to_waiters=bulk)
+        except sqlite3.Error as e:
+            logging.error(f"Quota check for '{self.name}' failed, letting the call through: {e}")
+            return True, 0.0
+        return taken, max(POLL_SECONDS, (1 + reserve - tokens) / self.rate)
+
+    def _finish(self, lane_name, started, taken):
+        waited = time.monotonic() - started
+        self.waited[lane_name] += waited
+        metrics.QUOTA_WAIT_SECONDS.observe(waited, upstream=self.name, lane=lane_name,
+                                           outcome="granted" if taken else "rejected")
+        if taken:
+            self.granted[lane_name] += 1
+        else:
+            self.rejected[lane_name] += 1
+        return taken
+
+    def _start_waiting(self, lane_name, max_wait):
+        """Register an interactive waiter so bulk calls hold back; its id, or None."""
+        if lane_name != INTERACTIVE:
+            return None
+        waiter = f"{os.getpid()}:{next(_waiter_ids)}"
+        try:
+            get_store().wait(self.name, waiter, max_wait + 1)
+        except sqlite3.Error:
+            pass
+        return waiter
+
+    def _stop_waiting(self, waiter):
+        if waiter is None:
+            return
+        try:
+            get_store().done_waiting(self.name, waiter)
+        except sqlite3.Error:
+            pass
+
+    @contextlib.contextmanager
+    def _waiting(self, lane_name, max_wait):
+        waiter = self._start_waiting(lane_name, max_wait)
+        try:
+            yield
+        finally:
+            self._stop_waiting(waiter)
+
+    def acquire(self):
+        """Block until a token is taken in the current lane; False if its wait limit or deadline passes first."""
+        if not self.limited:
+            return True
+        lane_name = current_lane()
+        started = time.monotonic()
+        taken, retry = self._try(lane_name)
+        if not taken:
+            give_up = _give_up_at(lane_name, started)
+            with self._waiting(lane_name, give_up - started):
+                while not taken and time.monotonic() < give_up:
+                    time.sleep(min(retry, max(0.0, give_up - time.monotonic())))
+                    taken, retry = self._try(lane_name)
+        return self._finish(lane_name, started, taken)
+
+    async def acquire_async(self):
+        """Async twin of ``acquire``; waits without blocking the event loop.
+
+        Every store call runs on a worker thread, since ``BEGIN IMMEDIATE``
+        may wait up to the connection's busy timeout for other workers.
+        """
+        if not self.limited:
+            return True
+        lane_name = current_lane()
+        started = time.monotonic()
+        taken, retry = await asyncio.to_thread(self._try, lane_name)
+        if not taken:
+            give_up = _give_up_at(lane_name, started)
+            waiter = await asyncio.to_thread(self._start_waiting, lane_name, give_up - started)
+            try:
+                while not taken and time.monotonic() < give_up:
+                    await asyncio.sleep(min(retry, max(0.0, give_up - time.monotonic())))
+                    taken, retry = await asyncio.to_thread(self._try, lane_name)
+            finally:
+                await asyncio.to_thread(self._stop_waiting, waiter)
+        return self._finish(lane_name, started, taken)
+
+    def throttled(self, retry_after=None):
+        """The provider answered 429: empty the shared bucket so no worker sends until it refills."""
+        if not self.limited:
+            return
+        try:
+            get_store().drain(self.name, retry_after or 0.0, self.rate)
+        except sqlite3.Error as e:
+            logging.error(f"Could not drain quota for '{self.name}': {e}")
+
+    def status(self):
+        if not self.limited:
+            return {"limited": False}
+        try:
+            tokens = round(get_store().tokens(self.name, self.rate, self.burst), 3)
+            waiting = get_store().waiting(self.name)
+        except sqlite3.Error:
+            tokens = waiting = None
+        return {
+            "limited": True,
+            "rate_per_second": self.rate,
+            "burst": self.burst,
+            "bulk_reserve": self.reserve,
+            "tokens": tokens,
+            "interactive_waiting": waiting,
+            "granted": dict(self.granted),
+            "rejected": dict(self.rejected),
+            "wait_seconds": {lane_name: round(seconds, 3) for lane_name, seconds in self.waited.items()},
+        }
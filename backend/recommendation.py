@@ -0,0 +1,149 @@
+"""One recommendation pipeline behind the single-point routes.
+
+A request runs the same stages whichever response it asks for: gather the
+features, build the model row, and predict the full probability vector once.
+The response shapes (the best crop, or the top ``k``) are rendered from that
+one Prediction, so /get-crop-recommendation and /get-top-3-crops?k=N share
+all of the work.
+
+Predictions made from a complete set of live features are cached in the
+feature cache's "response" bucket, keyed by the finest feature cell, model
+version, date and weather window. A repeat request for the same field skips every upstream
+and the model. Responses carry an ETag of their body. A client that sends it
+back in If-None-Match gets a 304 until the features or the model change.
+"""
+import hashlib
+import json
+
+import numpy as np
+
+import batch
+import feature_cache
+import feature_schema
+import metrics
+
+_responses = feature_cache.caches["response"]
+
+
+class FeaturesUnavailable(Exception):
+    """Raised when the gathered features are too incomplete to build a model row."""
+
+    def __init__(self, features, degraded):
+        super().__init__("Failed to fetch crop features")
+        self.features = features
+        self.degraded = degraded
+
+
+class Prediction:
+    """A FeatureRecord and the model's full probability vector for it."""
+
+    def __init__(self, features, degraded, probabilities, model, cached=False):
+        self.features = features
+        self.degraded = degraded
+        self.probabilities = np.asarray(probabilities, dtype=float)
+        self.model = model
+        self.cached = cached
+
+    @property
+    def complete(self):
+        """True when no source degraded, so the result can be cached and tagged."""
+        return not self.degraded
+
+
+def parse_query(args):
+    """``(lat, lon, k)`` from the query string; ValueError with a client-facing message."""
+    lat, lon = batch.parse_coords(args.get('lat'), args.get('lon'))
+    try:
+        k = int(args.get('k', 3))
+    except ValueError:
+        raise ValueError("k must be an integer")
+    if k < 1:
+        raise ValueError("k must be positive")
+    return lat, lon, k
+
+
+def cache_key(lat, lon, model, date, window=None):
+    row, col = feature_cache.finest_cell(lat, lon)
+    key = f"{row}:{col}:{model.id}:{date or 'latest'}"
+    if window is not None:
+        key += f":{window[0]}..{window[1]}"
+    return key
+
+
+def lookup(lat, lon, model, date, window=None):
+    """The cached Prediction for the point's cell under this model version, or None."""
+    if not feature_cache.CACHE_ENABLED:
+        return None
+    with metrics.timed("response_cache"):
+        entry = _responses.get(cache_key(lat, lon, model, date, window))
+    return _cached_prediction(entry, model)
+
+
+async def lookup_async(lat, lon, model, date, window=None):
+    """``lookup`` for the event loop; a memory miss reads the shared store on a thread."""
+    if not feature_cache.CACHE_ENABLED:
+        return None
+    with metrics.timed("response_cache"):
+        entry = await _responses.get_async(cache_key(lat, lon, model, date, window))
+    return _cached_prediction(entry, model)
+
+
+def _cached_prediction(entry, model):
+    # Entries written before the record layout are treated as misses
+    if entry is None or "record" not in entry:
+        return None
+    return Prediction(feature_schema.FeatureRecord(entry["record"]), [], entry["probabilities"], model, cached=True)
+
+
+def store(lat, lon, date, prediction, window=None):
+    """Cache a complete prediction; degraded ones are recomputed on the next request."""
+    if not feature_cache.CACHE_ENABLED or not prediction.complete:
+        return
+    _responses.put(cache_key(lat, lon, prediction.model, date, window), _entry(prediction))
+
+
+async def store_async(lat, lon, date, prediction, window=None):
+    """``store`` for the event loop; the shared store is written on a thread."""
+    if not feature_cache.CACHE_ENABLED or not prediction.complete:
+        return
+    await _responses.put_async(cache_key(lat, lon, prediction.model, date, window), _entry(prediction))
+
+
+def _entry(prediction):
+    return {
+        # NaN is not valid JSON; missing fields go through as null
+        "record": [None if np.isnan(value) else value for value in prediction.features.values.tolist()],
+        "probabilities": prediction.probabilities.tolist(),
+    }
+
+
+def recommendation_result(prediction, k=1):
+    """The single-crop response; ``k`` is accepted so every shape has one signature."""
+    result = prediction.features.as_dict()
+    result["Recommended Crop"] = str(prediction.model.classes_[np.argmax(prediction.probabilities)])
+    result["Model"] = prediction.model.id
+    result["Degraded Sources"] = prediction.degraded
+    return result
+
+
+def top_k_result(prediction, k=3):
+    classes = prediction.model.classes_
+    k = min(k, len(classes))
+    return {
+        **prediction.features.as_dict(),
+        f"Top {k} Crops": batch.top_k(prediction.probabilities.reshape(1, -1), classes, k)[0],
+        "Degraded Sources": prediction.degraded,
+        "Model": prediction.model.id
+    }
+
+
+def etag(body):
+    """Strong validator for a JSON response body."""
+    return hashlib.sha1(json.dumps(body, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/").strip('"') == tag for candidate in candidates)
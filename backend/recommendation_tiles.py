@@ -0,0 +1,243 @@
+"""Precomputed crop recommendations over the feature grid, sliced into map tiles.
+
+build_recommendation_tiles.py scores every cell of a feature tile set in
+vectorized chunks and writes three files sharing a stem:
+
+- ``<stem>.crops.npy``: uint8 ``(k, rows, cols)`` class indices, best first,
+  with NO_DATA where the cell has no complete features.
+- ``<stem>.proba.npy``: uint8 ``(k, rows, cols)`` probabilities in 1/255 steps.
+- ``<stem>.json``: bounding box, resolution, class names, model id and build time.
+
+Both arrays are memory-mapped. ``/tiles/{z}/{x}/{y}`` serves a Web Mercator
+(XYZ) tile of the grid. ``.png`` is a 256 px raster coloured by best crop,
+with alpha following its probability. ``.json`` (the default) is the
+underlying cells with their top-k classes. Rendered tiles are kept in an LRU,
+and responses carry an ETag derived from the grid version.
+
+As with the feature tiles, the service checks ``<stem>.json`` every
+RECOMMENDATION_TILES_CHECK_INTERVAL seconds and reopens the grid when a
+rebuild has replaced it, so a new grid is served without a restart.
+"""
+import colorsys
+import functools
+import hashlib
+import json
+import logging
+import math
+import os
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+FORMAT_VERSION = 1
+NO_DATA = 255
+TILE_SIZE = 256
+MAX_ZOOM = int(os.getenv("RECOMMENDATION_TILES_MAX_ZOOM", "14"))
+# Cells per axis in a JSON tile; low zooms are subsampled down to this
+MAX_JSON_CELLS = int(os.getenv("RECOMMENDATION_TILES_JSON_CELLS", "64"))
+RENDER_CACHE_SIZE = int(os.getenv("RECOMMENDATION_TILES_CACHE", "2048"))
+# Cache-Control max-age for served tiles; a rebuilt grid gets new ETags anyway
+MAX_AGE = int(os.getenv("RECOMMENDATION_TILES_MAX_AGE", "86400"))
+# Seconds between checks for a rebuilt grid
+CHECK_INTERVAL = float(os.getenv("RECOMMENDATION_TILES_CHECK_INTERVAL", "30"))
+
+
+def tile_bounds(z, x, y):
+    """``(lat_min, lat_max, lon_min, lon_max)`` of an XYZ tile."""
+    n = 2 ** z
+    lon_min = x / n * 360.0 - 180.0
+    lon_max = (x + 1) / n * 360.0 - 180.0
+    lat_max = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    lat_min = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return lat_min, lat_max, lon_min, lon_max
+
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+
+def palette(count):
+    """A stable, well-spread RGB colour per class index."""
+    colours = []
+    for i in range(count):
+        # Golden-ratio hue steps keep neighbouring class indices apart
+        hue = (i * 0.618033988749895) % 1.0
+        r, g, b = colorsys.hsv_to_rgb(hue, 0.65 if i % 2 else 0.85, 0.95 if i % 3 else 0.75)
+        colours.append((round(r * 255), round(g * 255), round(b * 255)))
+    return np.array(colours, dtype=np.uint8)
+
+
+def encode_png(rgba):
+    """Minimal RGBA PNG encoder for an ``(h, w, 4)`` uint8 array."""
+    height, width, _ = rgba.shape
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)]).tobytes()
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(raw, 6)) + chunk(b"IEND", b"")
+
+
+class RecommendationGrid:
+    def __init__(self, crops, proba, meta):
+        self.crops = crops
+        self.proba = proba
+        self.meta = meta
+        self.classes = meta["classes"]
+        self.k = crops.shape[0]
+        self.lat_min, self.lat_max, self.lon_min, self.lon_max = meta["bbox"]
+        self.resolution = meta["resolution"]
+        _, self.rows, self.cols = crops.shape
+        self.version = hashlib.sha1(json.dumps(meta, sort_keys=True).encode()).hexdigest()[:12]
+        self.colours = palette(len(self.classes))
+
+    @classmethod
+    def open(cls, stem):
+        with open(f"{stem}.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported recommendation tile version in {stem}.json: {meta.get('version')}")
+        crops = np.load(f"{stem}.crops.npy", mmap_mode="r")
+        proba = np.load(f"{stem}.proba.npy", mmap_mode="r")
+        return cls(crops, proba, meta)
+
+    def cells(self, lats, lons):
+        """Row/column arrays for the points plus a mask of points on the grid."""
+        rows = np.floor((np.asarray(lats) - self.lat_min) / self.resolution).astype(np.int64)
+        cols = np.floor((np.asarray(lons) - self.lon_min) / self.resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        return np.where(inside, rows, 0), np.where(inside, cols, 0), inside
+
+    def render(self, z, x, y, fmt):
+        """PNG bytes or a JSON string for one tile, from the render cache when possible."""
+        return _render_cached(self, z, x, y, fmt)
+
+    def describe(self):
+        return {
+            **{key: value for key, value in self.meta.items() if key != "version"},
+            "grid_version": self.version,
+            "k": self.k,
+            "shape": [self.rows, self.cols],
+            "colours": ["#%02x%02x%02x" % tuple(int(c) for c in colour) for colour in self.colours],
+        }
+
+    def _png(self, z, x, y):
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(z, x, y)
+        n = 2 ** z
+        offsets = (np.arange(TILE_SIZE) + 0.5) / TILE_SIZE
+        lons = lon_min + offsets * (lon_max - lon_min)
+        # Pixel rows are evenly spaced in Mercator y, not in latitude
+        lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y + offsets) / n))))
+
+        rows, cols, inside = self.cells(lats[:, None], lons[None, :])
+        best = np.where(inside, self.crops[0][rows, cols], NO_DATA)
+        confidence = np.where(inside, self.proba[0][rows, cols], 0)
+
+        rgba = np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8)
+        has_data = best != NO_DATA
+        rgba[has_data, :3] = self.colours[best[has_data]]
+        rgba[has_data, 3] = 96 + (confidence[has_data].astype(np.uint16) * 159 // 255)
+        return encode_png(rgba)
+
+    def _json(self, z, x, y):
+        lat_min, lat_max, lon_min, lon_max = tile_bounds(z, x, y)
+        row_lo = max(0, math.floor((lat_min - self.lat_min) / self.resolution))
+        row_hi = min(self.rows, math.ceil((lat_max - self.lat_min) / self.resolution))
+        col_lo = max(0, math.floor((lon_min - self.lon_min) / self.resolution))
+        col_hi = min(self.cols, math.ceil((lon_max - self.lon_min) / self.resolution))
+        body = {"z": z, "x": x, "y": y, "model": self.meta.get("model"), "grid_version": self.version}
+        if row_lo >= row_hi or col_lo >= col_hi:
+            return {**body, "shape": [0, 0], "crops": [], "probabilities": []}
+
+        step = max(1, math.ceil(max(row_hi - row_lo, col_hi - col_lo) / MAX_JSON_CELLS))
+        crops = np.asarray(self.crops[:, row_lo:row_hi:step, col_lo:col_hi:step])
+        proba = np.asarray(self.proba[:, row_lo:row_hi:step, col_lo:col_hi:step])
+        crops = np.where(crops == NO_DATA, -1, crops.astype(np.int16))
+        return {
+            **body,
+            # Rows run south to north from the first cell's south-west corner
+            "origin": [self.lat_min + row_lo * self.resolution, self.lon_min + col_lo * self.resolution],
+            "cell_size": self.resolution * step,
+            "shape": list(crops.shape[1:]),
+            "crops": crops.tolist(),
+            "probabilities": np.round(proba / 255.0, 3).tolist(),
+        }
+
+
+# Keyed by the grid object itself, so a reopened grid never serves the old one's tiles
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _render_cached(grid, z, x, y, fmt):
+    if fmt == "png":
+        return grid._png(z, x, y)
+    return json.dumps(grid._json(z, x, y), separators=(",", ":"))
+
+
+def write_grid(stem, crops, proba, bbox, resolution, classes, model, source):
+    """Write the arrays and metadata, each under a temporary name first."""
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    np.save(f"{stem}.crops.tmp.npy", np.asarray(crops, dtype=np.uint8))
+    np.save(f"{stem}.proba.tmp.npy", np.asarray(proba, dtype=np.uint8))
+    with open(f"{stem}.json.tmp", "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "bbox": list(bbox),
+            "resolution": resolution,
+            "classes": [str(c) for c in classes],
+            "model": model,
+            "source": source,
+            "built_at": int(os.path.getmtime(f"{stem}.crops.tmp.npy")),
+        }, f, indent=2, ensure_ascii=False)
+    os.replace(f"{stem}.crops.tmp.npy", f"{stem}.crops.npy")
+    os.replace(f"{stem}.proba.tmp.npy", f"{stem}.proba.npy")
+    os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+
+_grid = None
+_signature = None
+_MISSING = "missing"
+_checked_at = -math.inf
+_grid_lock = threading.Lock()
+
+
+def _file_signature(stem):
+    stat = os.stat(f"{stem}.json")
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_grid():
+    """The grid named by RECOMMENDATION_TILES, or ``None``; reopened when a rebuild replaces it."""
+    global _grid, _signature, _checked_at
+    stem = os.getenv("RECOMMENDATION_TILES")
+    if not stem:
+        return None
+    if time.monotonic() - _checked_at < CHECK_INTERVAL:
+        return _grid
+    with _grid_lock:
+        if time.monotonic() - _checked_at < CHECK_INTERVAL:
+            return _grid
+        _checked_at = time.monotonic()
+        try:
+            signature = _file_signature(stem)
+        except OSError as e:
+            if _signature != _MISSING:
+                logging.error(f"Recommendation tiles unavailable, cannot open {stem}: {e}")
+            # Keep serving whatever was mapped before
+            _signature = _MISSING
+            return _grid
+        if signature == _signature:
+            return _grid
+        # Recorded even when opening fails, so a bad file is retried once it changes
+        _signature = signature
+        try:
+            grid = RecommendationGrid.open(stem)
+        except (OSError, ValueError, KeyError) as e:
+            logging.error(f"Recommendation tiles disabled, cannot open {stem}: {e}")
+            return _grid
+        logging.info(f"{'Reloaded' if _grid is not None else 'Loaded'} recommendation tiles from {stem} "
+                     f"({grid.rows}x{grid.cols}, top {grid.k})")
+        _grid = grid
+    return _grid
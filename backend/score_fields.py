@@ -0,0 +1,230 @@
+"""Score a CSV or Parquet list of fields offline and write the top-k crops.
+
+    python score_fields.py fields.csv --out scored.csv
+    python score_fields.py fields.parquet --out scored.parquet --model RandomForest --k 5 --workers 8
+
+Input rows carry the model columns under their Crop_recommendation.csv
+names (``ph``, ``N``, ``temperature``, ``humidity``, ``rainfall``) or their
+API names (``Soil pH``, ...). Any other columns, such as a field id, pass
+through to the output unchanged. The model and its schema load through
+model_registry, as in the API.
+
+The input is read ``--chunk`` rows at a time and each chunk goes to the
+process pool. A worker loads the model once and then, for each chunk:
+builds the record matrix, runs one ``predict_proba``, and formats the
+output rows. Formatting CSV costs more than scoring, so it is done there
+too. At most two chunks per worker are in flight, so memory stays bounded
+whatever the file size. Results are written in input order, appending
+``crop_1``, ``probability_1``, ..., ``crop_k``, ``probability_k``.
+Rows missing a model column get empty
+results unless ``--impute-medians`` fills them from the training set.
+Parquet needs pyarrow (in requirements.txt); without it a Parquet input or
+output is refused before anything is read.
+"""
+import argparse
+import importlib.util
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import batch
+import feature_schema
+import model_registry
+
+# Input column names accepted for each record field
+COLUMN_ALIASES = {field: (name, field) for name, field in feature_schema.TRAINING_COLUMNS.items()}
+
+
+def is_parquet(path):
+    return path.lower().endswith((".parquet", ".pq"))
+
+
+def read_chunks(path, chunk):
+    if is_parquet(path):
+        import pyarrow.parquet as pq
+
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=chunk):
+            yield record_batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk)
+
+
+def input_columns(frame, schema):
+    """Input column for each model column; ValueError naming any that are absent."""
+    columns, missing = {}, []
+    for field in schema.columns:
+        found = next((name for name in COLUMN_ALIASES.get(field, (field,)) if name in frame.columns), None)
+        if found is None:
+            missing.append(" or ".join(COLUMN_ALIASES.get(field, (field,))))
+        columns[field] = found
+    if missing:
+        raise ValueError(f"Input has no column for {', '.join(missing)}")
+    return columns
+
+
+def record_matrix(frame, columns):
+    """The chunk as an ``(n, len(FIELDS))`` record matrix; fields without a column stay NaN."""
+    matrix = np.full((len(frame), len(feature_schema.FIELDS)), np.nan)
+    for field, name in columns.items():
+        matrix[:, feature_schema.INDEX[field]] = pd.to_numeric(frame[name], errors="coerce").to_numpy(np.float64)
+    return matrix
+
+
+_model = None
+
+
+def _init_worker(spec):
+    global _model
+    _model = model_registry.registry.get(spec)
+
+
+def score_matrix(matrix, k, impute_medians=False, model=None):
+    """``(top class indices, probabilities)`` per row, with -1 / NaN for incomplete rows."""
+    model = model or _model
+    if impute_medians:
+        feature_schema.fill_medians(matrix, model.schema)
+    complete = model.schema.complete(matrix)
+    k = min(k, len(model.classes_))
+    top = np.full((len(matrix), k), -1, dtype=np.int32)
+    probs = np.full((len(matrix), k), np.nan, dtype=np.float32)
+    if complete.any():
+        top[complete], probs[complete] = batch.top_k_indices(model.predict_proba(model.schema.select(matrix)[complete]), k)
+    return top, probs
+
+
+def attach_results(frame, top, probs, classes):
+    names = np.append(np.asarray(classes).astype(str), "")
+    out = frame.copy()
+    for rank in range(top.shape[1]):
+        out[f"crop_{rank + 1}"] = names[top[:, rank]]
+        out[f"probability_{rank + 1}"] = np.round(probs[:, rank], 4)
+    return out
+
+
+def score_chunk(frame, columns, k, impute_medians=False, as_csv=False, header=False, model=None):
+    """``(output, scored rows)`` for one input chunk; output is CSV text or a DataFrame."""
+    model = model or _model
+    top, probs = score_matrix(record_matrix(frame, columns), k, impute_medians, model)
+    out = attach_results(frame, top, probs, model.classes_)
+    if as_csv:
+        out = out.to_csv(header=header, index=False)
+    return out, int((top[:, 0] >= 0).sum())
+
+
+class Writer:
+    """Appends scored chunks to a CSV or Parquet file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.parquet = is_parquet(path)
+        self._parquet_writer = None
+        self._started = False
+
+    def write(self, frame):
+        """Append a DataFrame, or CSV text already formatted by a worker."""
+        if isinstance(frame, str):
+            with open(self.path, "a" if self._started else "w", newline="") as f:
+                f.write(frame)
+        elif self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            elif not table.schema.equals(self._parquet_writer.schema, check_metadata=False):
+                # read_csv infers dtypes per chunk: an integer id column with one blank comes back float
+                try:
+                    table = table.cast(self._parquet_writer.schema)
+                except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                    raise ValueError(f"A chunk of {self.path} does not fit the first chunk's column types: {e}")
+            self._parquet_writer.write_table(table)
+        else:
+            frame.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+        self._started = True
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+class _Done:
+    """Completed stand-in for a Future when scoring in-process."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a CSV or Parquet field list with the crop model.")
+    parser.add_argument("input", help="CSV or Parquet file of fields")
+    parser.add_argument("--out", required=True, help="Output .csv or .parquet")
+    parser.add_argument("--model", help="Model name or name:version (default MODEL_NAME)")
+    parser.add_argument("--k", type=int, default=3, help="Crops kept per row")
+    parser.add_argument("--chunk", type=int, default=100000, help="Rows read and scored at a time")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Scoring processes; 0 scores in this process")
+    parser.add_argument("--impute-medians", action="store_true",
+                        help="Fill missing model columns from training-set medians instead of skipping the row")
+    args = parser.parse_args()
+    if args.k < 1 or args.chunk < 1:
+        parser.error("--k and --chunk must be positive")
+    if (is_parquet(args.input) or is_parquet(args.out)) and importlib.util.find_spec("pyarrow") is None:
+        parser.error("Parquet files need pyarrow, which is not installed; run `pip install pyarrow` or use CSV")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    model = model_registry.registry.get(args.model)
+    logging.info(f"Scoring {args.input} with {model.id} ({args.workers or 'no'} workers, {args.chunk} rows per chunk)")
+
+    pool = ProcessPoolExecutor(args.workers, initializer=_init_worker, initargs=(model.id,)) if args.workers else None
+    pending = deque()
+    writer = Writer(args.out)
+    rows = scored = chunks = 0
+    columns = None
+    started = time.monotonic()
+
+    def drain(limit):
+        nonlocal rows, scored
+        while len(pending) > limit:
+            size, future = pending.popleft()
+            out, chunk_scored = future.result()
+            writer.write(out)
+            rows += size
+            scored += chunk_scored
+            elapsed = time.monotonic() - started
+            logging.info(f"{rows:,} rows ({scored:,} scored) in {elapsed:.1f}s, {rows / max(elapsed, 1e-9):,.0f} rows/s")
+
+    try:
+        for frame in read_chunks(args.input, args.chunk):
+            if columns is None:
+                columns = input_columns(frame, model.schema)
+            options = dict(k=args.k, impute_medians=args.impute_medians,
+                           as_csv=not writer.parquet, header=not chunks)
+            if pool is None:
+                future = _Done(score_chunk(frame, columns, model=model, **options))
+            else:
+                future = pool.submit(score_chunk, frame, columns, **options)
+            pending.append((len(frame), future))
+            chunks += 1
+            drain(2 * max(1, args.workers) - 1)
+        drain(0)
+    finally:
+        writer.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    elapsed = time.monotonic() - started
+    print(f"✅ Scored {scored:,} of {rows:,} rows in {elapsed:.1f}s "
+          f"({rows / max(elapsed, 1e-9):,.0f} rows/s) with {model.id} -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Nearest labelled training samples to a field, from a KD-tree.
+
+Agronomists sanity-check a recommendation against the training rows that
+most resemble the field. The index holds the labelled samples of
+SIMILAR_DATA (by default Crop_recommendation.csv, or a comma-separated list
+of CSVs in its layout) in a model's schema columns. Each column is
+standardized to zero mean and unit variance, so rainfall in the hundreds of
+mm does not drown out pH. A ``sklearn.neighbors.KDTree`` answers a query in
+roughly logarithmic time instead of scanning every row. A query takes a
+whole matrix of model rows at once, so a batch costs one tree query.
+
+Building the tree is done once. It is saved with joblib under
+SIMILAR_INDEX_DIR, keyed by the columns and data files, and reloaded at
+startup while the data's digest still matches. build_similarity_index.py
+prebuilds it, e.g. when the image is built.
+"""
+import hashlib
+import logging
+import os
+import threading
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import feature_schema
+from model_registry import file_digest
+
+DATA_PATHS = [path for path in os.getenv("SIMILAR_DATA", feature_schema.TRAINING_DATA).split(",") if path]
+INDEX_DIR = os.getenv("SIMILAR_INDEX_DIR", os.path.dirname(os.path.abspath(__file__)))
+# Most neighbours one request may ask for
+MAX_SIMILAR = int(os.getenv("SIMILAR_MAX", "20"))
+LEAF_SIZE = 40
+LABEL_COLUMN = "label"
+
+
+class SimilarityIndex:
+    """A KD-tree over standardized labelled samples in one schema's columns."""
+
+    def __init__(self, columns, samples, labels, digest, leaf_size=LEAF_SIZE):
+        from sklearn.neighbors import KDTree
+
+        self.columns = tuple(columns)
+        self.samples = np.asarray(samples, dtype=np.float64)
+        self.labels = np.asarray(labels).astype(str)
+        self.digest = digest
+        self.mean = self.samples.mean(axis=0)
+        scale = self.samples.std(axis=0)
+        self.scale = np.where(scale > 0, scale, 1.0)
+        self.tree = KDTree((self.samples - self.mean) / self.scale, leaf_size=leaf_size)
+
+    @classmethod
+    def from_csv(cls, paths, columns):
+        """Index the rows of ``paths`` that have every column and a label."""
+        training_names = {field: name for name, field in feature_schema.TRAINING_COLUMNS.items()}
+        names = [training_names.get(column, column) for column in columns]
+        frame = pd.concat([pd.read_csv(path, usecols=names + [LABEL_COLUMN]) for path in paths], ignore_index=True)
+        frame = frame.dropna()
+        return cls(columns, frame[names].to_numpy(np.float64), frame[LABEL_COLUMN].to_numpy(), data_digest(paths))
+
+    def query(self, inputs, k):
+        """``(distances, indices)`` of the ``k`` nearest samples to each row, nearest first."""
+        inputs = np.atleast_2d(np.asarray(inputs, dtype=np.float64))
+        k = min(k, len(self.samples))
+        return self.tree.query((inputs - self.mean) / self.scale, k=k)
+
+    def neighbours(self, inputs, k):
+        """The ``k`` nearest labelled samples for every input row, as response dicts."""
+        distances, indices = self.query(inputs, k)
+        return [
+            [
+                {
+                    "crop": self.labels[i],
+                    "distance": round(float(distance), 4),
+                    **{column: float(value) for column, value in zip(self.columns, self.samples[i])},
+                }
+                for distance, i in zip(row_distances, row_indices)
+            ]
+            for row_distances, row_indices in zip(distances, indices)
+        ]
+
+    def describe(self):
+        return {"columns": list(self.columns), "samples": len(self.samples), "data_digest": self.digest}
+
+
+def data_digest(paths):
+    return hashlib.sha1("".join(file_digest(path) for path in paths).encode()).hexdigest()[:12]
+
+
+def index_path(columns, paths=DATA_PATHS):
+    key = hashlib.sha1(repr((tuple(columns), [os.path.abspath(p) for p in paths])).encode()).hexdigest()[:10]
+    return os.path.join(INDEX_DIR, f"similar-{key}.joblib")
+
+
+def build(columns, paths=DATA_PATHS):
+    """Build the index for ``columns`` and save it where ``load`` looks."""
+    index = SimilarityIndex.from_csv(paths, columns)
+    path = index_path(columns, paths)
+    joblib.dump(index, f"{path}.tmp")
+    os.replace(f"{path}.tmp", path)
+    return index, path
+
+
+def load(columns, paths=DATA_PATHS):
+    """The saved index for ``columns``, or None if it is missing or its data has changed."""
+    path = index_path(columns, paths)
+    if not os.path.exists(path):
+        return None
+    index = joblib.load(path)
+    if index.columns != tuple(columns) or index.digest != data_digest(paths):
+        logging.info(f"Similarity index {path} is stale, rebuilding")
+        return None
+    return index
+
+
+_indexes = {}
+_failed = set()
+_lock = threading.Lock()
+
+
+def get_index(columns):
+    """The process's index for a schema's columns, loaded or built on first use; None if impossible."""
+    columns = tuple(columns)
+    index = _indexes.get(columns)
+    if index is not None or columns in _failed:
+        return index
+    with _lock:
+        if columns in _indexes or columns in _failed:
+            return _indexes.get(columns)
+        try:
+            index = load(columns)
+            if index is None:
+                try:
+                    index, path = build(columns)
+                    logging.info(f"Built similarity index {path} ({len(index.samples)} samples)")
+                except OSError as e:
+                    # A read-only deployment still gets an in-memory index
+                    logging.warning(f"Could not save similarity index: {e}")
+                    index = SimilarityIndex.from_csv(DATA_PATHS, columns)
+            _indexes[columns] = index
+        except Exception as e:
+            logging.error(f"Similar samples disabled for {list(columns)}: {e}")
+            _failed.add(columns)
+    return _indexes.get(columns)
+
+
+def parse_similar(args):
+    """Neighbours requested by the ``similar`` query parameter; 0 when absent."""
+    try:
+        k = int(args.get('similar', 0))
+    except ValueError:
+        raise ValueError("similar must be an integer")
+    if not 0 <= k <= MAX_SIMILAR:
+        raise ValueError(f"similar must be between 0 and {MAX_SIMILAR}")
+    return k
@@ -0,0 +1,99 @@
+"""Coalesce concurrent identical calls into one in-flight call.
+
+The first caller for a key runs the call; callers arriving while it is in
+flight wait for it and get the same value, or the same exception. Nothing is
+remembered once the call finishes, so this complements a cache rather than
+replacing one: it covers the window between a cache miss and the cache being
+filled, when a burst of requests for one place would otherwise all go
+upstream.
+
+``Group`` is for threads (gunicorn sync workers, feature_engine's pool) and
+``AsyncGroup`` for coroutines on one event loop (the ASGI entry point).
+"""
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class Group:
+    """Single-flight calls across the threads of one process."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key, fn):
+        """``fn()``, unless a call for ``key`` is already running, in which case its outcome."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.followers += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+            return call.value
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncGroup:
+    """Single-flight coroutines on one event loop.
+
+    The shared call runs as its own task and every caller awaits it through
+    ``asyncio.shield``, so a caller that is cancelled (e.g. by a feature
+    source deadline) neither cancels the call for the others nor stops its
+    result from being cached.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key, fn):
+        """Await ``fn()``, or the call for ``key`` that is already running."""
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fn())
+            task.add_done_callback(lambda done: self._finished(key, done))
+            self.leaders += 1
+        else:
+            self.followers += 1
+        return await asyncio.shield(task)
+
+    def _finished(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved; callers that are still waiting get it re-raised
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self):
+        return len(self._calls)
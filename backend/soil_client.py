@@ -0,0 +1,93 @@
+"""SoilGrids v2.0 client fetching several properties in a single query.
+
+The properties/query endpoint accepts repeated ``property=`` and ``depth=``
+parameters, so pH, nitrogen and any future property (SOC, clay, ...) cost one
+round trip instead of one each.
+"""
+import logging
+from dataclasses import dataclass, field
+from urllib.parse import urlencode
+
+import upstream
+
+QUERY_PATH = "/properties/query"
+
+DEFAULT_PROPERTIES = ("phh2o", "nitrogen")
+DEFAULT_DEPTHS = ("0-5cm",)
+
+# Divisors turning raw SoilGrids integers into the units the model was trained
+# on. Nitrogen keeps the historical /10 used since the first model.
+PROPERTY_SCALES = {
+    "phh2o": 10,
+    "nitrogen": 10,
+    "soc": 10,
+    "clay": 10,
+    "sand": 10,
+    "silt": 10,
+    "cec": 10,
+    "bdod": 100,
+}
+
+
+@dataclass
+class SoilProperties:
+    """Mean values keyed by ``(property, depth)``; missing cells are ``None``."""
+
+    lat: float
+    lon: float
+    values: dict = field(default_factory=dict)
+
+    def get(self, prop, depth=DEFAULT_DEPTHS[0]):
+        return self.values.get((prop, depth))
+
+    @property
+    def ph(self):
+        return self.get("phh2o")
+
+    @property
+    def nitrogen(self):
+        return self.get("nitrogen")
+
+
+def build_query_url(lat, lon, properties=DEFAULT_PROPERTIES, depths=DEFAULT_DEPTHS):
+    params = [("lon", lon), ("lat", lat)]
+    params += [("property", prop) for prop in properties]
+    params += [("depth", depth) for depth in depths]
+    params.append(("value", "mean"))
+    return f"{upstream.soilgrids.url(QUERY_PATH)}?{urlencode(params)}"
+
+
+def parse_response(data, lat, lon, properties=DEFAULT_PROPERTIES, depths=DEFAULT_DEPTHS):
+    result = SoilProperties(lat, lon, {(prop, depth): None for prop in properties for depth in depths})
+    for layer in data.get("properties", {}).get("layers", []):
+        prop = layer.get("name")
+        if prop not in properties:
+            continue
+        scale = PROPERTY_SCALES.get(prop, 1)
+        for depth in layer.get("depths", []):
+            label = depth.get("label")
+            mean = depth.get("values", {}).get("mean")
+            if label in depths and mean is not None:
+                result.values[(prop, label)] = mean / scale
+    return result
+
+
+def fetch_soil_properties(lat, lon, properties=DEFAULT_PROPERTIES, depths=DEFAULT_DEPTHS):
+    """Query every property/depth in one request; ``None`` if the call fails."""
+    url = build_query_url(lat, lon, properties, depths)
+    try:
+        data = upstream.soilgrids.get_json(url)
+        return parse_response(data, lat, lon, properties, depths)
+    except Exception as e:
+        logging.error(f"Error fetching soil properties: {e}")
+    return None
+
+
+async def fetch_soil_properties_async(lat, lon, properties=DEFAULT_PROPERTIES, depths=DEFAULT_DEPTHS):
+    url = build_query_url(lat, lon, properties, depths)
+    try:
+        data = await upstream.soilgrids.aget_json(url)
+        return parse_response(data, lat, lon, properties, depths)
+    except Exception as e:
+        logging.error(f"Error fetching soil properties: {e}")
+    return None
@@ -0,0 +1,281 @@
+"""Offline state lookup from bundled Indian state and union territory boundaries.
+
+``data/india_states.geojson`` holds simplified boundary polygons, named with
+the keys of ``soil_default_values``. It was decoded from the India map
+shipped in echarts-countries-pypkg 0.1.6, whose coordinates are quantized to
+1/1024 of a degree (about 100 m). That map predates the 2019 and 2020
+reorganisations: Ladakh is still part of Jammu & Kashmir, and Daman and Diu
+and Lakshadweep have no polygons. ``build_state_boundaries.py`` regenerates
+the file from a current ADM1 boundary set (geoBoundaries, GADM, DataMeet),
+and refuses to write one that leaves a ``soil_default_values`` key without
+a polygon.
+
+A feature whose ``includes`` property lists other keys stands for them as
+well, as the bundled Jammu & Kashmir polygon does for Ladakh. Its
+``enclaves`` property maps keys drawn inside it to bounding boxes
+``[lon_min, lat_min, lon_max, lat_max]``, as the bundled Gujarat does for
+Daman and for Diu. A point in such a polygon, or in such a box, is
+ambiguous: the API asks OpenCage which of those keys it lies in and keeps
+the bundled name if that fails. ``check_coverage`` logs the keys left
+without a polygon of their own.
+
+``StateIndex`` lays a regular grid over the polygons. A cell with no boundary
+within STATE_SNAP_DEGREES of it is resolved when the index is built, so most
+lookups are a single array read. Cells on a boundary keep their candidate
+states, and the point-in-polygon test only scans the edges that cross the
+cell's latitude band. A point just outside every polygon (simplified
+coastline, river mouths) snaps to the nearest state within
+STATE_SNAP_DEGREES.
+"""
+import json
+import logging
+import math
+import os
+import threading
+
+import numpy as np
+
+BOUNDARIES_PATH = os.getenv(
+    "STATE_BOUNDARIES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "india_states.geojson"),
+)
+GRID_RESOLUTION = float(os.getenv("STATE_GRID_RESOLUTION", "0.25"))
+SNAP_DEGREES = float(os.getenv("STATE_SNAP_DEGREES", "0.05"))
+
+# Cell codes below zero; codes >= 0 are an index into StateIndex.names
+OUTSIDE = -1
+BOUNDARY = -2
+
+
+def polygon_edges(geometry):
+    """(x0, y0, x1, y1) arrays of every ring edge of a Polygon or MultiPolygon."""
+    polygons = geometry["coordinates"] if geometry["type"] == "MultiPolygon" else [geometry["coordinates"]]
+    segments = []
+    for polygon in polygons:
+        for ring in polygon:
+            ring = np.asarray(ring, dtype=float)
+            if len(ring) < 3:
+                continue
+            if not np.array_equal(ring[0], ring[-1]):
+                ring = np.vstack([ring, ring[:1]])
+            segments.append(np.hstack([ring[:-1], ring[1:]]))
+    edges = np.vstack(segments)
+    return edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+
+
+def crossings(edges, lon, lat):
+    """Even-odd ray casting: number of edges crossed by a ray running east from the point."""
+    x0, y0, x1, y1 = edges
+    straddles = (y0 > lat) != (y1 > lat)
+    if not straddles.any():
+        return 0
+    x0, y0, x1, y1 = x0[straddles], y0[straddles], x1[straddles], y1[straddles]
+    x_cross = x0 + (lat - y0) * (x1 - x0) / (y1 - y0)
+    return int(np.count_nonzero(x_cross > lon))
+
+
+def distance_to_edges(edges, lon, lat):
+    """Shortest planar distance in degrees from the point to any edge."""
+    x0, y0, x1, y1 = edges
+    dx, dy = x1 - x0, y1 - y0
+    length2 = dx * dx + dy * dy
+    t = np.clip(((lon - x0) * dx + (lat - y0) * dy) / np.where(length2 > 0, length2, 1.0), 0.0, 1.0)
+    return float(np.sqrt((x0 + t * dx - lon) ** 2 + (y0 + t * dy - lat) ** 2).min())
+
+
+class StateIndex:
+    def __init__(self, names, edges, resolution=GRID_RESOLUTION, snap=SNAP_DEGREES, includes=None, enclaves=None):
+        self.names = names
+        # Polygon name -> other names whose area it also covers
+        self.includes = includes or {}
+        # Polygon name -> ((other name, (lon_min, lat_min, lon_max, lat_max)), ...) drawn inside it
+        self.enclaves = enclaves or {}
+        self.resolution = resolution
+        self.snap = snap
+        self._edges = edges
+
+        lon_min = min(e[0].min() for e in edges) - snap
+        lon_max = max(e[0].max() for e in edges) + snap
+        lat_min = min(e[1].min() for e in edges) - snap
+        lat_max = max(e[1].max() for e in edges) + snap
+        self.lat_min = math.floor(lat_min / resolution) * resolution
+        self.lon_min = math.floor(lon_min / resolution) * resolution
+        self.rows = int(math.ceil((lat_max - self.lat_min) / resolution))
+        self.cols = int(math.ceil((lon_max - self.lon_min) / resolution))
+        self._build()
+
+    @classmethod
+    def load(cls, path=BOUNDARIES_PATH, **kwargs):
+        with open(path, encoding="utf-8") as f:
+            collection = json.load(f)
+        names, edges, includes, enclaves = [], [], {}, {}
+        for feature in collection["features"]:
+            properties = feature["properties"]
+            name = properties["name"]
+            names.append(name)
+            edges.append(polygon_edges(feature["geometry"]))
+            if properties.get("includes"):
+                includes[name] = tuple(properties["includes"])
+            if properties.get("enclaves"):
+                enclaves[name] = tuple((other, tuple(box)) for other, boxes in properties["enclaves"].items()
+                                       for box in boxes)
+        return cls(names, edges, includes=includes, enclaves=enclaves, **kwargs)
+
+    def _row(self, lat):
+        return int((lat - self.lat_min) // self.resolution)
+
+    def _col(self, lon):
+        return int((lon - self.lon_min) // self.resolution)
+
+    def _build(self):
+        res = self.resolution
+        self._cells = np.full((self.rows, self.cols), OUTSIDE, dtype=np.int16)
+        self._candidates = {}
+        # Edges of each state grouped by the latitude band (grid row) they span
+        self._bands = {}
+
+        for state, (x0, y0, x1, y1) in enumerate(self._edges):
+            row_lo = np.floor((np.minimum(y0, y1) - self.lat_min) / res).astype(int)
+            row_hi = np.floor((np.maximum(y0, y1) - self.lat_min) / res).astype(int)
+            for row in range(row_lo.min(), row_hi.max() + 1):
+                in_band = (row_lo <= row) & (row_hi >= row)
+                if in_band.any():
+                    self._bands[(state, row)] = (x0[in_band], y0[in_band], x1[in_band], y1[in_band])
+
+            # Any cell an edge passes within `snap` of needs a real test at query time
+            rows_lo = np.floor((np.minimum(y0, y1) - self.snap - self.lat_min) / res).astype(int)
+            rows_hi = np.floor((np.maximum(y0, y1) + self.snap - self.lat_min) / res).astype(int)
+            cols_lo = np.floor((np.minimum(x0, x1) - self.snap - self.lon_min) / res).astype(int)
+            cols_hi = np.floor((np.maximum(x0, x1) + self.snap - self.lon_min) / res).astype(int)
+            for r0, r1, c0, c1 in zip(rows_lo, rows_hi, cols_lo, cols_hi):
+                for row in range(max(r0, 0), min(r1, self.rows - 1) + 1):
+                    for col in range(max(c0, 0), min(c1, self.cols - 1) + 1):
+                        self._cells[row, col] = BOUNDARY
+                        self._candidates.setdefault((row, col), set()).add(state)
+
+        # Cells clear of every boundary lie wholly inside one state or outside all
+        for row, col in zip(*np.nonzero(self._cells == OUTSIDE)):
+            lat = self.lat_min + (row + 0.5) * res
+            lon = self.lon_min + (col + 0.5) * res
+            self._cells[row, col] = self._containing(range(len(self.names)), lon, lat, row)
+
+        # Boundary cells may also lie inside a state whose own edges are elsewhere
+        for (row, col), states in self._candidates.items():
+            lat = self.lat_min + (row + 0.5) * res
+            lon = self.lon_min + (col + 0.5) * res
+            centre = self._containing(range(len(self.names)), lon, lat, row)
+            if centre >= 0:
+                states.add(centre)
+        self._candidates = {cell: tuple(sorted(states)) for cell, states in self._candidates.items()}
+
+    def _containing(self, states, lon, lat, row):
+        for state in states:
+            edges = self._bands.get((state, row))
+            if edges is not None and crossings(edges, lon, lat) % 2:
+                return state
+        return OUTSIDE
+
+    def lookup(self, lat, lon):
+        """State or union territory name at the point, or ``None`` outside India."""
+        row, col = self._row(lat), self._col(lon)
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            return None
+        code = int(self._cells[row, col])
+        if code >= 0:
+            return self.names[code]
+        if code == OUTSIDE:
+            return None
+
+        candidates = self._candidates[(row, col)]
+        state = self._containing(candidates, lon, lat, row)
+        if state >= 0:
+            return self.names[state]
+
+        # Just off a simplified coastline: take the nearest state within reach
+        best, best_distance = None, self.snap
+        for state in candidates:
+            distance = distance_to_edges(self._edges[state], lon, lat)
+            if distance <= best_distance:
+                best, best_distance = state, distance
+        return self.names[best] if best is not None else None
+
+    def alternatives(self, state_name, lat, lon):
+        """Other names a point that resolved to ``state_name`` may really lie in."""
+        found = list(self.includes.get(state_name, ()))
+        for other, (lon_min, lat_min, lon_max, lat_max) in self.enclaves.get(state_name, ()):
+            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max and other not in found:
+                found.append(other)
+        return tuple(found)
+
+    def missing(self, names):
+        """Names among ``names`` without a polygon of their own, sorted."""
+        return sorted(set(names) - set(self.names))
+
+    def stats(self):
+        return {
+            "states": len(self.names),
+            "shared_polygons": {name: list(other) for name, other in self.includes.items()},
+            "enclaves": {name: sorted({other for other, _ in boxes}) for name, boxes in self.enclaves.items()},
+            "resolution": self.resolution,
+            "grid": [self.rows, self.cols],
+            "resolved_cells": int(np.count_nonzero(self._cells >= 0)),
+            "boundary_cells": len(self._candidates),
+        }
+
+
+_index = None
+_index_failed = False
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """The bundled state index, built once per process, or ``None`` if it cannot be loaded."""
+    global _index, _index_failed
+    if _index is None and not _index_failed:
+        with _index_lock:
+            if _index is None and not _index_failed:
+                try:
+                    _index = StateIndex.load()
+                    logging.info(f"Loaded state boundaries from {BOUNDARIES_PATH} ({_index.stats()})")
+                except (OSError, ValueError, KeyError) as e:
+                    logging.error(f"Offline state lookup disabled, cannot load {BOUNDARIES_PATH}: {e}")
+                    _index_failed = True
+    return _index
+
+
+def lookup_state(lat, lon):
+    index = get_index()
+    return index.lookup(lat, lon) if index else None
+
+
+def ambiguous(state_name, lat, lon):
+    """Whether the point, resolved to ``state_name``, may lie in another state the boundaries do not draw."""
+    index = get_index()
+    return bool(index and index.alternatives(state_name, lat, lon))
+
+
+def settle(state_name, geocoded, lat, lon):
+    """The bundled ``state_name``, or the geocoder's answer where the point may lie in that state instead.
+
+    With no bundled name the geocoder's answer stands as is.
+    """
+    if state_name is None:
+        return geocoded
+    index = get_index()
+    if index and geocoded in index.alternatives(state_name, lat, lon):
+        return geocoded
+    return state_name
+
+
+def check_coverage(names):
+    """Log and return the names the bundled boundaries have no polygon for."""
+    index = get_index()
+    if index is None:
+        return sorted(names)
+    missing = index.missing(names)
+    if missing:
+        shared = {other: name for name, others in index.includes.items() for other in others}
+        described = ", ".join(f"{name} (inside {shared[name]})" if name in shared else name for name in missing)
+        logging.warning(f"State boundaries in {BOUNDARIES_PATH} have no polygon for: {described}; "
+                        f"points there need the OpenCage fallback. Rebuild them with build_state_boundaries.py")
+    return missing
@@ -0,0 +1,47 @@
+"""State and union territory soil defaults used when SoilGrids has no value.
+
+Kept apart from api_main so offline builds (build_recommendation_tiles.py,
+build_state_boundaries.py) can use them without building the Flask app.
+"""
+import feature_schema
+
+soil_default_values = {
+    "Andhra Pradesh": {"pH": 7.62, "Nitrogen": 20.0},
+    "Arunachal Pradesh": {"pH": 4.53, "Nitrogen": 29.8},
+    "Assam": {"pH": 4.81, "Nitrogen": 28.0},
+    "Bihar": {"pH": 8.25, "Nitrogen": 21.4},
+    "Chhattisgarh": {"pH": 6.30, "Nitrogen": 21.5},
+    "Goa": {"pH": 6.00, "Nitrogen": 10.5},
+    "Gujarat": {"pH": 7.67, "Nitrogen": 22.5},
+    "Haryana": {"pH": 7.75, "Nitrogen": 12.5},
+    "Himachal Pradesh": {"pH": 6.23, "Nitrogen": 23.0},
+    "Jharkhand": {"pH": 5.90, "Nitrogen": 49.0},
+    "Karnataka": {"pH": 5.49, "Nitrogen": 51.8},
+    "Kerala": {"pH": 7.00, "Nitrogen": 23.0},
+    "Maharashtra": {"pH": 5.96, "Nitrogen": 15.4},
+    "Madhya Pradesh": {"pH": 7.45, "Nitrogen": 19.5},
+    "Manipur": {"pH": 5.31, "Nitrogen": 26.7},
+    "Meghalaya": {"pH": 5.16, "Nitrogen": 25.6},
+    "Mizoram": {"pH": 5.10, "Nitrogen": 67.0},
+    "Nagaland": {"pH": 5.17, "Nitrogen": 41.0},
+    "Odisha": {"pH": 6.01, "Nitrogen": 23.0},
+    "Punjab": {"pH": 8.25, "Nitrogen": 14.5},
+    "Rajasthan": {"pH": 7.75, "Nitrogen": 23.0},
+    "Sikkim": {"pH": 4.87, "Nitrogen": 30.0},
+    "Tamil Nadu": {"pH": 7.12, "Nitrogen": 16.0},
+    "Tripura": {"pH": 5.05, "Nitrogen": 40.0},
+    "Telangana": {"pH": 6.12, "Nitrogen": 25.0},
+    "Uttar Pradesh": {"pH": 8.14, "Nitrogen": 24.4},
+    "Uttarakhand": {"pH": 5.70, "Nitrogen": 35.0},
+    "West Bengal": {"pH": 5.55, "Nitrogen": 22.0},
+    "Andaman and Nicobar Islands": {"pH": 4.05, "Nitrogen": 10.0},
+    "Chandigarh": {"pH": 7.75, "Nitrogen": 17.0},
+    "Dadra and Nagar Haveli and Daman and Diu": {"pH": 7.05, "Nitrogen": 40.0},
+    "Delhi": {"pH": 7.58, "Nitrogen": 10.0},
+    "Jammu & Kashmir": {"pH": 8.00, "Nitrogen": 19.0},
+    "Ladakh": {"pH": 8.45, "Nitrogen": 35.0},
+    "Lakshadweep": {"pH": 8.20, "Nitrogen": 18.0},
+    "Puducherry": {"pH": 7.30, "Nitrogen": 19.0}
+}
+
+regional_defaults = feature_schema.RegionalDefaults(soil_default_values)
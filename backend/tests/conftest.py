@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The service modules are flat files in backend/ and open their SQLite stores
+# at import time, so point those at a scratch directory before any test imports them.
+_scratch = tempfile.mkdtemp(prefix="agrovision-tests-")
+os.environ.setdefault("FEATURE_CACHE_PATH", os.path.join(_scratch, "feature_cache.sqlite3"))
+os.environ.setdefault("UPSTREAM_QUOTA_PATH", os.path.join(_scratch, "upstream_quota.sqlite3"))
+os.environ.setdefault("NDVI_STORE_PATH", os.path.join(_scratch, "ndvi_store.sqlite3"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
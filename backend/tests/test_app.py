@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import api_main
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PRELOADED = ("model", "similar_samples", "feature_tiles", "state_boundaries", "recommendation_tiles", "weather_history")
+
+
+def test_import_loads_no_heavy_dependency():
+    snippet = (
+        "import json, sys; import api_main, model_registry; "
+        "print(json.dumps({'modules': [m for m in ('ee', 'geemap') if m in sys.modules], "
+        "'models': [s.name for s in model_registry.registry._slots.values() if s.model is not None]}))"
+    )
+    env = {**os.environ, "PRELOAD_MODEL": "0"}
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    assert json.loads(output.strip().splitlines()[-1]) == {"modules": [], "models": []}
+
+
+@pytest.fixture
+def loads(monkeypatch):
+    calls = []
+
+    class Model:
+        schema = type("Schema", (), {"columns": ("N",)})
+
+    def record(name, result=None):
+        def load(*args, **kwargs):
+            calls.append(name)
+            return result
+        return load
+
+    monkeypatch.setattr(api_main, "get_model", record("model", Model()))
+    monkeypatch.setattr(api_main.similar_samples, "get_index", record("similar_samples"))
+    monkeypatch.setattr(api_main.feature_tiles, "get_tiles", record("feature_tiles"))
+    monkeypatch.setattr(api_main.state_boundaries, "check_coverage", record("state_boundaries"))
+    monkeypatch.setattr(api_main.recommendation_tiles, "get_grid", record("recommendation_tiles"))
+    monkeypatch.setattr(api_main.weather_history, "get_history", record("weather_history"))
+    return calls
+
+
+def test_create_app_defers_loading_to_first_use(loads, monkeypatch):
+    monkeypatch.delenv("PRELOAD_MODEL", raising=False)
+    app = api_main.create_app()
+    assert loads == []
+    assert "api.home" in app.view_functions
+
+
+@pytest.mark.parametrize("preload, env", [(True, "0"), (None, "1")], ids=["argument", "PRELOAD_MODEL"])
+def test_preload_loads_everything_up_front(loads, monkeypatch, preload, env):
+    monkeypatch.setenv("PRELOAD_MODEL", env)
+    api_main.create_app(preload=preload)
+    assert loads == list(PRELOADED)
+
+
+def test_missing_default_model_is_none_but_an_unknown_request_raises(monkeypatch):
+    registry = api_main.model_registry.ModelRegistry(directories=[], default="Absent")
+    monkeypatch.setattr(api_main.model_registry, "registry", registry)
+    monkeypatch.setattr(api_main.model_registry, "DEFAULT_MODEL", "Absent")
+    assert api_main.get_model() is None
+    with pytest.raises(api_main.model_registry.UnknownModelError):
+        api_main.get_model("Absent")
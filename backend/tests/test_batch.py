@@ -0,0 +1,78 @@
+import time
+
+import numpy as np
+
+import batch
+import feature_schema
+
+
+class FakeModel:
+    schema = feature_schema.FeatureSchema(feature_schema.DEFAULT_COLUMNS)
+    classes_ = np.array(["jute", "maize", "rice"])
+
+    def predict_proba(self, X):
+        return np.tile([0.2, 0.5, 0.3], (len(X), 1))
+
+
+def record(seed):
+    return feature_schema.FeatureRecord([0.5, 6.5, 20 + seed, 25.0, 70.0, 100.0])
+
+
+def test_points_in_one_cell_share_a_lookup():
+    points = [{"lat": 20.0001, "lon": 78.0001}, {"lat": 20.0002, "lon": 78.0002}, {"lat": "x", "lon": 1}]
+    cells, errors = batch.group_by_cell(points)
+    assert len(cells) == 1
+    assert next(iter(cells.values()))[2] == [0, 1]
+    assert errors == {2: "Invalid latitude or longitude"}
+
+
+def test_unusable_coordinates_are_per_point_errors():
+    points = [{"lat": "nan", "lon": 78}, {"lat": 20, "lon": float("inf")}, {"lat": "1e309", "lon": 78},
+              {"lat": 10 ** 400, "lon": 78}, {"lat": 95, "lon": 78}, {"lat": 20, "lon": -181}, [20, 78],
+              {"lat": -90, "lon": 180}]
+    cells, errors = batch.group_by_cell(points)
+    assert errors == {i: "Invalid latitude or longitude" for i in range(7)}
+    assert [indices for _, _, indices in cells.values()] == [[7]]
+    assert batch.valid_coords(points) == [(-90.0, 180.0)]
+
+
+def test_a_bad_point_does_not_end_the_stream():
+    points = [{"lat": 20.0, "lon": 78.0}, {"lat": float("nan"), "lon": 78.0}]
+    results = list(batch.score_points(points, lambda lat, lon: (record(0), []), lambda r: r.values, FakeModel()))
+    assert sorted(result["index"] for result in results) == [0, 1]
+    assert results[0] == {"index": 1, "id": None, "error": "Invalid latitude or longitude"}
+
+
+def test_top_k_matches_a_full_sort():
+    probabilities = np.random.default_rng(0).random((50, 22))
+    top, top_probs = batch.top_k_indices(probabilities, 3)
+    assert (top == np.argsort(-probabilities, axis=1)[:, :3]).all()
+    assert (np.diff(top_probs, axis=1) <= 0).all()
+
+
+def test_small_batch_streams_before_the_slowest_cell():
+    delays = {10.0: 0.0, 11.0: 0.0, 12.0: 1.0}
+
+    def gather(lat, lon):
+        time.sleep(delays[lat])
+        return record(lat), {}
+
+    points = [{"lat": lat, "lon": 78.0, "id": lat} for lat in delays]
+    started = time.monotonic()
+    arrivals = {}
+    for result in batch.score_points(points, gather, FakeModel.schema.row, FakeModel(), k=2, concurrency=3,
+                                     chunk=256, flush_seconds=0.05):
+        arrivals[result["id"]] = time.monotonic() - started
+        assert [c["crop"] for c in result["Top Crops"]] == ["maize", "rice"]
+
+    assert arrivals[10.0] < 0.5 and arrivals[11.0] < 0.5
+    assert arrivals[12.0] >= 1.0
+
+
+def test_incomplete_records_are_reported_not_scored():
+    def gather(lat, lon):
+        return feature_schema.FeatureRecord(), {"soil": "timeout"}
+
+    [result] = batch.score_points([{"lat": 10, "lon": 78}], gather, FakeModel.schema.row, FakeModel())
+    assert result["error"] == "Failed to fetch crop features"
+    assert result["Degraded Sources"] == {"soil": "timeout"}
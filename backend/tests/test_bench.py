@@ -0,0 +1,99 @@
+import json
+import os
+import sys
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench"))
+
+import api_main
+import benchmark
+import fake_upstreams
+import loadtest
+import soil_client
+import upstream
+
+
+@pytest.fixture
+def upstreams(request):
+    server, fakes, env = fake_upstreams.start(**getattr(request, "param", {}))
+    yield fakes, env
+    server.shutdown()
+    server.server_close()
+
+
+def fetch(url):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def test_service_clients_parse_the_synthetic_responses(upstreams, monkeypatch):
+    fakes, env = upstreams
+    for client in (upstream.soilgrids, upstream.nasa_power, upstream.opencage):
+        monkeypatch.setattr(client, "base_url", env[f"{client.name.upper()}_BASE_URL"])
+    lat, lon = 23.02, 72.57
+
+    soil = soil_client.fetch_soil_properties(lat, lon)
+    assert 5.0 <= soil.ph <= 8.0 and soil.nitrogen > 0
+    weather = api_main.parse_weather(upstream.nasa_power.get_json(api_main.weather_url(lat, lon)))
+    assert set(weather) == {"temperature", "humidity", "rainfall"}
+    state = api_main.parse_opencage_state(upstream.opencage.get_json(api_main.opencage_url(lat, lon, "key")))
+    assert state == "Gujarat"
+    assert fakes.stats()["calls"] == {"soilgrids": 1, "nasa_power": 1, "opencage": 1}
+
+
+@pytest.mark.parametrize("upstreams", [{"overrides": {"opencage": {"error_rate": 1.0}}}], indirect=True)
+def test_error_rate_answers_503(upstreams):
+    fakes, env = upstreams
+    assert fetch(f"{env['OPENCAGE_BASE_URL']}/geocode/v1/json?q=20+78")[0] == 503
+    assert fetch(f"{env['NASA_POWER_BASE_URL']}/x?latitude=20&longitude=78")[0] == 200
+    assert fakes.stats()["errors"]["opencage"] == 1
+
+
+def test_recordings_replay_the_nearest_point(tmp_path):
+    with open(tmp_path / "opencage.jsonl", "w") as f:
+        for lat, state in ((10.0, "Kerala"), (30.0, "Punjab")):
+            f.write(json.dumps({"lat": lat, "lon": 76.0, "status": 200, "body": {"state": state}}) + "\n")
+    fakes = fake_upstreams.FakeUpstreams(recordings=str(tmp_path))
+    assert fakes.respond("opencage", "/geocode/v1/json", {"q": ["28.5+75.9"]}, "") == (200, {"state": "Punjab"})
+
+
+def test_parse_overrides():
+    assert fake_upstreams.parse_overrides(["soilgrids.latency=0.5", "soilgrids.error_rate=0.1"]) == \
+        {"soilgrids": {"latency": 0.5, "error_rate": 0.1}}
+    with pytest.raises(ValueError):
+        fake_upstreams.parse_overrides(["earthengine.latency=1"])
+
+
+def test_run_level_reports_throughput_and_percentiles(upstreams):
+    _, env = upstreams
+    summary = loadtest.run_level(env["OPENCAGE_BASE_URL"].rsplit("/", 1)[0], "/opencage/geocode/v1/json?q=20+78",
+                                 concurrency=2, duration=0.3)
+    assert summary["requests"] > 0 and summary["errors"] == 0
+    latency = summary["latency_ms"]
+    assert latency["p50"] <= latency["p95"] <= latency["p99"]
+
+
+def test_percentile_picks_the_nearest_rank():
+    values = list(range(101))
+    assert [loadtest.percentile(values, q) for q in (50, 95, 99)] == [50, 95, 99]
+    assert loadtest.percentile([], 50) is None
+
+
+def test_compare_flags_slower_and_lower_throughput_cells():
+    def report(p95, rps, requests=100):
+        return {"results": [{"endpoint": "single", "concurrency": 8, "requests": requests,
+                             "latency_ms": {"p95": p95}, "throughput_rps": rps}]}
+
+    assert benchmark.compare(report(105, 95), report(100, 100), tolerance=0.1) == []
+    assert benchmark.compare(report(120, 80), report(100, 100), tolerance=0.1) == [
+        "single @ 8: p95 100.0 ms -> 120.0 ms",
+        "single @ 8: throughput 100.0 -> 80.0 rps",
+    ]
+    # A cell with no requests on either side is not comparable
+    assert benchmark.compare(report(120, 80, requests=0), report(100, 100), tolerance=0.1) == []
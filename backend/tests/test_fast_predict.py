@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.naive_bayes import GaussianNB
+from sklearn.tree import DecisionTreeClassifier, ExtraTreeClassifier
+
+import fast_predict
+import feature_schema
+
+
+@pytest.fixture(scope="module")
+def data():
+    frame = pd.read_csv(feature_schema.TRAINING_DATA)
+    X, y = frame[list(feature_schema.TRAINING_COLUMNS)].to_numpy(), frame["label"].to_numpy()
+    rng = np.random.default_rng(0)
+    # Training rows plus unseen points, some right on or beyond the training range
+    probes = np.vstack([X[::7], rng.uniform(X.min(axis=0) - 5, X.max(axis=0) + 5, (300, X.shape[1]))])
+    return X, y, probes
+
+
+@pytest.mark.parametrize("estimator", [
+    GaussianNB(),
+    DecisionTreeClassifier(random_state=0),
+    ExtraTreeClassifier(random_state=0),
+    RandomForestClassifier(n_estimators=20, random_state=0),
+    ExtraTreesClassifier(n_estimators=20, random_state=0),
+], ids=lambda estimator: type(estimator).__name__)
+def test_compiled_probabilities_match_sklearn(data, estimator):
+    X, y, probes = data
+    estimator.fit(X, y)
+    compiled = fast_predict.compile_estimator(estimator)
+    assert list(compiled.classes_) == list(estimator.classes_)
+    expected = estimator.predict_proba(probes)
+    np.testing.assert_allclose(compiled.predict_proba(probes), expected, rtol=1e-9, atol=1e-12)
+    # The single-row path the API takes
+    for row in probes[:20]:
+        np.testing.assert_allclose(compiled.predict_proba(row[None, :]), estimator.predict_proba(row[None, :]),
+                                   rtol=1e-9, atol=1e-12)
+
+
+def test_tree_thresholds_compare_in_float32(data):
+    X, y, _ = data
+    tree = DecisionTreeClassifier(random_state=0).fit(X, y)
+    compiled = fast_predict.compile_estimator(tree)
+    # Points a hair either side of every split threshold
+    nodes = np.flatnonzero(tree.tree_.children_left != -1)
+    probes = np.tile(np.median(X, axis=0), (2 * len(nodes), 1))
+    for i, node in enumerate(nodes):
+        threshold = tree.tree_.threshold[node]
+        probes[2 * i, tree.tree_.feature[node]] = threshold
+        probes[2 * i + 1, tree.tree_.feature[node]] = np.nextafter(np.float32(threshold), np.float32(np.inf))
+    np.testing.assert_array_equal(compiled.predict_proba(probes), tree.predict_proba(probes))
+
+
+def test_unknown_estimators_are_left_alone(data):
+    X, y, _ = data
+    assert fast_predict.compile_estimator(LogisticRegression(max_iter=50).fit(X[:200], y[:200])) is None
+    multi = RandomForestClassifier(n_estimators=2, random_state=0).fit(X, np.column_stack([y, y]))
+    assert fast_predict.compile_estimator(multi) is None
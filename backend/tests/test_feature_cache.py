@@ -0,0 +1,151 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import feature_cache
+
+
+def rows(store):
+    return store._conn().execute("SELECT key FROM feature_cache ORDER BY key").fetchall()
+
+
+def test_disk_store_evicts_least_recently_read_rows(tmp_path):
+    store = feature_cache._DiskStore(str(tmp_path / "cache.sqlite3"), max_rows=3, maintenance_interval=3600)
+    for key in "abcd":
+        store.put("soil", key, {"pH": 7}, time.time() + 60)
+        time.sleep(0.01)
+    store.get("soil", "a")
+
+    assert store.evict() == 1
+    assert rows(store) == [("a",), ("c",), ("d",)]
+    assert store.evictions == 1
+
+
+def test_disk_store_maintains_periodically_on_write(tmp_path):
+    store = feature_cache._DiskStore(str(tmp_path / "cache.sqlite3"), max_rows=2, maintenance_interval=0.05)
+    store.put("soil", "expired", {"pH": 7}, time.time() - 1)
+    for key in "abc":
+        store.put("soil", key, {"pH": 7}, time.time() + 60)
+    assert len(rows(store)) == 4
+
+    time.sleep(0.06)
+    store.put("soil", "d", {"pH": 7}, time.time() + 60)
+    assert rows(store) == [("c",), ("d",)]
+
+
+def test_disk_store_upgrades_a_store_without_access_times(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE feature_cache (source TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                 " expires REAL NOT NULL, PRIMARY KEY (source, key))")
+    conn.execute("INSERT INTO feature_cache VALUES ('soil', 'old', '{}', ?)", (time.time() + 60,))
+    conn.commit()
+    conn.close()
+
+    store = feature_cache._DiskStore(path, max_rows=1)
+    store.put("soil", "new", {"pH": 7}, time.time() + 60)
+    assert store.get("soil", "old")[0] == {}
+    store.put("soil", "newer", {"pH": 7}, time.time() + 60)
+    store.evict()
+    assert rows(store) == [("newer",)]
+
+
+def test_snap_returns_the_cell_and_its_centre():
+    assert feature_cache.snap(21.26, 79.31, 0.5, 0.625) == ((42, 126), (21.25, 79.0625))
+    # Negative coordinates floor away from zero rather than truncating
+    assert feature_cache.snap(-0.1, -0.1, 0.5, 0.5) == ((-1, -1), (-0.25, -0.25))
+
+
+def test_every_source_grid_nests_in_the_finest_cell():
+    points = [(21.2601, 79.3101), (21.26049, 79.31049), (28.61, 77.2), (8.0001, 76.9999)]
+    for lat, lon in points:
+        cell = feature_cache.finest_cell(lat, lon)
+        res = feature_cache.FINEST_RESOLUTION
+        corner = (cell[0] * res + 1e-9, cell[1] * res + 1e-9)
+        for lat_res, lon_res, _, _ in feature_cache.SOURCE_CONFIG.values():
+            assert feature_cache.snap(lat, lon, lat_res, lon_res)[0] == feature_cache.snap(*corner, lat_res, lon_res)[0]
+
+
+def test_memory_cache_expires_after_its_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(feature_cache.time, "time", lambda: now[0])
+    cache = feature_cache.FeatureCache("soil", 0.01, 0.01, ttl=60, max_entries=10)
+    cache.put("k", {"pH": 7})
+    now[0] += 60
+    assert cache.get("k") == {"pH": 7}
+    now[0] += 0.001
+    assert cache.get("k") is None
+    assert (cache.hits, cache.expirations, cache.misses) == (1, 1, 1)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = feature_cache.FeatureCache("soil", 0.01, 0.01, ttl=60, max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+    assert cache.evictions == 1
+
+
+def test_cached_queries_the_cell_centre_once_per_cell(monkeypatch):
+    cache = feature_cache.caches["weather"]
+    monkeypatch.setattr(cache, "disk", None)
+    cache.clear()
+    calls = []
+
+    @feature_cache.cached("weather", key_args=("date",))
+    def fetch(lat, lon, date, api_key=None):
+        calls.append((lat, lon, date))
+        return {"temperature": 25.0} if date != "outage" else None
+
+    assert fetch(21.26, 79.31, "2024-03-01", api_key="a") == {"temperature": 25.0}
+    assert fetch(21.49, 79.37, "2024-03-01", api_key="b") == {"temperature": 25.0}
+    fetch(21.26, 79.31, "2024-04-01")
+    fetch(21.26, 79.31, "outage")
+    fetch(21.26, 79.31, "outage")
+    assert calls == [(21.25, 79.0625, "2024-03-01"), (21.25, 79.0625, "2024-04-01"),
+                     (21.25, 79.0625, "outage"), (21.25, 79.0625, "outage")]
+    assert fetch.centre(21.49, 79.37) == (21.25, 79.0625)
+    assert fetch.lookup(21.3, 79.2, "2024-04-01") == {"temperature": 25.0}
+    cache.clear()
+
+
+def test_async_cached_reads_the_store_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / "cache.sqlite3")
+    store = feature_cache._DiskStore(path, maintenance_interval=3600)
+    cache = feature_cache.caches["soil"]
+    monkeypatch.setattr(cache, "disk", store)
+    cache.clear()
+
+    @feature_cache.cached("soil")
+    async def fetch(lat, lon):
+        raise AssertionError("the stored value should answer")
+
+    cache_key = ":".join(map(str, feature_cache.snap(21.0, 79.0, cache.lat_res, cache.lon_res)[0]))
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        # Another worker is writing; a disk hit's access-time update waits on the busy timeout
+        store.put("soil", cache_key, {"pH": 6.5}, time.time() + 60)
+        conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        conn.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.3, lambda: conn.execute("COMMIT")).start()
+        value = await fetch(21.0, 79.0)
+        ticker.cancel()
+        return value, ticks
+
+    value, ticks = asyncio.run(scenario())
+    assert value == {"pH": 6.5}
+    assert ticks >= 10
+    assert cache.disk_hits >= 1
+    cache.clear()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+import feature_engine
+import quota
+
+TIMEOUTS = {"fast": 1.0, "slow": 0.1, "broken": 1.0, "empty": 1.0}
+
+
+def test_gather_reports_each_source_outcome():
+    release = threading.Event()
+
+    def broken():
+        raise ConnectionError("refused")
+
+    def slow():
+        release.wait(5)
+        return "late"
+
+    result = feature_engine.gather({
+        "fast": lambda: {"pH": 7},
+        "slow": slow,
+        "broken": broken,
+        "empty": lambda: None,
+    }, timeouts=TIMEOUTS)
+    release.set()
+
+    assert result.values == {"fast": {"pH": 7}, "empty": None}
+    assert result.degraded == {"slow": "timeout", "broken": "error", "empty": "unavailable"}
+    assert result.elapsed["slow"] == pytest.approx(0.1, abs=0.05)
+
+
+def test_gather_runs_sources_concurrently():
+    sources = {name: (lambda name=name: time.sleep(0.2) or name) for name in ("ndvi", "soil", "weather")}
+    started = time.monotonic()
+    result = feature_engine.gather(sources, timeouts=dict.fromkeys(sources, 1.0))
+    assert time.monotonic() - started < 0.5
+    assert result.values == {name: name for name in sources}
+
+
+def test_overall_deadline_caps_every_source():
+    release = threading.Event()
+    sources = {name: (lambda: release.wait(5)) for name in ("ndvi", "soil")}
+    started = time.monotonic()
+    result = feature_engine.gather(sources, deadline=feature_engine.deadline_from_now(0.15),
+                                   timeouts=dict.fromkeys(sources, 5.0))
+    release.set()
+    assert time.monotonic() - started < 0.4
+    assert result.degraded == {"ndvi": "timeout", "soil": "timeout"}
+
+
+def test_sources_wait_for_quota_no_longer_than_their_limit():
+    seen = {}
+
+    def soil():
+        seen["deadline"] = quota._deadline.get()
+        return 1
+
+    started = time.monotonic()
+    feature_engine.gather({"soil": soil}, timeouts={"soil": 0.5})
+    assert seen["deadline"] == pytest.approx(started + 0.5, abs=0.05)
+
+
+def test_bulk_gathers_run_on_their_own_pool():
+    def pool():
+        return threading.current_thread().name.rsplit("_", 1)[0]
+
+    assert feature_engine.gather({"soil": pool}).get("soil") == "features"
+    with quota.lane(quota.BULK):
+        assert feature_engine.gather({"soil": pool}).get("soil") == "features-bulk"
+
+
+def test_gather_async_reports_and_cancels():
+    cancelled = []
+
+    async def fast():
+        return {"pH": 7}
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def broken():
+        raise ConnectionError("refused")
+
+    async def empty():
+        return None
+
+    async def scenario():
+        result = await feature_engine.gather_async(
+            {"fast": fast, "slow": slow, "broken": broken, "empty": empty}, timeouts=TIMEOUTS)
+        await asyncio.sleep(0)
+        return result
+
+    result = asyncio.run(scenario())
+    assert result.values == {"fast": {"pH": 7}, "empty": None}
+    assert result.degraded == {"slow": "timeout", "broken": "error", "empty": "unavailable"}
+    assert cancelled == [True]
+
+
+def test_gather_async_honours_the_overall_deadline():
+    async def slow():
+        await asyncio.sleep(5)
+
+    async def scenario():
+        started = time.monotonic()
+        result = await feature_engine.gather_async({"ndvi": slow, "soil": slow},
+                                                   deadline=feature_engine.deadline_from_now(0.1),
+                                                   timeouts={"ndvi": 5.0, "soil": 5.0})
+        return result, time.monotonic() - started
+
+    result, elapsed = asyncio.run(scenario())
+    assert elapsed < 0.3
+    assert result.degraded == {"ndvi": "timeout", "soil": "timeout"}
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+import feature_tiles
+
+BBOX = (20.0, 22.0, 78.0, 80.0)
+
+
+@pytest.fixture
+def stem(tmp_path, monkeypatch):
+    stem = str(tmp_path / "tiles")
+    monkeypatch.setenv("FEATURE_TILES", stem)
+    monkeypatch.setattr(feature_tiles, "CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(feature_tiles, "_tiles", None)
+    monkeypatch.setattr(feature_tiles, "_signature", None)
+    monkeypatch.setattr(feature_tiles, "_checked_at", -np.inf)
+    return stem
+
+
+def test_lookup_many_matches_lookup(stem):
+    feature_tiles.write_tiles(stem, feature_tiles.synthetic_grid(BBOX, 0.5), BBOX, 0.5)
+    tiles = feature_tiles.FeatureTiles.open(stem)
+    lats, lons = [20.1, 21.9, 25.0], [78.1, 79.7, 78.5]
+    values, inside = tiles.lookup_many(lats, lons)
+    assert inside.tolist() == [True, True, False]
+    for i in range(2):
+        assert list(tiles.lookup(lats[i], lons[i]).values()) == pytest.approx(values[i].tolist())
+    assert tiles.lookup(25.0, 78.5) is None
+
+
+def test_rebuilt_tiles_are_reopened(stem):
+    grid = feature_tiles.synthetic_grid(BBOX, 0.5)
+    feature_tiles.write_tiles(stem, grid, BBOX, 0.5, failed_cells=0)
+    first = feature_tiles.get_tiles()
+    assert first.meta["failed_cells"] == 0
+    assert feature_tiles.get_tiles() is first
+
+    feature_tiles.write_tiles(stem, grid + 1, BBOX, 0.5, failed_cells=3)
+    # Some filesystems keep whole-second mtimes; the size alone may not differ either
+    os.utime(f"{stem}.json", ns=(0, os.stat(f"{stem}.json").st_mtime_ns + 10**9))
+    second = feature_tiles.get_tiles()
+    assert second is not first
+    assert second.meta["failed_cells"] == 3
+    assert second.lookup(20.1, 78.1)["Soil pH"] == pytest.approx(first.lookup(20.1, 78.1)["Soil pH"] + 1)
+
+
+def test_missing_tiles_keep_serving_the_last_set(stem):
+    feature_tiles.write_tiles(stem, feature_tiles.synthetic_grid(BBOX, 0.5), BBOX, 0.5)
+    tiles = feature_tiles.get_tiles()
+    os.remove(f"{stem}.json")
+    assert feature_tiles.get_tiles() is tiles
@@ -0,0 +1,45 @@
+import re
+
+import feature_cache
+import metrics
+import microbatch
+import upstream
+
+
+def families(text):
+    """``{family: (kind, [sample names])}`` from exposition text."""
+    found = {}
+    for line in text.splitlines():
+        match = re.match(r"# TYPE (\S+) (\S+)", line)
+        if match:
+            family = match.group(1)
+            found[family] = (match.group(2), [])
+        elif line and not line.startswith("#"):
+            found[family][1].append(re.match(r"[^{ ]+", line).group(0))
+    return found
+
+
+def test_counters_are_declared_without_the_total_suffix():
+    metrics.FALLBACKS.inc(kind="test")
+    rendered = families(metrics.render())
+    assert "agrovision_fallbacks" in rendered
+    assert "agrovision_cache_hits" in rendered
+    assert "agrovision_upstream_requests" in rendered
+    assert "agrovision_microbatch_overflows" in rendered
+    for family, (kind, samples) in rendered.items():
+        if kind == "counter":
+            assert not family.endswith("_total"), family
+            assert all(sample == f"{family}_total" for sample in samples), family
+
+
+def test_histogram_buckets_are_cumulative(monkeypatch):
+    # Register on a copy so the test histogram is not rendered by later tests
+    monkeypatch.setattr(metrics, "_metrics", list(metrics._metrics))
+    histogram = metrics.Histogram("agrovision_test_seconds", "Test.", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="a")
+    samples = {(name, labels.get("le")): value for name, labels, value in histogram.samples()}
+    assert samples[("agrovision_test_seconds_bucket", "0.1")] == 1
+    assert samples[("agrovision_test_seconds_bucket", "1.0")] == 2
+    assert samples[("agrovision_test_seconds_bucket", "+Inf")] == 3
+    assert samples[("agrovision_test_seconds_count", None)] == 3
@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import microbatch
+import model_registry
+
+
+class FakeModel:
+    def __init__(self, model_id):
+        self.id = model_id
+        self.calls = []
+
+    def predict_proba(self, X):
+        self.calls.append(len(X))
+        return np.column_stack([X[:, 0], 1 - X[:, 0]])
+
+
+class FakeRegistry:
+    def __init__(self):
+        self.ids = set()
+
+    def served(self):
+        return set(self.ids)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = FakeRegistry()
+    monkeypatch.setattr(model_registry, "registry", registry)
+    monkeypatch.setattr(microbatch, "_batchers", {})
+    return registry
+
+
+def test_concurrent_rows_share_predictions():
+    model = FakeModel("m:1")
+    batcher = microbatch.MicroBatcher(model.predict_proba, max_batch=64, max_wait=0.05)
+    rows = [[i / 100] for i in range(32)]
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        results = list(pool.map(lambda row: batcher.submit(row).result(timeout=5), rows))
+    assert [r[0] for r in results] == pytest.approx([row[0] for row in rows])
+    assert sum(model.calls) == 32
+    assert len(model.calls) < 32
+    batcher.stop()
+
+
+def test_stop_finishes_queued_rows_and_refuses_new_ones():
+    model = FakeModel("m:1")
+    release = threading.Event()
+
+    def slow(X):
+        release.wait(5)
+        return model.predict_proba(X)
+
+    batcher = microbatch.MicroBatcher(slow, max_batch=1, max_wait=0)
+    futures = [batcher.submit([0.25]) for _ in range(3)]
+    batcher.stop()
+    assert batcher.submit([0.5]) is None
+    release.set()
+    assert [f.result(timeout=5)[0] for f in futures] == [0.25] * 3
+    batcher._thread.join(timeout=5)
+    assert not batcher._thread.is_alive()
+
+
+def test_reload_retires_the_old_versions_batcher(registry):
+    old, new = FakeModel("m:1"), FakeModel("m:2")
+    registry.ids = {old.id}
+    old_batcher = microbatch.batcher_for(old)
+    assert old_batcher.submit([0.1]).result(timeout=5)[0] == pytest.approx(0.1)
+
+    registry.ids = {new.id}
+    microbatch.batcher_for(new)
+    assert list(microbatch.stats()["batchers"]) == [new.id]
+    assert old_batcher.stopped
+    old_batcher._thread.join(timeout=5)
+    assert not old_batcher._thread.is_alive()
@@ -0,0 +1,44 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.naive_bayes import GaussianNB
+
+import feature_schema
+import model_registry
+
+
+@pytest.fixture
+def estimator():
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(60, len(feature_schema.DEFAULT_COLUMNS)))
+    return GaussianNB().fit(X, np.repeat(["rice", "maize", "jute"], 20))
+
+
+def test_newest_version_and_pinned_versions(tmp_path, estimator):
+    for version in ("20260101T000000", "20260201T000000"):
+        joblib.dump(estimator, tmp_path / f"NaiveBayes@{version}.pkl")
+    registry = model_registry.ModelRegistry([str(tmp_path)], default="NaiveBayes", check_interval=0)
+    assert registry.get().id == "NaiveBayes:20260201T000000"
+    assert registry.get("NaiveBayes:20260101T000000").version == "20260101T000000"
+    with pytest.raises(model_registry.UnknownModelError):
+        registry.get("NaiveBayes:19990101T000000")
+
+
+def test_rescan_swaps_in_a_new_slot_table(tmp_path, estimator):
+    # Requests iterate the slot table without the lock, so a rescan must never mutate it in place
+    joblib.dump(estimator, tmp_path / "NaiveBayes@1.pkl")
+    registry = model_registry.ModelRegistry([str(tmp_path)], default="NaiveBayes", check_interval=0)
+    model = registry.get()
+    before = registry._slots
+    snapshot = dict(before)
+
+    joblib.dump(estimator, tmp_path / "NaiveBayes@2.pkl")
+    os.remove(tmp_path / "NaiveBayes@1.pkl")
+    registry._scan(force=True)
+
+    assert before == snapshot
+    assert registry._slots is not before
+    assert registry.get().version == "2"
+    assert before[("NaiveBayes", "1")].model is model
@@ -0,0 +1,79 @@
+import pytest
+
+import ndvi
+
+
+class Expr:
+    """Any Earth Engine object: every method chains, and getInfo() is the one round trip."""
+
+    def __init__(self, ee):
+        self._ee = ee
+
+    def __getattr__(self, name):
+        return Expr(self._ee)
+
+    def __call__(self, *args, **kwargs):
+        return Expr(self._ee)
+
+    def getInfo(self):
+        self._ee.round_trips += 1
+        return self._ee.results.pop(0)
+
+
+class FakeEE:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.round_trips = 0
+
+    def __getattr__(self, name):
+        return Expr(self)
+
+
+def earth_engine(*results, batch_size=500):
+    backend = ndvi.EarthEngineBackend.__new__(ndvi.EarthEngineBackend)
+    backend.ee = FakeEE(*results)
+    backend.batch_size = batch_size
+    return backend
+
+
+def test_point_is_a_single_round_trip():
+    backend = earth_engine(5234, None)
+    assert backend.point(20.5, 78.9, "2024-03-01") == 0.5234
+    assert backend.ee.round_trips == 1
+    # No composite in the window: still one call, and no value
+    assert backend.point(20.5, 78.9, "1990-01-01") is None
+    assert backend.ee.round_trips == 2
+
+
+def test_points_reduce_each_batch_in_one_round_trip():
+    def info(*means):
+        return {"features": [{"properties": {"i": i, "mean": mean}} for i, mean in enumerate(means)]}
+
+    # The second batch has a masked pixel, the third no composite at all
+    backend = earth_engine(info(1000, 2000), info(3000, None), {"features": []}, batch_size=2)
+    coords = [(20.0 + i, 78.0) for i in range(5)]
+    assert backend.points(coords, "2024-03-01") == [0.1, 0.2, 0.3, None, None]
+    assert backend.ee.round_trips == 3
+
+
+def test_stub_is_deterministic_and_in_range():
+    stub = ndvi.StubBackend()
+    coords = [(8.0 + i * 0.37, 68.0 + i * 0.91) for i in range(40)]
+    values = stub.points(coords, "2024-03-01")
+    assert values == [stub.point(lat, lon, "2024-03-01") for lat, lon in coords]
+    assert all(0.05 <= value <= 0.85 for value in values)
+    assert len(set(values)) > 1
+
+
+def test_stub_failures_are_injectable():
+    with pytest.raises(RuntimeError):
+        ndvi.StubBackend(error_rate=1.0).point(20.5, 78.9, "2024-03-01")
+
+
+def test_get_backend_builds_the_configured_stub_once(monkeypatch):
+    monkeypatch.setattr(ndvi, "_backend", None)
+    monkeypatch.setenv("NDVI_BACKEND", "stub")
+    monkeypatch.setenv("NDVI_STUB_LATENCY", "0.01")
+    backend = ndvi.get_backend()
+    assert isinstance(backend, ndvi.StubBackend) and backend.latency == 0.01
+    assert ndvi.get_backend() is backend
@@ -0,0 +1,128 @@
+import datetime
+import os
+
+import pytest
+
+import ndvi
+import ndvi_store
+
+D = datetime.date
+TODAY = D(2024, 3, 1)
+# Composite expected to be out by TODAY: 2024-02-02 ended on 02-17, plus the publish lag
+LATEST = D(2024, 2, 2)
+CELL_A, CENTRE_A = (10, 20), (20.5, 78.9)
+CELL_B, CENTRE_B = (11, 20), (21.5, 78.9)
+
+
+class RecordingBackend(ndvi.NDVIBackend):
+    def __init__(self, value=0.5):
+        self.value = value
+        self.calls = []
+        self.down = False
+
+    def points(self, coords, date):
+        if self.down:
+            raise RuntimeError("Earth Engine down")
+        self.calls.append((date, list(coords)))
+        return [self.value for _ in coords]
+
+    def point(self, lat, lon, date):
+        return self.points([(lat, lon)], date)[0]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = RecordingBackend()
+    monkeypatch.setattr(ndvi, "_backend", backend)
+    return backend
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ndvi_store.NDVIStore(str(tmp_path / "ndvi.sqlite3"))
+
+
+def test_periods_follow_the_modis_calendar():
+    assert ndvi_store.period_start(D(2024, 3, 1)) == D(2024, 2, 18)
+    assert ndvi_store.next_period(D(2024, 2, 18)) == D(2024, 3, 5)
+    # The short last period of a year runs into 1 January
+    assert ndvi_store.next_period(D(2024, 12, 18)) == D(2025, 1, 1)
+    assert ndvi_store.latest_available(TODAY) == LATEST
+    assert ndvi_store.missing_periods(None, LATEST) == [LATEST]
+    assert ndvi_store.missing_periods(D(2024, 1, 1), LATEST) == [D(2024, 1, 17), LATEST]
+    assert ndvi_store.missing_periods(LATEST, LATEST) == []
+
+
+def test_missing_periods_are_capped_at_the_newest(monkeypatch):
+    monkeypatch.setattr(ndvi_store, "MAX_CATCHUP_PERIODS", 2)
+    assert ndvi_store.missing_periods(D(2023, 1, 1), LATEST) == [D(2024, 1, 17), LATEST]
+
+
+def test_refresh_fetches_only_missing_periods_one_call_each(store, backend):
+    store.touch(CELL_A, CENTRE_A)
+    store.touch(CELL_B, CENTRE_B)
+    store.put(D(2024, 1, 1), [CELL_A], [0.3])
+    refresher = ndvi_store.Refresher(store)
+
+    assert refresher.refresh(TODAY) == 3
+    assert backend.calls == [("2024-01-17", [CENTRE_A]), ("2024-02-02", [CENTRE_A, CENTRE_B])]
+    assert store.latest(CELL_A) == (0.5, LATEST)
+    # Nothing is due until the next composite
+    assert refresher.refresh(TODAY) == 0
+    assert len(backend.calls) == 2
+
+
+def test_empty_newest_period_is_retried_only_after_the_retry_delay(store, backend, monkeypatch):
+    store.touch(CELL_A, CENTRE_A)
+    store.put(LATEST, [CELL_A], [None])
+    refresher = ndvi_store.Refresher(store)
+    assert refresher.refresh(TODAY) == 0
+    monkeypatch.setattr(ndvi_store, "EMPTY_RETRY", -1)
+    assert refresher.refresh(TODAY) == 1
+    assert store.latest(CELL_A) == (0.5, LATEST)
+
+
+def test_a_failed_period_is_retried_next_run(store, backend):
+    store.touch(CELL_A, CENTRE_A)
+    backend.down = True
+    refresher = ndvi_store.Refresher(store)
+    assert refresher.refresh(TODAY) == 0 and refresher.errors == 1
+    backend.down = False
+    assert refresher.refresh(TODAY) == 1
+
+
+def test_lease_lets_one_refresher_run_at_a_time(store, backend):
+    store.touch(CELL_A, CENTRE_A)
+    # Another worker holds the lease
+    store._conn().execute("INSERT INTO ndvi_leases VALUES ('refresh', ?, ?)", (os.getpid() + 1, 2e9))
+    refresher = ndvi_store.Refresher(store)
+    assert refresher.refresh(TODAY) == 0 and backend.calls == []
+    # Only the owner may release it
+    store.release_lease("refresh")
+    assert not store.acquire_lease("refresh", 60)
+
+    # An expired lease is taken over
+    store._conn().execute("UPDATE ndvi_leases SET expires = 0")
+    assert refresher.refresh(TODAY) == 1
+    assert store.acquire_lease("refresh", 60)
+
+
+def test_current_reads_the_store_and_only_fetches_cold_cells(store, backend, monkeypatch):
+    refresher = ndvi_store.Refresher(store)
+    scheduled = []
+    monkeypatch.setattr(refresher, "schedule", lambda: scheduled.append(True))
+    monkeypatch.setattr(ndvi_store, "_store", store)
+    monkeypatch.setattr(ndvi_store, "_refresher", refresher)
+    lat, lon = 20.51, 78.91
+    cell, centre = ndvi_store.cell_of(lat, lon)
+    latest = ndvi_store.latest_available()
+
+    assert ndvi_store.current(lat, lon) == 0.5
+    assert backend.calls == [(latest.isoformat(), [centre])]
+    assert scheduled == []
+
+    # Stale: answered from the store at once, refreshed in the background
+    store._conn().execute("DELETE FROM ndvi_values")
+    store.put(D(2000, 1, 1), [cell], [0.7])
+    assert ndvi_store.current(lat, lon) == 0.7
+    assert len(backend.calls) == 1 and scheduled == [True]
@@ -0,0 +1,183 @@
+import asyncio
+import multiprocessing
+import sqlite3
+import threading
+import time
+
+import pytest
+
+import feature_engine
+import quota
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = quota._Store(str(tmp_path / "quota.sqlite3"))
+    monkeypatch.setattr(quota, "_store", store)
+    return store
+
+
+def test_lane_defaults_to_interactive_and_resets():
+    assert quota.current_lane() == quota.INTERACTIVE
+    with quota.lane(quota.BULK):
+        assert quota.current_lane() == quota.BULK
+    assert quota.current_lane() == quota.INTERACTIVE
+
+
+def test_unknown_lane_is_rejected():
+    with pytest.raises(ValueError):
+        with quota.lane("urgent"):
+            pass
+
+
+def test_unlimited_quota_never_waits(store):
+    assert quota.Quota("free", rate=0.0).acquire()
+
+
+def test_bulk_leaves_the_reserve_for_interactive(store):
+    bucket = quota.Quota("reserve", rate=0.001, burst=4)
+    assert bucket.reserve == 2
+    with quota.lane(quota.BULK), quota.deadline(time.monotonic()):
+        assert bucket.acquire()
+        assert bucket.acquire()
+        assert not bucket.acquire()
+    assert bucket.acquire()
+    assert bucket.acquire()
+    assert bucket.rejected == {quota.INTERACTIVE: 0, quota.BULK: 1}
+
+
+def test_bulk_yields_to_a_waiting_interactive_call(store):
+    bucket = quota.Quota("yield", rate=100.0, burst=4)
+    store.wait("yield", "other-worker", 5)
+    taken, _ = store.take("yield", bucket.rate, bucket.burst, bucket.reserve, yield_to_waiters=True)
+    assert not taken
+    store.done_waiting("yield", "other-worker")
+    taken, _ = store.take("yield", bucket.rate, bucket.burst, bucket.reserve, yield_to_waiters=True)
+    assert taken
+
+
+def test_caller_deadline_caps_the_lane_wait(store, monkeypatch):
+    monkeypatch.setitem(quota.MAX_WAIT, quota.BULK, 60.0)
+    bucket = quota.Quota("capped", rate=0.001, burst=1)
+    assert bucket.acquire()
+    started = time.monotonic()
+    with quota.lane(quota.BULK), quota.deadline(started + 0.2):
+        assert not bucket.acquire()
+    assert time.monotonic() - started < 1.0
+
+
+def test_throttled_drains_the_shared_bucket(store):
+    bucket = quota.Quota("drained", rate=1.0, burst=5)
+    bucket.throttled(retry_after=10)
+    assert store.tokens("drained", bucket.rate, bucket.burst) < 0
+
+
+def test_interactive_gather_succeeds_while_bulk_saturates_the_quota(store, monkeypatch):
+    monkeypatch.setitem(quota.MAX_WAIT, quota.BULK, 60.0)
+    bucket = quota.Quota("saturated", rate=0.5, burst=2)
+    timeouts = {"soil": 1.0}
+
+    def soil():
+        return bucket.acquire() or None
+
+    def bulk_batch():
+        with quota.lane(quota.BULK):
+            feature_engine.gather({"soil": soil}, timeouts=timeouts)
+
+    # Far more bulk lookups than the feature pool has threads, all short of tokens
+    batches = [threading.Thread(target=bulk_batch) for _ in range(40)]
+    for thread in batches:
+        thread.start()
+    time.sleep(0.2)
+
+    started = time.monotonic()
+    result = feature_engine.gather({"soil": soil}, timeouts=timeouts)
+    assert result.degraded == {}
+    assert result.get("soil") is True
+    assert time.monotonic() - started < 0.5
+
+    for thread in batches:
+        thread.join()
+    assert bucket.rejected[quota.BULK] > 0
+
+
+def locked(path, seconds):
+    """Hold the store's write lock from another connection for ``seconds``, as a busy worker would."""
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    timer = threading.Timer(seconds, lambda: conn.execute("COMMIT"))
+    timer.start()
+    return timer
+
+
+def test_acquire_async_keeps_the_event_loop_running_while_the_store_is_locked(store):
+    bucket = quota.Quota("contended", rate=100.0, burst=4)
+
+    async def scenario():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.ensure_future(tick())
+        locked(store.path, 0.3)
+        started = time.monotonic()
+        taken = await bucket.acquire_async()
+        ticker.cancel()
+        return taken, time.monotonic() - started, ticks
+
+    taken, waited, ticks = asyncio.run(scenario())
+    assert taken
+    assert waited >= 0.25
+    assert ticks >= 10
+
+
+def test_concurrent_acquire_async_never_overdraws_the_bucket(store, monkeypatch):
+    monkeypatch.setitem(quota.MAX_WAIT, quota.INTERACTIVE, 5.0)
+    bucket = quota.Quota("concurrent", rate=20.0, burst=2)
+
+    async def scenario():
+        started = time.monotonic()
+        granted = await asyncio.gather(*(bucket.acquire_async() for _ in range(10)))
+        return granted, time.monotonic() - started
+
+    granted, elapsed = asyncio.run(scenario())
+    assert all(granted)
+    assert bucket.granted[quota.INTERACTIVE] == 10
+    # Two from the burst, then one every 1/20 s
+    assert elapsed >= (10 - 2) / 20 - 0.05
+    assert store.tokens("concurrent", bucket.rate, bucket.burst) >= -1e-6
+
+
+def _interactive_in_another_process(path, results):
+    quota._store = quota._Store(path)
+    results.put(quota.Quota("cross", rate=0.5, burst=1).acquire())
+
+
+def test_bulk_yields_to_an_interactive_waiter_in_another_process(store, monkeypatch):
+    monkeypatch.setitem(quota.MAX_WAIT, quota.INTERACTIVE, 1.0)
+    bucket = quota.Quota("cross", rate=0.5, burst=1)
+    assert bucket.reserve == 0
+    bucket.throttled()
+
+    context = multiprocessing.get_context("fork")
+    results = context.Queue()
+    worker = context.Process(target=_interactive_in_another_process, args=(store.path, results))
+    worker.start()
+    deadline = time.monotonic() + 5
+    while store.waiting("cross") == 0:
+        assert time.monotonic() < deadline, "the other process never started waiting"
+        time.sleep(0.01)
+
+    # A token is free, but the other process's interactive call is waiting for it
+    store._conn().execute("UPDATE quota_buckets SET tokens = 1, updated = ? WHERE upstream = 'cross'", (time.time(),))
+    with quota.lane(quota.BULK), quota.deadline(time.monotonic() + 0.2):
+        assert not bucket.acquire()
+    assert store.tokens("cross", bucket.rate, bucket.burst) >= 1
+
+    assert results.get(timeout=5) is True
+    worker.join(timeout=5)
+    assert store.waiting("cross") == 0
@@ -0,0 +1,33 @@
+import pytest
+from starlette.testclient import TestClient
+
+import api_main
+import asgi_main
+import recommendation
+
+BAD_POINTS = [("nan", "78"), ("20", "inf"), ("-inf", "78"), ("1e309", "78"), ("95", "78"), ("20", "-180.5"), ("", "78")]
+
+
+def test_parse_query_accepts_points_on_the_globe():
+    assert recommendation.parse_query({"lat": "-90", "lon": "180", "k": "5"}) == (-90.0, 180.0, 5)
+    assert recommendation.parse_query({"lat": "21.1", "lon": "79.0"}) == (21.1, 79.0, 3)
+
+
+@pytest.mark.parametrize("lat, lon", BAD_POINTS)
+def test_parse_query_rejects_unusable_coordinates(lat, lon):
+    with pytest.raises(ValueError, match="^Invalid latitude or longitude$"):
+        recommendation.parse_query({"lat": lat, "lon": lon})
+
+
+@pytest.mark.parametrize("lat, lon", BAD_POINTS[:5])
+def test_both_entry_points_answer_400_before_any_lookup(lat, lon, monkeypatch):
+    def unexpected(*args, **kwargs):
+        raise AssertionError("looked up an invalid point")
+
+    monkeypatch.setattr(api_main, "predict_point", unexpected)
+    monkeypatch.setattr(asgi_main, "predict_point_async", unexpected)
+    query = {"lat": lat, "lon": lon}
+    flask_response = api_main.create_app(preload=False).test_client().get("/get-top-3-crops", query_string=query)
+    asgi_response = TestClient(asgi_main.create_app()).get("/get-top-3-crops", params=query)
+    assert (flask_response.status_code, flask_response.get_json()) == (400, {"error": "Invalid latitude or longitude"})
+    assert (asgi_response.status_code, asgi_response.json()) == (400, {"error": "Invalid latitude or longitude"})
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+import recommendation_tiles
+
+BBOX = (20.0, 22.0, 78.0, 80.0)
+
+
+@pytest.fixture
+def stem(tmp_path, monkeypatch):
+    stem = str(tmp_path / "recommendations")
+    monkeypatch.setenv("RECOMMENDATION_TILES", stem)
+    monkeypatch.setattr(recommendation_tiles, "CHECK_INTERVAL", 0.0)
+    monkeypatch.setattr(recommendation_tiles, "_grid", None)
+    monkeypatch.setattr(recommendation_tiles, "_signature", None)
+    monkeypatch.setattr(recommendation_tiles, "_checked_at", -np.inf)
+    return stem
+
+
+def write(stem, best, model):
+    crops = np.full((1, 8, 8), best, dtype=np.uint8)
+    proba = np.full((1, 8, 8), 200, dtype=np.uint8)
+    recommendation_tiles.write_grid(stem, crops, proba, BBOX, 0.25, ["maize", "rice"], model, "test")
+
+
+def test_rebuilt_grid_is_reopened(stem):
+    write(stem, 0, "NaiveBayes:1")
+    first = recommendation_tiles.get_grid()
+    assert recommendation_tiles.get_grid() is first
+    tile = json.loads(first.render(6, 45, 28, "json"))
+
+    write(stem, 1, "NaiveBayes:2")
+    # Some filesystems keep whole-second mtimes; the size alone may not differ either
+    os.utime(f"{stem}.json", ns=(0, os.stat(f"{stem}.json").st_mtime_ns + 10**9))
+    second = recommendation_tiles.get_grid()
+    assert second is not first
+    assert second.meta["model"] == "NaiveBayes:2"
+    rebuilt = json.loads(second.render(6, 45, 28, "json"))
+    assert rebuilt["grid_version"] != tile["grid_version"]
+    assert {c for row in rebuilt["crops"][0] for c in row} == {1}
+
+
+def test_missing_grid_keeps_serving_the_last_one(stem):
+    write(stem, 0, "NaiveBayes:1")
+    grid = recommendation_tiles.get_grid()
+    os.remove(f"{stem}.json")
+    assert recommendation_tiles.get_grid() is grid
+
+
+def test_builder_does_not_build_the_api():
+    code = "import sys, build_recommendation_tiles; print('api_main' in sys.modules, 'flask' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                         cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    assert out.stdout.split() == ["False", "False"]
@@ -0,0 +1,48 @@
+import importlib.util
+import sys
+
+import pytest
+
+import score_fields
+
+
+def test_parquet_without_pyarrow_is_refused_up_front(monkeypatch, tmp_path, capsys):
+    monkeypatch.setattr(importlib.util, "find_spec", lambda name: None)
+    monkeypatch.setattr(sys, "argv", ["score_fields.py", str(tmp_path / "fields.csv"),
+                                      "--out", str(tmp_path / "scored.parquet")])
+    with pytest.raises(SystemExit) as exited:
+        score_fields.main()
+    assert exited.value.code == 2
+    assert "pip install pyarrow" in capsys.readouterr().err
+    assert not (tmp_path / "scored.parquet").exists()
+
+
+def test_parquet_output_keeps_the_first_chunk_types(monkeypatch, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    fields = tmp_path / "fields.csv"
+    # The second chunk's blank field_id makes read_csv infer float64 there, int64 in the first
+    fields.write_text("field_id,N,ph,temperature,humidity,rainfall\n"
+                      "1,90,6.5,21,82,203\n"
+                      "2,40,7,25,60,100\n"
+                      ",60,5.5,30,70,150\n"
+                      "4,20,6,18,90,250\n")
+    out = tmp_path / "scored.parquet"
+    monkeypatch.setattr(sys, "argv", ["score_fields.py", str(fields), "--out", str(out),
+                                      "--model", "NaiveBayes", "--chunk", "2", "--workers", "0"])
+    score_fields.main()
+
+    table = pq.read_table(out)
+    assert str(table.schema.field("field_id").type) == "int64"
+    assert table.column("field_id").to_pylist() == [1, 2, None, 4]
+    assert table.column("crop_1").null_count == 0
+
+
+def test_parquet_chunk_that_cannot_take_the_first_types_is_refused(tmp_path):
+    pytest.importorskip("pyarrow")
+    import pandas as pd
+
+    writer = score_fields.Writer(str(tmp_path / "scored.parquet"))
+    writer.write(pd.DataFrame({"field_id": [1, 2]}))
+    with pytest.raises(ValueError, match="first chunk's column types"):
+        writer.write(pd.DataFrame({"field_id": [2.5, 3.0]}))
+    writer.close()
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+import similar_samples
+
+COLUMNS = ("Soil pH", "Rainfall (mm)")
+
+
+def write_samples(path, rows):
+    with open(path, "w") as f:
+        f.write("ph,rainfall,label\n")
+        for ph, rainfall, label in rows:
+            f.write(f"{ph},{rainfall},{label}\n")
+
+
+def test_columns_are_standardized_before_measuring_distance():
+    # Rainfall spans hundreds of mm, pH a few units: unscaled, rainfall alone would decide
+    samples = [[5.0, 100.0], [8.0, 110.0], [5.1, 300.0], [8.0, 300.0]]
+    index = similar_samples.SimilarityIndex(COLUMNS, samples, ["a", "b", "c", "d"], "digest")
+    nearest = index.neighbours([[5.0, 120.0]], 1)[0][0]
+    assert nearest["crop"] == "a"
+    assert nearest == {"crop": "a", "distance": nearest["distance"], "Soil pH": 5.0, "Rainfall (mm)": 100.0}
+    assert index.neighbours([[7.9, 120.0]], 1)[0][0]["crop"] == "b"
+
+
+def test_kd_tree_matches_a_brute_force_scan():
+    rng = np.random.default_rng(3)
+    samples = rng.normal([6.5, 100.0, 25.0], [0.8, 60.0, 5.0], size=(500, 3))
+    index = similar_samples.SimilarityIndex(("a", "b", "c"), samples, np.arange(500), "digest")
+    queries = rng.normal([6.5, 100.0, 25.0], [0.8, 60.0, 5.0], size=(20, 3))
+    distances, indices = index.query(queries, 5)
+
+    standardized = (samples - samples.mean(axis=0)) / samples.std(axis=0)
+    for query, found in zip((queries - samples.mean(axis=0)) / samples.std(axis=0), indices):
+        expected = np.argsort(np.linalg.norm(standardized - query, axis=1))[:5]
+        assert list(found) == list(expected)
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+
+def test_constant_column_does_not_divide_by_zero():
+    index = similar_samples.SimilarityIndex(COLUMNS, [[6.0, 100.0], [6.0, 200.0]], ["a", "b"], "digest")
+    assert index.neighbours([[6.0, 190.0]], 5)[0][0]["crop"] == "b"
+    # k is capped at the number of samples
+    assert len(index.neighbours([[6.0, 190.0]], 5)[0]) == 2
+
+
+def test_saved_index_is_reused_until_the_data_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(similar_samples, "INDEX_DIR", str(tmp_path))
+    data = tmp_path / "samples.csv"
+    write_samples(data, [(6.0, 100, "rice"), (7.0, 50, "maize"), ("", 80, "skipped")])
+    paths = [str(data)]
+
+    built, path = similar_samples.build(COLUMNS, paths)
+    assert len(built.samples) == 2 and path.startswith(str(tmp_path))
+    loaded = similar_samples.load(COLUMNS, paths)
+    assert loaded.digest == built.digest
+    assert loaded.neighbours([[6.9, 55]], 1)[0][0]["crop"] == "maize"
+    assert similar_samples.load(("Soil pH",), paths) is None
+
+    write_samples(data, [(6.0, 100, "rice"), (7.0, 50, "maize"), (5.0, 200, "jute")])
+    assert similar_samples.load(COLUMNS, paths) is None
+
+
+def test_parse_similar_bounds():
+    assert similar_samples.parse_similar({}) == 0
+    assert similar_samples.parse_similar({"similar": "3"}) == 3
+    for bad in ("x", "-1", str(similar_samples.MAX_SIMILAR + 1)):
+        with pytest.raises(ValueError):
+            similar_samples.parse_similar({"similar": bad})
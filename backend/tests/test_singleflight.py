@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import singleflight
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def test_concurrent_calls_for_one_key_share_one_call():
+    group = singleflight.Group()
+    release, calls = threading.Event(), []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"pH": 7}
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(group.do, "cell", fetch)]
+        wait_until(lambda: group.in_flight() > 0)
+        futures += [pool.submit(group.do, "cell", fetch) for _ in range(7)]
+        wait_until(lambda: group.followers == 7)
+        release.set()
+        results = [future.result(timeout=5) for future in futures]
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert (group.leaders, group.followers, group.in_flight()) == (1, 7, 0)
+
+
+def test_followers_get_the_leaders_exception_and_the_key_is_freed():
+    group = singleflight.Group()
+    started, release = threading.Event(), threading.Event()
+
+    def fail():
+        started.set()
+        release.wait(5)
+        raise TimeoutError("upstream")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        leader = pool.submit(group.do, "cell", fail)
+        started.wait(5)
+        follower = pool.submit(group.do, "cell", lambda: "not called")
+        wait_until(lambda: group.followers == 1)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(TimeoutError):
+                future.result(timeout=5)
+
+    assert group.do("cell", lambda: "fresh") == "fresh"
+
+
+def test_distinct_keys_do_not_wait_on_each_other():
+    group = singleflight.Group()
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        slow = pool.submit(group.do, "a", lambda: release.wait(5))
+        wait_until(lambda: group.in_flight() > 0)
+        assert group.do("b", lambda: 2) == 2
+        release.set()
+        assert slow.result(timeout=5) is True
+
+
+def test_async_group_coalesces_and_survives_a_cancelled_caller():
+    group = singleflight.AsyncGroup()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 42
+
+    async def scenario():
+        impatient = asyncio.ensure_future(group.do("cell", fetch))
+        waiting = [asyncio.ensure_future(group.do("cell", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert group.in_flight() == 1
+        impatient.cancel()
+        results = await asyncio.gather(*waiting)
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return results
+
+    assert asyncio.run(scenario()) == [42, 42, 42]
+    assert len(calls) == 1
+    assert (group.leaders, group.followers, group.in_flight()) == (1, 3, 0)
+
+
+def test_async_group_shares_exceptions():
+    group = singleflight.AsyncGroup()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("bad payload")
+
+    async def scenario():
+        return await asyncio.gather(group.do("cell", fail), group.do("cell", fail), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+    assert group.leaders == 1
@@ -0,0 +1,72 @@
+import asyncio
+from urllib.parse import parse_qsl, urlsplit
+
+import soil_client
+import upstream
+
+
+def layer(name, **means):
+    return {"name": name, "depths": [{"label": label, "values": {"mean": mean}} for label, mean in means.items()]}
+
+
+RESPONSE = {"properties": {"layers": [
+    layer("phh2o", **{"0-5cm": 65, "5-15cm": 68}),
+    layer("nitrogen", **{"0-5cm": 123, "5-15cm": None}),
+    layer("bdod", **{"0-5cm": 132}),
+    layer("clay", **{"0-5cm": 250}),
+]}}
+
+
+def test_query_asks_for_every_property_and_depth_at_once():
+    url = soil_client.build_query_url(20.5, 78.9, ("phh2o", "nitrogen", "bdod"), ("0-5cm", "5-15cm"))
+    params = parse_qsl(urlsplit(url).query)
+    assert urlsplit(url).path.endswith(soil_client.QUERY_PATH)
+    assert [v for k, v in params if k == "property"] == ["phh2o", "nitrogen", "bdod"]
+    assert [v for k, v in params if k == "depth"] == ["0-5cm", "5-15cm"]
+    assert ("lat", "20.5") in params and ("lon", "78.9") in params and ("value", "mean") in params
+
+
+def test_parse_scales_each_property_and_leaves_gaps_as_none():
+    soil = soil_client.parse_response(RESPONSE, 20.5, 78.9, ("phh2o", "nitrogen", "bdod", "soc"), ("0-5cm", "5-15cm"))
+    assert soil.ph == 6.5
+    assert soil.nitrogen == 12.3
+    assert soil.get("phh2o", "5-15cm") == 6.8
+    assert soil.get("bdod") == 1.32
+    # Null mean, property absent from the response, and a layer nobody asked for
+    assert soil.get("nitrogen", "5-15cm") is None
+    assert soil.get("soc") is None and ("soc", "0-5cm") in soil.values
+    assert soil.get("clay") is None and ("clay", "0-5cm") not in soil.values
+
+
+def test_parse_of_an_empty_response_keeps_every_cell():
+    soil = soil_client.parse_response({}, 1.0, 2.0)
+    assert soil.values == {("phh2o", "0-5cm"): None, ("nitrogen", "0-5cm"): None}
+    assert (soil.lat, soil.lon) == (1.0, 2.0)
+
+
+def test_fetch_is_one_round_trip_and_none_on_failure(monkeypatch):
+    urls = []
+
+    def get_json(url, **_):
+        urls.append(url)
+        return RESPONSE
+
+    monkeypatch.setattr(upstream.soilgrids, "get_json", get_json)
+    soil = soil_client.fetch_soil_properties(20.5, 78.9)
+    assert len(urls) == 1
+    assert (soil.ph, soil.nitrogen) == (6.5, 12.3)
+
+    def fail(url, **_):
+        raise upstream.UpstreamError("down")
+
+    monkeypatch.setattr(upstream.soilgrids, "get_json", fail)
+    assert soil_client.fetch_soil_properties(20.5, 78.9) is None
+
+
+def test_async_fetch_parses_the_same_way(monkeypatch):
+    async def aget_json(url, **_):
+        return RESPONSE
+
+    monkeypatch.setattr(upstream.soilgrids, "aget_json", aget_json)
+    soil = asyncio.run(soil_client.fetch_soil_properties_async(20.5, 78.9))
+    assert (soil.ph, soil.nitrogen) == (6.5, 12.3)
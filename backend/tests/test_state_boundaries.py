@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import api_main
+import build_state_boundaries
+import feature_engine
+import state_boundaries
+from state_defaults import soil_default_values
+
+
+def square(lon, lat, size=1.0):
+    return [[lon, lat], [lon + size, lat], [lon + size, lat + size], [lon, lat + size], [lon, lat]]
+
+
+def feature(name, *rings, **properties):
+    return {
+        "type": "Feature",
+        "properties": {"name": name, **properties},
+        "geometry": {"type": "MultiPolygon", "coordinates": [[ring] for ring in rings]},
+    }
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    path = tmp_path / "states.geojson"
+    path.write_text(json.dumps({"type": "FeatureCollection", "features": [
+        feature("Jammu & Kashmir", square(74, 33, 4), includes=["Ladakh"]),
+        feature("Punjab", square(74, 30, 2)),
+        feature("Gujarat", square(70, 20, 3), enclaves={"Daman": [[72.78, 20.34, 72.96, 20.5]]}),
+    ]}))
+    index = state_boundaries.StateIndex.load(str(path))
+    monkeypatch.setattr(state_boundaries, "_index", index)
+    return index
+
+
+def test_shared_polygon_defers_to_the_geocoder(index):
+    assert index.lookup(34.5, 76.5) == "Jammu & Kashmir"
+    assert state_boundaries.ambiguous("Jammu & Kashmir", 34.5, 76.5)
+    assert not state_boundaries.ambiguous("Punjab", 31.0, 75.0)
+    assert state_boundaries.settle("Jammu & Kashmir", "Ladakh", 34.5, 76.5) == "Ladakh"
+    # OpenCage spells the bundled name differently, and may fail outright
+    assert state_boundaries.settle("Jammu & Kashmir", "Jammu and Kashmir", 34.5, 76.5) == "Jammu & Kashmir"
+    assert state_boundaries.settle("Jammu & Kashmir", "State not found", 34.5, 76.5) == "Jammu & Kashmir"
+    assert state_boundaries.settle(None, "Lakshadweep", 10.5, 72.6) == "Lakshadweep"
+
+
+def test_enclave_boxes_defer_to_the_geocoder_only_inside_them(index):
+    assert index.lookup(20.4, 72.83) == "Gujarat"
+    assert state_boundaries.ambiguous("Gujarat", 20.4, 72.83)
+    assert state_boundaries.settle("Gujarat", "Daman", 20.4, 72.83) == "Daman"
+    assert not state_boundaries.ambiguous("Gujarat", 21.5, 71.0)
+    assert state_boundaries.settle("Gujarat", "Daman", 21.5, 71.0) == "Gujarat"
+
+
+def test_check_coverage_lists_names_without_a_polygon(index, caplog):
+    missing = state_boundaries.check_coverage(["Punjab", "Ladakh", "Lakshadweep"])
+    assert missing == ["Ladakh", "Lakshadweep"]
+    assert "Ladakh (inside Jammu & Kashmir)" in caplog.text
+
+
+def test_bundled_boundaries_report_their_gaps():
+    bundled = state_boundaries.StateIndex.load()
+    assert bundled.missing(soil_default_values) == ["Ladakh", "Lakshadweep"]
+    assert bundled.includes == {"Jammu & Kashmir": ("Ladakh",)}
+    assert bundled.lookup(34.15, 77.58) == "Jammu & Kashmir"  # Leh
+    assert bundled.alternatives("Jammu & Kashmir", 34.15, 77.58) == ("Ladakh",)
+
+
+@pytest.mark.parametrize("lat, lon", [(20.3974, 72.8328), (20.7144, 70.9874)], ids=["Daman", "Diu"])
+def test_bundled_gujarat_defers_daman_and_diu(lat, lon, monkeypatch):
+    bundled = state_boundaries.StateIndex.load()
+    monkeypatch.setattr(state_boundaries, "_index", bundled)
+    monkeypatch.setattr(api_main, "STATE_OPENCAGE_FALLBACK", True)
+    territory = "Dadra and Nagar Haveli and Daman and Diu"
+    assert bundled.lookup(lat, lon) == "Gujarat"
+    degraded = {}
+    assert api_main.default_state(lat, lon, "key", degraded) == ("Gujarat", True)
+    assert degraded == {"soil": "partial"}
+    geocoded = feature_engine.gather({"state": lambda: territory})
+    assert api_main.settle_state("Gujarat", geocoded, degraded, lat, lon) == territory
+    # Ahmedabad stays offline
+    assert not api_main.wants_opencage("Gujarat", "key", 23.02, 72.57)
+
+
+def test_convert_maps_names_and_joins_split_territories():
+    source = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "properties": {"shapeName": "Daman and Diu"},
+         "geometry": {"type": "Polygon", "coordinates": [square(72.8, 20.4, 0.1)]}},
+        {"type": "Feature", "properties": {"shapeName": "Dadra & Nagar Haveli"},
+         "geometry": {"type": "Polygon", "coordinates": [square(73.0, 20.1, 0.2)]}},
+        {"type": "Feature", "properties": {"shapeName": "Orissa"},
+         "geometry": {"type": "Polygon", "coordinates": [square(84, 20, 2), square(84.0001, 20.0001, 0.0001)]}},
+        {"type": "Feature", "properties": {"shapeName": "Atlantis"},
+         "geometry": {"type": "Polygon", "coordinates": [square(0, 0)]}},
+    ]}
+    collection, unmatched = build_state_boundaries.convert(source, soil_default_values)
+    assert unmatched == ["Atlantis"]
+    by_name = {f["properties"]["name"]: f for f in collection["features"]}
+    assert sorted(by_name) == ["Dadra and Nagar Haveli and Daman and Diu", "Odisha"]
+    assert len(by_name["Dadra and Nagar Haveli and Daman and Diu"]["geometry"]["coordinates"]) == 2
+    # The hole collapses on the 1/1024 degree grid and is dropped
+    assert len(by_name["Odisha"]["geometry"]["coordinates"][0]) == 1
+
+    index = state_boundaries.StateIndex([name for name in by_name],
+                                        [state_boundaries.polygon_edges(f["geometry"]) for f in by_name.values()])
+    assert index.lookup(20.45, 72.85) == "Dadra and Nagar Haveli and Daman and Diu"
+    assert index.lookup(21.0, 85.0) == "Odisha"
@@ -0,0 +1,65 @@
+import os
+
+import feature_schema
+import train_models
+
+
+def entry(accuracy, p50_ms):
+    return {"cv_accuracy": accuracy, "single_row_p50_ms": p50_ms}
+
+
+REPORT = {
+    "RandomForest": entry(0.99, 2.0),
+    "NaiveBayes": entry(0.985, 0.1),
+    "DecisionTree": entry(0.97, 0.05),
+}
+
+
+def test_select_takes_the_fastest_within_tolerance_of_the_best():
+    assert train_models.select(REPORT, tolerance=0.01) == "NaiveBayes"
+    assert train_models.select(REPORT, tolerance=0.0) == "RandomForest"
+    assert train_models.select(REPORT, tolerance=0.05) == "DecisionTree"
+
+
+def test_select_drops_candidates_over_the_latency_cap_before_ranking():
+    assert train_models.select(REPORT, tolerance=0.0, max_latency_ms=1.0) == "NaiveBayes"
+    assert train_models.select(REPORT, tolerance=0.0, max_latency_ms=0.01) is None
+
+
+def test_select_breaks_latency_ties_on_accuracy():
+    report = {"A": entry(0.98, 0.1), "B": entry(0.985, 0.1)}
+    assert train_models.select(report, tolerance=0.01) == "B"
+
+
+def test_cross_validation_is_reproducible_for_a_seed():
+    X, y = train_models.load_training_data(feature_schema.TRAINING_DATA, ("Soil pH", "Soil Nitrogen", "Rainfall (mm)"))
+    assert X.dtype.name == "float64" and X.shape == (len(y), 3)
+    names = ["NaiveBayes", "DecisionTree"]
+    first = train_models.cross_validate(names, X, y, folds=3, seed=7, jobs=2)
+    again = train_models.cross_validate(names, X, y, folds=3, seed=7, jobs=1)
+    for name in names:
+        assert first[name]["cv_accuracy"] == again[name]["cv_accuracy"]
+        assert first[name]["cv_accuracy_std"] == again[name]["cv_accuracy_std"]
+        assert 0.0 < first[name]["cv_accuracy"] <= 1.0
+
+
+def test_publish_moves_the_sidecar_before_the_artifact(tmp_path, monkeypatch):
+    staging, out = tmp_path / "staging", tmp_path / "models"
+    staging.mkdir()
+    out.mkdir()
+    staged = str(staging / "NaiveBayes@v1.pkl")
+    for path in (staged, feature_schema.schema_path(staged)):
+        with open(path, "w") as f:
+            f.write("{}")
+    moved = []
+    replace = os.replace
+
+    def recording_replace(src, dst):
+        moved.append(os.path.basename(dst))
+        replace(src, dst)
+
+    monkeypatch.setattr(train_models.os, "replace", recording_replace)
+    published = train_models.publish(staged, str(out))
+    assert published == str(out / "NaiveBayes@v1.pkl")
+    assert moved == ["NaiveBayes@v1.schema.json", "NaiveBayes@v1.pkl"]
+    assert sorted(os.listdir(out)) == ["NaiveBayes@v1.pkl", "NaiveBayes@v1.schema.json"]
@@ -0,0 +1,133 @@
+import time
+
+import pytest
+import requests
+
+import quota
+import upstream
+from upstream import CircuitBreaker
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"HTTP {self.status_code}", response=self)
+
+    def json(self):
+        return {"status": self.status_code}
+
+
+def make_upstream(monkeypatch, responses, **kwargs):
+    client = upstream.Upstream("test", base_url="http://upstream.invalid", retries=0, backoff=0,
+                               breaker_threshold=1, breaker_cooldown=0.05, **kwargs)
+    calls = iter(responses)
+
+    def get(url, **_):
+        outcome = next(calls)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(client.session, "get", get)
+    return client
+
+
+def test_breaker_opens_after_threshold_failures():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 1
+    assert not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(threshold=2, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_admits_one_probe_after_cooldown():
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+
+
+@pytest.mark.parametrize("outcome, state, trips", [
+    ("record_success", CircuitBreaker.CLOSED, 1),
+    ("record_failure", CircuitBreaker.OPEN, 2),
+    ("settle", CircuitBreaker.OPEN, 1),
+])
+def test_probe_outcomes(outcome, state, trips):
+    breaker = CircuitBreaker(threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    getattr(breaker, outcome)()
+    assert breaker.state == state
+    assert breaker.trips == trips
+
+
+def test_settle_leaves_a_closed_breaker_alone():
+    breaker = CircuitBreaker(threshold=1, cooldown=60)
+    breaker.settle()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_circuit_opens_and_rejects_calls(monkeypatch):
+    client = make_upstream(monkeypatch, [requests.ConnectionError("down")])
+    with pytest.raises(upstream.UpstreamError):
+        client.get("http://upstream.invalid/a")
+    assert client.breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(upstream.CircuitOpenError):
+        client.get("http://upstream.invalid/a")
+    assert client.rejected == 1
+
+
+def test_client_error_counts_as_success(monkeypatch):
+    client = make_upstream(monkeypatch, [FakeResponse(404)])
+    with pytest.raises(requests.HTTPError):
+        client.get("http://upstream.invalid/a")
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_without_outcome_does_not_stick_half_open(monkeypatch):
+    probe = requests.TooManyRedirects("loop")
+    client = make_upstream(monkeypatch, [requests.ConnectionError("down"), probe, FakeResponse(200)])
+    with pytest.raises(upstream.UpstreamError):
+        client.get("http://upstream.invalid/a")
+    time.sleep(0.06)
+
+    with pytest.raises(requests.TooManyRedirects):
+        client.get("http://upstream.invalid/a")
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    assert client.get_json("http://upstream.invalid/a") == {"status": 200}
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_quota_refused_probe_recovers(monkeypatch, tmp_path):
+    monkeypatch.setattr(quota, "_store", quota._Store(str(tmp_path / "quota.sqlite3")))
+    monkeypatch.setitem(quota.MAX_WAIT, quota.INTERACTIVE, 0.0)
+    client = make_upstream(monkeypatch, [requests.ConnectionError("down"), FakeResponse(200)], rate=0.001, burst=1)
+    with pytest.raises(upstream.UpstreamError):
+        client.get("http://upstream.invalid/a")
+    time.sleep(0.06)
+
+    with pytest.raises(upstream.QuotaExceededError):
+        client.get("http://upstream.invalid/a")
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    time.sleep(0.06)
+    monkeypatch.setattr(client.quota, "rate", 0.0)
+    assert client.get_json("http://upstream.invalid/a") == {"status": 200}
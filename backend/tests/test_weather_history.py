@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import weather_history
+
+BBOX = (20.0, 22.0, 78.0, 80.5)
+START = "2024-01-01"
+
+
+@pytest.fixture(scope="module")
+def history(tmp_path_factory):
+    stem = str(tmp_path_factory.mktemp("weather") / "history")
+    daily = weather_history.create(stem, BBOX, START, "2024-03-31")
+    rng = np.random.default_rng(0)
+    daily[:] = rng.normal(20.0, 5.0, daily.shape)
+    daily[rng.random(daily.shape) < 0.05] = np.nan
+    # One cell loses most of February
+    daily[:, 1, 2, 35:55] = np.nan
+    weather_history.publish(stem, daily, BBOX, START, source="test")
+    return weather_history.WeatherHistory.open(stem)
+
+
+def reference(history, lat, lon, start, end, min_coverage):
+    """Window means the slow way: one cell, one window, plain NaN-aware NumPy."""
+    row = int(np.floor((lat - history.lat_min) / history.lat_resolution))
+    col = int(np.floor((lon - history.lon_min) / history.lon_resolution))
+    first = int((np.datetime64(start) - history.start).astype(int))
+    last = int((np.datetime64(end) - history.start).astype(int))
+    if not (0 <= row < history.rows and 0 <= col < history.cols) or first < 0 or last >= history.days or last < first:
+        return np.full(len(history.variables), np.nan)
+    values = np.asarray(history.daily[:, row, col, first:last + 1], dtype=np.float64)
+    present = ~np.isnan(values)
+    means = np.nanmean(np.where(present, values, np.nan), axis=1)
+    means[present.sum(axis=1) / (last - first + 1) < min_coverage] = np.nan
+    return means
+
+
+POINTS = [(20.1, 78.1), (20.6, 78.7), (21.9, 80.4), (20.75, 79.3), (19.0, 78.5), (21.0, 81.0)]
+
+
+def test_shared_window_matches_reference(history):
+    lats, lons = zip(*POINTS)
+    means = history.window_means(lats, lons, "2024-02-01", "2024-02-29")
+    expected = [reference(history, lat, lon, "2024-02-01", "2024-02-29", weather_history.MIN_COVERAGE)
+                for lat, lon in POINTS]
+    np.testing.assert_allclose(means, expected, rtol=1e-6)
+    # The cell missing most of February and the two points off the grid
+    assert np.isnan(means[[3, 4, 5]]).all()
+    assert not np.isnan(means[:3]).any()
+
+
+def test_per_point_windows_match_reference(history):
+    lats, lons = zip(*POINTS)
+    starts = ["2024-01-01", "2024-01-20", "2024-03-01", "2024-02-10", "2024-01-01", "2023-12-25"]
+    ends = ["2024-01-01", "2024-03-31", "2024-03-15", "2024-02-12", "2024-01-31", "2024-01-05"]
+    for min_coverage in (0.0, 0.8, 1.0):
+        means = history.window_means(lats, lons, starts, ends, min_coverage=min_coverage)
+        expected = [reference(history, lat, lon, start, end, min_coverage)
+                    for (lat, lon), start, end in zip(POINTS, starts, ends)]
+        np.testing.assert_allclose(means, expected, rtol=1e-6)
+
+
+def test_blocked_reduction_matches_one_pass(history, monkeypatch):
+    rng = np.random.default_rng(1)
+    lats = rng.uniform(19.5, 22.5, 200)
+    lons = rng.uniform(77.5, 81.0, 200)
+    starts = np.datetime64(START) + rng.integers(0, 60, 200)
+    ends = starts + rng.integers(0, 30, 200)
+    whole = history.window_means(lats, lons, starts, ends)
+    monkeypatch.setattr(weather_history, "BLOCK_VALUES", 64)
+    np.testing.assert_array_equal(history.window_means(lats, lons, starts, ends), whole)
+
+
+def test_window_scales_rainfall_like_the_climatology(history):
+    lat, lon = POINTS[0]
+    weather = history.window(lat, lon, "2024-01-01", "2024-01-31")
+    t2m, rh2m, precip = reference(history, lat, lon, "2024-01-01", "2024-01-31", weather_history.MIN_COVERAGE)
+    assert weather == pytest.approx({"temperature": t2m, "humidity": rh2m, "rainfall": precip * 30})
+    assert history.window(*POINTS[4], "2024-01-01", "2024-01-31") is None
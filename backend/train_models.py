@@ -0,0 +1,254 @@
+"""Train, compare and publish crop models from Crop_recommendation.csv.
+
+    python train_models.py --out models
+    python train_models.py --out models --candidates NaiveBayes RandomForest --folds 5 --all
+
+The scripted form of crop_recommendation_main.ipynb. Every (candidate, fold)
+pair of a stratified k-fold split is one task on a joblib process pool, so
+folds and models train in parallel across ``--jobs`` cores. Each candidate
+is then refit on the full data set and loaded back through model_registry
+the way the service loads it, to measure:
+
+- single-row ``predict_proba`` latency (p50 and p99), the per-request cost
+- batch latency per row over ``--batch-rows`` rows, the tile and bulk-scoring cost
+- artifact size on disk
+
+The selected model is the fastest at single-row latency among candidates
+within ``--tolerance`` of the best mean CV accuracy, and under
+``--max-latency-ms`` if set. It is published as ``<out>/<name>@<version>.pkl``
+with a ``.schema.json`` sidecar that records the columns, the scores, the
+seed and a digest of the training data. The sidecar is written first and
+each file is renamed into place, so a registry watching ``<out>`` never
+loads a partial artifact. Splits and estimators take ``--seed``, so a rerun
+on the same data reproduces the same scores.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+import sklearn
+from joblib import Parallel, delayed
+from sklearn.model_selection import StratifiedKFold
+
+import feature_schema
+import model_registry
+
+
+def _lightgbm(seed):
+    import lightgbm as lgb
+
+    return lgb.LGBMClassifier(random_state=seed, n_jobs=1, verbose=-1)
+
+
+def _candidates():
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
+    # The notebook's settings; n_jobs=1 because the pool already uses every core
+    return {
+        "DecisionTree": lambda seed: DecisionTreeClassifier(random_state=seed),
+        "NaiveBayes": lambda seed: GaussianNB(),
+        "SVM": lambda seed: SVC(probability=True, random_state=seed),
+        "LogisticRegression": lambda seed: LogisticRegression(max_iter=1000),
+        "RandomForest": lambda seed: RandomForestClassifier(n_estimators=20, random_state=seed, n_jobs=1),
+        "KNN": lambda seed: KNeighborsClassifier(n_neighbors=5),
+        "LightGBM": _lightgbm,
+    }
+
+
+CANDIDATES = tuple(_candidates())
+
+
+def make_estimator(name, seed):
+    return _candidates()[name](seed)
+
+
+def available(names):
+    """The candidates whose libraries import, logging the ones skipped."""
+    usable = []
+    for name in names:
+        try:
+            make_estimator(name, 0)
+        except ImportError as e:
+            logging.warning(f"Skipping {name}: {e}")
+            continue
+        usable.append(name)
+    return usable
+
+
+def load_training_data(path, columns):
+    """``(X, y)`` with X in ``columns`` order, as float64 like the service's record matrix."""
+    training_names = {field: name for name, field in feature_schema.TRAINING_COLUMNS.items()}
+    frame = pd.read_csv(path)
+    X = frame[[training_names[column] for column in columns]].to_numpy(np.float64)
+    return X, frame["label"].to_numpy()
+
+
+def _fold_score(name, seed, X, y, train, test):
+    estimator = make_estimator(name, seed)
+    started = time.perf_counter()
+    estimator.fit(X[train], y[train])
+    fit_seconds = time.perf_counter() - started
+    return name, float(np.mean(estimator.predict(X[test]) == y[test])), fit_seconds
+
+
+def _fit(name, seed, X, y):
+    return name, make_estimator(name, seed).fit(X, y)
+
+
+def cross_validate(names, X, y, folds, seed, jobs):
+    """Mean and std accuracy and mean fit time per candidate, every fold in parallel."""
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(X, y))
+    results = Parallel(n_jobs=jobs)(
+        delayed(_fold_score)(name, seed, X, y, train, test) for name in names for train, test in splits
+    )
+    scores = {}
+    for name in names:
+        accuracy = np.array([a for n, a, _ in results if n == name])
+        fit_seconds = np.array([s for n, _, s in results if n == name])
+        scores[name] = {
+            "cv_accuracy": round(float(accuracy.mean()), 4),
+            "cv_accuracy_std": round(float(accuracy.std()), 4),
+            "fit_seconds": round(float(fit_seconds.mean()), 4),
+        }
+    return scores
+
+
+def measure_latency(model, X, repeats, batch_rows):
+    """Single-row p50/p99 in ms and batch cost per row in µs, through the service's model path."""
+    rows = X[np.arange(repeats) % len(X)]
+    model.predict_proba(rows[:1])  # warm up
+    single = np.empty(repeats)
+    for i in range(repeats):
+        row = rows[i:i + 1]
+        started = time.perf_counter()
+        model.predict_proba(row)
+        single[i] = time.perf_counter() - started
+    batch = X[np.arange(batch_rows) % len(X)]
+    started = time.perf_counter()
+    model.predict_proba(batch)
+    batch_seconds = time.perf_counter() - started
+    return {
+        "single_row_p50_ms": round(float(np.percentile(single, 50)) * 1e3, 4),
+        "single_row_p99_ms": round(float(np.percentile(single, 99)) * 1e3, 4),
+        "batch_row_us": round(batch_seconds / batch_rows * 1e6, 4),
+    }
+
+
+def select(report, tolerance, max_latency_ms=None):
+    """The fastest candidate within ``tolerance`` of the best accuracy; None if none qualifies."""
+    eligible = {
+        name: entry for name, entry in report.items()
+        if max_latency_ms is None or entry["single_row_p50_ms"] <= max_latency_ms
+    }
+    if not eligible:
+        return None
+    best = max(entry["cv_accuracy"] for entry in eligible.values())
+    close = [name for name, entry in eligible.items() if entry["cv_accuracy"] >= best - tolerance]
+    return min(close, key=lambda name: (eligible[name]["single_row_p50_ms"], -eligible[name]["cv_accuracy"]))
+
+
+def publish(staged, out_dir):
+    """Rename a staged artifact and its sidecar into ``out_dir``, sidecar first."""
+    sidecar = feature_schema.schema_path(staged)
+    published = os.path.join(out_dir, os.path.basename(staged))
+    os.replace(sidecar, feature_schema.schema_path(published))
+    os.replace(staged, published)
+    return published
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train and compare crop models, and publish a versioned artifact.")
+    parser.add_argument("--data", default=feature_schema.TRAINING_DATA, help="Training CSV")
+    parser.add_argument("--out", default="models", help="Directory for the artifacts (one of MODEL_DIRS)")
+    parser.add_argument("--candidates", nargs="+", choices=CANDIDATES, default=list(CANDIDATES),
+                        help="Models to compare")
+    parser.add_argument("--folds", type=int, default=10, help="Cross-validation folds")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for the splits and estimators")
+    parser.add_argument("--jobs", type=int, default=-1, help="Parallel fit processes; -1 uses every core")
+    parser.add_argument("--tolerance", type=float, default=0.005,
+                        help="Accuracy given up for a faster model when selecting")
+    parser.add_argument("--max-latency-ms", type=float, help="Reject models slower than this per single row")
+    parser.add_argument("--repeats", type=int, default=500, help="Single-row predictions timed per model")
+    parser.add_argument("--batch-rows", type=int, default=100000, help="Rows in the timed batch")
+    parser.add_argument("--version", help="Artifact version (default: UTC timestamp)")
+    parser.add_argument("--all", action="store_true", help="Publish every candidate, not just the selected one")
+    parser.add_argument("--report", help="Also write the comparison as JSON to this path")
+    args = parser.parse_args()
+    if args.folds < 2:
+        parser.error("--folds must be at least 2")
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    version = args.version or datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+    columns = feature_schema.DEFAULT_COLUMNS
+    X, y = load_training_data(args.data, columns)
+    names = available(args.candidates)
+    if not names:
+        parser.error("None of the candidates can be imported")
+    provenance = {
+        "data": os.path.basename(args.data),
+        "data_digest": model_registry.file_digest(args.data),
+        "rows": len(X),
+        "seed": args.seed,
+        "folds": args.folds,
+        "sklearn": sklearn.__version__,
+    }
+
+    started = time.monotonic()
+    logging.info(f"Cross-validating {len(names)} models x {args.folds} folds on {len(X)} rows")
+    report = cross_validate(names, X, y, args.folds, args.seed, args.jobs)
+    logging.info(f"Cross-validation took {time.monotonic() - started:.1f}s; refitting on all rows")
+    fitted = dict(Parallel(n_jobs=args.jobs)(delayed(_fit)(name, args.seed, X, y) for name in names))
+
+    os.makedirs(args.out, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=args.out, prefix=".staging-") as staging:
+        staged = {}
+        for name in names:
+            path = os.path.join(staging, f"{name}@{version}.pkl")
+            feature_schema.write_schema(path, columns, model=name, version=version, **report[name], **provenance)
+            joblib.dump(fitted[name], path)
+            # Measure the artifact as the service would load and run it
+            model = model_registry.LoadedModel(name, version, path, joblib.load(path), None, model_registry.COMPILE)
+            report[name]["artifact_bytes"] = os.path.getsize(path)
+            report[name]["compiled"] = model.compiled is not None
+            report[name].update(measure_latency(model, X, args.repeats, args.batch_rows))
+            feature_schema.write_schema(path, columns, model=name, version=version, **report[name], **provenance)
+            staged[name] = path
+
+        selected = select(report, args.tolerance, args.max_latency_ms)
+        print(f"{'model':<20}{'cv acc':>10}{'± std':>8}{'fit s':>8}{'p50 ms':>9}{'p99 ms':>9}{'batch µs':>10}{'KiB':>9}")
+        for name in sorted(report, key=lambda n: -report[n]["cv_accuracy"]):
+            entry = report[name]
+            print(f"{name + (' *' if name == selected else ''):<20}{entry['cv_accuracy']:>10.4f}"
+                  f"{entry['cv_accuracy_std']:>8.4f}{entry['fit_seconds']:>8.3f}{entry['single_row_p50_ms']:>9.3f}"
+                  f"{entry['single_row_p99_ms']:>9.3f}{entry['batch_row_us']:>10.3f}{entry['artifact_bytes'] / 1024:>9.1f}")
+
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"version": version, "selected": selected, **provenance, "models": report}, f, indent=2)
+
+        if selected is None:
+            print(f"❌ No model is under {args.max_latency_ms} ms per row; nothing published")
+            raise SystemExit(1)
+        for name in names if args.all else [selected]:
+            published = publish(staged[name], args.out)
+            logging.info(f"Published {published}")
+
+    print(f"✅ Selected {selected}:{version} (cv accuracy {report[selected]['cv_accuracy']:.4f}, "
+          f"{report[selected]['single_row_p50_ms']:.3f} ms per row) in {time.monotonic() - started:.1f}s "
+          f"-> {args.out}; serve it with MODEL_NAME={selected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+"""Shared HTTP client for the external data providers.
+
+Each upstream gets its own keep-alive ``requests.Session`` with a bounded
+connection pool, explicit connect/read timeouts, jittered exponential retries
+on 429/5xx and connection errors, and a circuit breaker. While a breaker is
+open calls fail immediately with ``CircuitOpenError`` so callers drop straight
+into their fallback path (state-wise soil defaults, "State not found", ...)
+instead of waiting on a provider that is down.
+
+Every attempt also takes a token from the upstream's shared quota (see
+quota.py), so workers together stay under the provider's rate limit, and
+interactive calls go ahead of bulk ones when tokens are short.
+
+Base URLs come from ``<PREFIX>_BASE_URL`` (e.g. SOILGRIDS_BASE_URL), so the
+service can be pointed at bench/fake_upstreams.py and run offline.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import quota
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Connections per upstream for the async client, which holds far more requests in flight
+ASYNC_POOL_SIZE = int(os.getenv("UPSTREAM_ASYNC_POOL_SIZE", "100"))
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class QuotaExceededError(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after ``threshold`` consecutive failures, probes again after ``cooldown``."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, threshold=5, cooldown=30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+                # Let a single probe through; its outcome decides the next state
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def settle(self):
+        """End an admitted call; a probe that recorded no outcome reopens for another cooldown."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class Upstream:
+    def __init__(self, name, base_url="", connect_timeout=3.05, read_timeout=10.0, retries=2,
+                 backoff=0.25, backoff_cap=2.0, pool_size=16,
+                 breaker_threshold=5, breaker_cooldown=30.0, rate=0.0, burst=1):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self.quota = quota.Quota(name, rate, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._aclient = None
+        self._aclient_loop = None
+        self.requests = 0
+        self.retried = 0
+        self.failures = 0
+        self.rejected = 0
+
+    def url(self, path):
+        return f"{self.base_url}{path}"
+
+    def _retry_after(self, response):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        return float(retry_after) if retry_after and retry_after.isdigit() else None
+
+    def _retry_delay(self, attempt, response=None):
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt))
+        retry_after = self._retry_after(response)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_cap))
+        return delay
+
+    def _quota_refused(self):
+        return QuotaExceededError(f"{self.name} quota exhausted for {quota.current_lane()} calls")
+
+    def _throttled(self, response):
+        # The provider's own limit overrides ours: stop every worker until it refills
+        if response.status_code == 429:
+            self.quota.throttled(self._retry_after(response))
+
+    @contextlib.contextmanager
+    def _admitted(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        try:
+            yield
+        finally:
+            # A quota refusal or an error outside the retry policy leaves no
+            # outcome; without this a half-open probe would never be replaced
+            self.breaker.settle()
+
+    def _give_up(self, error):
+        self.failures += 1
+        self.breaker.record_failure()
+        if self.breaker.state == CircuitBreaker.OPEN:
+            logging.warning(f"Upstream '{self.name}' circuit is open after: {error}")
+        if isinstance(error, UpstreamError):
+            return error
+        return UpstreamError(f"{self.name} request failed: {error}")
+
+    @contextlib.contextmanager
+    def _observed(self):
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        except CircuitOpenError:
+            outcome = "rejected"
+            raise
+        except QuotaExceededError:
+            outcome = "throttled"
+            raise
+        finally:
+            metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - started, upstream=self.name, outcome=outcome)
+
+    def get(self, url, **kwargs):
+        """GET ``url`` with retries; raises UpstreamError or CircuitOpenError."""
+        with self._observed(), self._admitted():
+            kwargs.setdefault("timeout", self.timeout)
+            for attempt in range(self.retries + 1):
+                if not self.quota.acquire():
+                    raise self._quota_refused()
+                self.requests += 1
+                response = None
+                try:
+                    response = self.session.get(url, **kwargs)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        # Other 4xx responses are the caller's problem, not an outage
+                        self.breaker.record_success()
+                        response.raise_for_status()
+                        return response
+                    self._throttled(response)
+                    error = UpstreamError(f"{self.name} returned HTTP {response.status_code}")
+
+                if attempt < self.retries:
+                    self.retried += 1
+                    time.sleep(self._retry_delay(attempt, response))
+
+            raise self._give_up(error)
+
+    def get_json(self, url, **kwargs):
+        return self.get(url, **kwargs).json()
+
+    def _async_client(self):
+        # httpx is only needed by the ASGI entry point. A client is bound to the
+        # event loop it was created on, so each loop gets its own.
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._aclient is None or self._aclient_loop is not loop:
+            connect, read = self.timeout
+            self._aclient = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=ASYNC_POOL_SIZE, max_keepalive_connections=ASYNC_POOL_SIZE),
+            )
+            self._aclient_loop = loop
+        return self._aclient
+
+    async def aget(self, url, **kwargs):
+        """Async twin of ``get`` sharing its breaker, retry policy and counters."""
+        import httpx
+
+        with self._observed(), self._admitted():
+            client = self._async_client()
+            for attempt in range(self.retries + 1):
+                if not await self.quota.acquire_async():
+                    raise self._quota_refused()
+                self.requests += 1
+                response = None
+                try:
+                    response = await client.get(url, **kwargs)
+                except httpx.TransportError as e:
+                    error = e
+                else:
+                    if response.status_code not in RETRY_STATUSES:
+                        self.breaker.record_success()
+                        response.raise_for_status()
+                        return response
+                    if response.status_code == 429:
+                        await asyncio.to_thread(self._throttled, response)
+                    error = UpstreamError(f"{self.name} returned HTTP {response.status_code}")
+
+                if attempt < self.retries:
+                    self.retried += 1
+                    await asyncio.sleep(self._retry_delay(attempt, response))
+
+            raise self._give_up(error)
+
+    async def aget_json(self, url, **kwargs):
+        return (await self.aget(url, **kwargs)).json()
+
+    def status(self):
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "trips": self.breaker.trips,
+            "requests": self.requests,
+            "retries": self.retried,
+            "failures": self.failures,
+            "rejected_while_open": self.rejected,
+            "quota": self.quota.status(),
+        }
+
+
+def _from_env(name, prefix, base_url, **defaults):
+    env = lambda key, default: type(default)(os.getenv(f"{prefix}_{key}", default))
+    return Upstream(
+        name,
+        base_url=env("BASE_URL", base_url),
+        connect_timeout=env("CONNECT_TIMEOUT", defaults.get("connect_timeout", 3.05)),
+        read_timeout=env("READ_TIMEOUT", defaults.get("read_timeout", 10.0)),
+        retries=env("RETRIES", defaults.get("retries", 2)),
+        breaker_threshold=env("BREAKER_THRESHOLD", 5),
+        breaker_cooldown=env("BREAKER_COOLDOWN", 30.0),
+        # Requests per second shared by all workers; 0 leaves the upstream unlimited
+        rate=env("RATE", defaults.get("rate", 0.0)),
+        burst=env("BURST", defaults.get("burst", 1)),
+    )
+
+
+# SoilGrids' fair-use policy is 5 requests a minute; OpenCage's free tier 1 a second
+soilgrids = _from_env("soilgrids", "SOILGRIDS", "https://rest.isric.org/soilgrids/v2.0", read_timeout=10.0,
+                      rate=5 / 60, burst=5)
+nasa_power = _from_env("nasa_power", "NASA_POWER", "https://power.larc.nasa.gov", read_timeout=15.0)
+opencage = _from_env("opencage", "OPENCAGE", "https://api.opencagedata.com", read_timeout=5.0, retries=1,
+                     rate=1.0, burst=1)
+
+upstreams = {u.name: u for u in (soilgrids, nasa_power, opencage)}
+
+
+def status():
+    return {name: u.status() for name, u in upstreams.items()}
+
+
+@metrics.register_collector
+def _collect():
+    counters = [
+        ("requests", "HTTP attempts sent, retries included."),
+        ("retries", "Attempts that were retried."),
+        ("failures", "Calls that failed after exhausting retries."),
+        ("rejected_while_open", "Calls refused while the circuit breaker was open."),
+        ("trips", "Times the circuit breaker opened."),
+    ]
+    snapshot = status()
+    families = [
+        (f"agrovision_upstream_{key}", "counter", help,
+         [({"upstream": name}, values[key]) for name, values in snapshot.items()])
+        for key, help in counters
+    ]
+    families.append(("agrovision_upstream_circuit_open", "gauge", "1 while the circuit breaker is open or half open.",
+                     [({"upstream": name}, int(values["circuit"] != CircuitBreaker.CLOSED))
+                      for name, values in snapshot.items()]))
+    quotas = {name: values["quota"] for name, values in snapshot.items() if values["quota"]["limited"]}
+    for key, help in (("granted", "Calls given a quota token, by lane."),
+                      ("rejected", "Calls refused after waiting their lane's limit for a quota token.")):
+        families.append((f"agrovision_upstream_quota_{key}", "counter", help,
+                         [({"upstream": name, "lane": lane}, count)
+                          for name, values in quotas.items() for lane, count in values[key].items()]))
+    families.append(("agrovision_upstream_quota_tokens", "gauge", "Tokens left in the shared quota bucket.",
+                     [({"upstream": name}, values["tokens"])
+                      for name, values in quotas.items() if values["tokens"] is not None]))
+    families.append(("agrovision_upstream_quota_interactive_waiting", "gauge",
+                     "Interactive calls waiting for a quota token, across workers.",
+                     [({"upstream": name}, values["interactive_waiting"])
+                      for name, values in quotas.items() if values["interactive_waiting"] is not None]))
+    return families
@@ -0,0 +1,260 @@
+"""Daily weather history on the NASA POWER grid, served from memory-mapped ``.npy``.
+
+A history is two files sharing a stem. ``<stem>.npy`` holds a float32
+array of shape ``(variables, rows, cols, days)``: daily T2M, RH2M and
+PRECTOTCORR for every grid cell, with NaN for missing days. ``<stem>.json``
+holds the bounding box, cell size, first day and variable names. Days are
+the last axis, so one cell's window is a contiguous read.
+build_weather_history.py fills it from the NASA POWER daily point API.
+
+A date-window query reduces the days of each point's cell with NumPy, for
+one point or a whole batch at once. The result is the weather record a
+season-specific recommendation uses in place of the annual climatology:
+mean temperature, mean humidity, and mean daily rainfall times 30. The
+rainfall is the same 30-day scale the climatology path gives the model. A
+window with less than WEATHER_HISTORY_MIN_COVERAGE of its days present
+answers None instead of a mean of a few days.
+"""
+import datetime
+import json
+import logging
+import math
+import os
+
+import numpy as np
+
+import upstream
+
+FORMAT_VERSION = 1
+
+VARIABLES = ("T2M", "RH2M", "PRECTOTCORR")
+# NASA POWER's fill value for days it has no data for
+FILL_VALUE = -999.0
+# The NASA POWER (MERRA-2) grid, as in feature_cache's "weather" source
+LAT_RESOLUTION = 0.5
+LON_RESOLUTION = 0.625
+MIN_COVERAGE = float(os.getenv("WEATHER_HISTORY_MIN_COVERAGE", "0.8"))
+# Longest window one request may ask for
+MAX_WINDOW_DAYS = int(os.getenv("WEATHER_HISTORY_MAX_WINDOW_DAYS", "366"))
+# Points x days reduced per block, bounding the working set of a large batch
+BLOCK_VALUES = 1 << 22
+
+
+def to_days(dates):
+    """Dates (``date``, ISO strings or datetime64) as a ``datetime64[D]`` array."""
+    return np.asarray(dates, dtype="datetime64[D]")
+
+
+class WeatherHistory:
+    def __init__(self, daily, meta):
+        self.daily = daily
+        self.meta = meta
+        self.variables = tuple(meta["variables"])
+        self.lat_min, self.lat_max, self.lon_min, self.lon_max = meta["bbox"]
+        self.lat_resolution = meta["lat_resolution"]
+        self.lon_resolution = meta["lon_resolution"]
+        self.start = np.datetime64(meta["start"], "D")
+        _, self.rows, self.cols, self.days = daily.shape
+        self.end = self.start + self.days - 1
+
+    @classmethod
+    def open(cls, stem):
+        with open(f"{stem}.json") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported weather history version in {stem}.json: {meta.get('version')}")
+        return cls(np.load(f"{stem}.npy", mmap_mode="r"), meta)
+
+    def cells(self, lats, lons):
+        """``(rows, cols, inside)`` for many points."""
+        rows = np.floor((np.asarray(lats, dtype=float) - self.lat_min) / self.lat_resolution).astype(np.int64)
+        cols = np.floor((np.asarray(lons, dtype=float) - self.lon_min) / self.lon_resolution).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        return rows, cols, inside
+
+    def covers(self, start, end):
+        return self.start <= to_days(start) and to_days(end) <= self.end
+
+    def window_means(self, lats, lons, starts, ends, min_coverage=MIN_COVERAGE):
+        """Per-point means of every variable over ``[start, end]``, both inclusive.
+
+        ``starts``/``ends`` are one window for all points or one per point.
+        Returns ``(n, len(variables))`` float64 with NaN for points off the
+        grid, days outside the history, or windows below ``min_coverage``.
+        """
+        rows, cols, inside = self.cells(lats, lons)
+        n = len(rows)
+        first = np.broadcast_to((to_days(starts) - self.start).astype(np.int64), (n,))
+        last = np.broadcast_to((to_days(ends) - self.start).astype(np.int64), (n,))
+        means = np.full((n, len(self.variables)), np.nan)
+        usable = np.flatnonzero(inside & (last >= first) & (first >= 0) & (last < self.days))
+        if not len(usable):
+            return means
+
+        lengths = last - first + 1
+        width = int(lengths[usable].max())
+        step = max(1, BLOCK_VALUES // width)
+        offsets = np.arange(width)
+        shared = np.ptp(first[usable]) == 0 and np.ptp(last[usable]) == 0
+        for block in np.array_split(usable, math.ceil(len(usable) / step)):
+            # (variables, points, width); one shared window is a contiguous slice per cell
+            if shared:
+                lo = int(first[block[0]])
+                values = self.daily[:, rows[block], cols[block], lo:lo + width]
+            else:
+                # Each point's own window, padded to the longest
+                days = np.minimum(first[block, None] + offsets, self.days - 1)
+                values = self.daily[:, rows[block, None], cols[block, None], days]
+            present = (offsets < lengths[block, None]) & ~np.isnan(values)
+            counts = present.sum(axis=2)
+            totals = np.where(present, values, 0.0).sum(axis=2, dtype=np.float64)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                block_means = totals / counts
+            block_means[counts / lengths[block] < min_coverage] = np.nan
+            means[block] = block_means.T
+        return means
+
+    def weather_matrix(self, lats, lons, starts, ends):
+        """``(n, 3)`` temperature, humidity and rainfall per point, as ``get_weather`` scales them."""
+        means = self.window_means(lats, lons, starts, ends)
+        index = {name: i for i, name in enumerate(self.variables)}
+        return np.stack([
+            means[:, index["T2M"]],
+            means[:, index["RH2M"]],
+            means[:, index["PRECTOTCORR"]] * 30,
+        ], axis=1)
+
+    def window(self, lat, lon, start, end):
+        """The weather dict for one point and window, or None if it cannot be answered."""
+        values = self.weather_matrix([lat], [lon], start, end)[0]
+        if np.isnan(values).any():
+            return None
+        return {"temperature": float(values[0]), "humidity": float(values[1]), "rainfall": float(values[2])}
+
+    def describe(self):
+        return {
+            "bbox": [self.lat_min, self.lat_max, self.lon_min, self.lon_max],
+            "lat_resolution": self.lat_resolution,
+            "lon_resolution": self.lon_resolution,
+            "start": str(self.start),
+            "end": str(self.end),
+            "variables": list(self.variables),
+            "shape": list(self.daily.shape),
+            "source": self.meta.get("source", "unknown"),
+        }
+
+
+def grid_shape(bbox, lat_resolution=LAT_RESOLUTION, lon_resolution=LON_RESOLUTION):
+    lat_min, lat_max, lon_min, lon_max = bbox
+    return math.ceil((lat_max - lat_min) / lat_resolution), math.ceil((lon_max - lon_min) / lon_resolution)
+
+
+def cell_centres(bbox, lat_resolution=LAT_RESOLUTION, lon_resolution=LON_RESOLUTION):
+    rows, cols = grid_shape(bbox, lat_resolution, lon_resolution)
+    lat_min, _, lon_min, _ = bbox
+    return (lat_min + (np.arange(rows) + 0.5) * lat_resolution,
+            lon_min + (np.arange(cols) + 0.5) * lon_resolution)
+
+
+def create(stem, bbox, start, end, lat_resolution=LAT_RESOLUTION, lon_resolution=LON_RESOLUTION):
+    """A NaN-filled writable daily array at ``<stem>.tmp.npy``, for ``publish`` once filled."""
+    os.makedirs(os.path.dirname(stem) or ".", exist_ok=True)
+    days = int((to_days(end) - to_days(start)).astype(np.int64)) + 1
+    if days < 1:
+        raise ValueError(f"Empty date range {start} to {end}")
+    daily = np.lib.format.open_memmap(
+        f"{stem}.tmp.npy", mode="w+", dtype=np.float32,
+        shape=(len(VARIABLES), *grid_shape(bbox, lat_resolution, lon_resolution), days),
+    )
+    daily[:] = np.nan
+    return daily
+
+
+def publish(stem, daily, bbox, start, lat_resolution=LAT_RESOLUTION, lon_resolution=LON_RESOLUTION,
+            source="unknown"):
+    """Flush a filled array from ``create`` and move it and its metadata into place."""
+    daily.flush()
+    with open(f"{stem}.json.tmp", "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "bbox": list(bbox),
+            "lat_resolution": lat_resolution,
+            "lon_resolution": lon_resolution,
+            "start": str(to_days(start)),
+            "variables": list(VARIABLES),
+            "source": source,
+        }, f, indent=2)
+    # A running service maps the old files until it reopens, never a half-written one
+    os.replace(f"{stem}.tmp.npy", f"{stem}.npy")
+    os.replace(f"{stem}.json.tmp", f"{stem}.json")
+
+
+def daily_url(lat, lon, start, end):
+    start, end = (str(to_days(day)).replace("-", "") for day in (start, end))
+    return (f"{upstream.nasa_power.url('/api/temporal/daily/point')}?parameters={','.join(VARIABLES)}"
+            f"&community=AG&longitude={lon}&latitude={lat}&start={start}&end={end}&format=JSON")
+
+
+def parse_daily(data, start, days):
+    """``(variables, days)`` float32 from a daily point response, NaN for missing or fill values."""
+    values = np.full((len(VARIABLES), days), np.nan, dtype=np.float32)
+    parameters = data.get("properties", {}).get("parameter", {})
+    first = to_days(start)
+    for i, name in enumerate(VARIABLES):
+        series = parameters.get(name) or {}
+        if not series:
+            continue
+        keys = np.array([f"{k[:4]}-{k[4:6]}-{k[6:8]}" for k in series], dtype="datetime64[D]")
+        offsets = (keys - first).astype(np.int64)
+        observed = np.array(list(series.values()), dtype=np.float32)
+        keep = (offsets >= 0) & (offsets < days) & (observed != FILL_VALUE)
+        values[i, offsets[keep]] = observed[keep]
+    return values
+
+
+def parse_window(args):
+    """``(start, end)`` dates from ``start``/``end`` query parameters, or None if neither is given.
+
+    Raises ValueError with a client-facing message for a malformed window or
+    one the configured history cannot answer.
+    """
+    start, end = args.get('start'), args.get('end')
+    if start is None and end is None:
+        return None
+    if start is None or end is None:
+        raise ValueError("start and end must be given together")
+    try:
+        start, end = datetime.date.fromisoformat(start), datetime.date.fromisoformat(end)
+    except ValueError:
+        raise ValueError("start and end must be dates as YYYY-MM-DD")
+    if end < start:
+        raise ValueError("end must not be before start")
+    if (end - start).days + 1 > MAX_WINDOW_DAYS:
+        raise ValueError(f"Weather windows are limited to {MAX_WINDOW_DAYS} days")
+    history = get_history()
+    if history is None:
+        raise ValueError("Weather history is not configured on this server")
+    if not history.covers(start, end):
+        raise ValueError(f"Weather history covers {history.start} to {history.end}")
+    return start, end
+
+
+_history = None
+_history_failed = False
+
+
+def get_history():
+    """The history named by WEATHER_HISTORY, opened once per process, or ``None``."""
+    global _history, _history_failed
+    stem = os.getenv("WEATHER_HISTORY")
+    if not stem or _history_failed:
+        return None
+    if _history is None:
+        try:
+            _history = WeatherHistory.open(stem)
+            logging.info(f"Loaded weather history {stem} ({_history.start} to {_history.end}, "
+                         f"{_history.rows}x{_history.cols} cells)")
+        except (OSError, ValueError) as e:
+            logging.error(f"Weather history disabled, cannot open {stem}: {e}")
+            _history_failed = True
+    return _history